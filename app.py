@@ -1,15 +1,24 @@
 import streamlit as st
-import replicate
-import requests
-import time
 import os
-import re
 from PIL import Image
-import tempfile
-import base64
-
-from dotenv import load_dotenv
-load_dotenv()
+import io
+import time
+import uuid
+
+from clients import get_client, resolve_model_ref
+from funcs import MODEL_VERSIONS, ASPECT_RATIOS, make_job
+from model_registry import get_model
+from output_index import get_output_index
+from prompt_store import SAVED_PROMPTS_PATH, get_prompt_store
+from result_cache import get_result_cache
+from retention import current_user, pin_checkbox
+from sweep import MAX_SWEEP_JOBS, describe, expand, parse_seeds, sweep_size, sweep_values, sweepable_params
+from input_prep import describe_upload, submit_upload
+from jobs import get_job_queue
+from navigation import EDIT_PAGE, VIDEO_PAGE, in_studio, send_image
+from startup import init_process
+
+init_process()
 
 # ******* For More Info on Flux.1 on Replicate ********
 #                                                     *
@@ -25,73 +34,145 @@ st.set_page_config(layout="wide", page_title="Flux.1.X and Qwen-Image in Streaml
 try:
 
 
-    # Initialize session state for prompt history and last saved image
-    if 'prompt_history' not in st.session_state:
-        st.session_state.prompt_history = []
+    HISTORY_PAGE_SIZE = 20
+    JOB_PANEL_SIZE = 20
+    JOB_POLL_SECONDS = 1
+
+    # Initialize session state for last saved image
     if 'last_saved_image' not in st.session_state:
         st.session_state.last_saved_image = None
     if 'current_image' not in st.session_state:
         st.session_state.current_image = None
+    if 'session_id' not in st.session_state:
+        # jobs in the (process wide) queue belong to this
+        st.session_state.session_id = uuid.uuid4().hex
+    if 'seen_jobs' not in st.session_state:
+        st.session_state.seen_jobs = set()
 
 
-    def wait_for_image(url, model_version, max_attempts=10, delay=2):
-        for attempt in range(max_attempts):
-            response = requests.head(url)
-            if response.status_code == 200:
-                return True
-            time.sleep(delay)
-        return False
-
-    def download_image(url, prompt):
-        if not os.path.exists('output'):
-            os.makedirs('output')
-        
-        timestamp = int(time.time())
-        clean_prompt = re.sub(r'[^a-zA-Z0-9 ]', '', prompt)
-        clean_prompt = clean_prompt.strip()[:30]
-        clean_prompt = clean_prompt.replace(' ', '_')
-        
-        
-        fileext = "png"
-        if model_version == "Qwen-Image":
-            fileext = "jpg"
-
-
-        filename = f"{timestamp}_{clean_prompt}.{fileext}"
-        filepath = os.path.join('output', filename)
-        
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            with open(filepath, 'wb') as file:
-                file.write(response.content)
-            st.success(f"Image downloaded and saved as output\\{filename}")
-            st.session_state.last_saved_image = filepath
-            st.session_state.current_image = filepath
-            return filepath
-        else:
-            st.error(f"Failed to download image. Status code: {response.status_code}")
-            return None
-
     def delete_last_image():
         if st.session_state.last_saved_image and os.path.exists(st.session_state.last_saved_image):
             os.remove(st.session_state.last_saved_image)
+            get_output_index().remove(st.session_state.last_saved_image)
             st.success(f"Deleted: {os.path.basename(st.session_state.last_saved_image)}")
             st.session_state.last_saved_image = None
             st.session_state.current_image = None
         else:
             st.warning("No image to delete or file not found.")
 
+    def job_panel():
+        job_queue = get_job_queue()
+        jobs = job_queue.jobs(st.session_state.session_id)
+        active = [job for job in jobs if job["status"] in ("queued", "running")]
+
+        # newly finished images become the current one, oldest first so the latest wins
+        for entry in reversed(jobs):
+            if entry["status"] == "done" and entry["id"] not in st.session_state.seen_jobs:
+                st.session_state.seen_jobs.add(entry["id"])
+                st.session_state.last_saved_image = entry["result"]["filepath"]
+                st.session_state.current_image = entry["result"]["filepath"]
+
+        if jobs:
+            with st.expander(f"Jobs - {len(active)} queued/running, {len(jobs) - len(active)} finished", expanded=True):
+                now = time.time()
+                for entry in jobs[:JOB_PANEL_SIZE]:
+                    prompt = entry["job"]["prompt"]
+                    if entry["status"] == "queued":
+                        st.text(f"⏳ queued {now - entry['submitted']:.0f}s - {prompt}")
+                    elif entry["status"] == "running":
+                        st.text(f"🔄 running {now - entry['started']:.0f}s - {prompt}")
+                    elif entry["status"] == "done":
+                        result = entry["result"]
+                        if result["cached"]:
+                            st.text(f"⚡ cache hit (no API call) output\\{os.path.basename(result['filepath'])} - {prompt}")
+                        else:
+                            st.text(f"✅ {result['elapsed']:.1f}s output\\{os.path.basename(result['filepath'])} - {prompt}")
+                    else:
+                        st.text(f"❌ {entry['result']['error']} - {prompt}")
+                if not active and st.button("Clear finished jobs"):
+                    job_queue.clear_finished(st.session_state.session_id)
+
+        # the latest sweep as a grid, cells fill in as their jobs finish
+        sweep = st.session_state.get("sweep")
+        cells = {entry["job"]["sweep_index"]: entry for entry in jobs if sweep and entry["job"].get("sweep_id") == sweep["id"]}
+        if cells:
+            sweep_grid(sweep, cells)
+
+        # everything finished as one labelled image (the sweep in grid order if there is one)
+        finished = [entry for entry in reversed(jobs) if entry["status"] == "done"]
+        if not active and len(finished) > 1 and st.button("Contact Sheet"):
+            # one slot per job, failed ones stay as empty tiles so the rest line up with their labels
+            if cells:
+                sheet_entries = [cells.get(i) for i in range(len(sweep["combos"]))]
+                labels = [describe(combo) for combo in sweep["combos"]]
+                columns = len(sweep["axes"][-1][1]) if len(sweep["axes"]) > 1 else None
+            else:
+                sheet_entries = [entry for entry in reversed(jobs) if entry["status"] in ("done", "failed")]
+                labels = [entry["job"]["prompt"] for entry in sheet_entries]
+                columns = None
+            from contact_sheet import build_contact_sheet  # numpy, only needed here
+
+            paths, captions = [], []
+            for entry, label in zip(sheet_entries, labels):
+                if entry and entry["status"] == "done":
+                    paths.append(entry["result"]["filepath"])
+                    # from the index
+                    captions.append(None)
+                else:
+                    paths.append(None)
+                    captions.append([label, f"failed: {entry['result']['error']}" if entry else "not run"])
+            sheet = build_contact_sheet(paths, columns, captions=captions)
+            sheet_bytes = io.BytesIO()
+            sheet.save(sheet_bytes, format="JPEG", quality=90)
+            st.image(sheet_bytes.getvalue(), caption=f"{sum(1 for path in paths if path)} of {len(paths)} images")
+            st.download_button("Download Contact Sheet", sheet_bytes.getvalue(),
+                               file_name=f"contact_sheet_{time.strftime('%Y%m%d_%H%M%S')}.jpg", mime="image/jpeg")
+
+        # Display the current image
+        # (it can be gone: deleted, or recompressed to .webp by archive.py)
+        if st.session_state.current_image and os.path.exists(st.session_state.current_image):
+            st.image(st.session_state.current_image, caption="Generated Image")
+            current_row = get_output_index().get(st.session_state.current_image)
+            if current_row:
+                pin_checkbox(current_row)
+
+        # last one landed, rerun the whole page once so polling stops
+        if not active and st.session_state.get("jobs_were_active"):
+            st.session_state.jobs_were_active = False
+            st.rerun()
+        if active:
+            st.session_state.jobs_were_active = True
+
+    def sweep_grid(sweep, cells):
+        st.subheader("Sweep")
+        axes = sweep["axes"]
+        # the last axis runs across, everything else down
+        columns = len(axes[-1][1]) if len(axes) > 1 else min(4, len(sweep["combos"]))
+        now = time.time()
+        for row_start in range(0, len(sweep["combos"]), columns):
+            for col, i in zip(st.columns(columns), range(row_start, min(row_start + columns, len(sweep["combos"])))):
+                entry = cells.get(i)
+                label = describe(sweep["combos"][i])
+                with col:
+                    if entry is None:
+                        st.caption(f"{label} - not queued")
+                    elif entry["status"] == "done":
+                        st.image(entry["result"]["filepath"], caption=label, use_container_width=True)
+                    elif entry["status"] == "failed":
+                        st.caption(f"❌ {label} - {entry['result']['error']}")
+                    elif entry["status"] == "running":
+                        st.caption(f"🔄 {label} - {now - entry['started']:.0f}s")
+                    else:
+                        st.caption(f"⏳ {label}")
+
     def save_prompt(prompt):
-        if not os.path.exists('prompts'):
-            os.makedirs('prompts')
-        
-        filepath = os.path.join('prompts', 'saved_prompts.txt')
-        
-        with open(filepath, 'a') as file:
-            file.write(f"{prompt}\n\n")
-        
-        st.success(f"Prompt saved to prompts/saved_prompts.txt")
+        # the text file is kept for anyone reading it by hand, only new prompts get appended
+        if get_prompt_store().save(prompt):
+            with open(SAVED_PROMPTS_PATH, 'a') as file:
+                file.write(f"{prompt}\n\n")
+            st.success(f"Prompt saved to prompts/saved_prompts.txt")
+        else:
+            st.info("Prompt was already saved.")
 
     # Streamlit app
     st.title("Flux.1.X / Qwen-Image - Streamlit GUI")
@@ -105,16 +186,18 @@ try:
         
         input_prompt = st.text_area("Enter your prompt:", height=100)
 
+        batch_mode = st.checkbox("Batch - treat each line of the prompt as its own image, run them all at once")
+
         model_version = st.selectbox(
             "Model Version (Qwen-Image: fast-cheep-good, Qwen-Image-Edit: replace items/edit schnell: fast and cheap, dev: quick and inexpensive, pro: moderate render time, most expensive, pro 1.1: latest, SD 3.5 Large & Large Turbo: Stability.ai's latest)",
-            options=["Qwen-Image","Qwen-Image-Edit","schnell", "dev", "pro","1.1-pro", "SD 3.5 Large Turbo", "SD 3.5 Large"],
+            options=MODEL_VERSIONS,
             index=0
         )
         
         
         aspect_ratio = st.selectbox(
             "Aspect Ratio",
-            options=["1:1", "16:9", "9:16", "21:9", "2:3", "3:2", "4:5", "5:4", "9:21"],
+            options=ASPECT_RATIOS,
             index=0
         )
 
@@ -122,114 +205,73 @@ try:
         #output_quality = st.slider("Output Quality", min_value=1, max_value=100, value=90, step=1)
 
         
+        model = get_model(model_version)
+
         # some default values since different versions of the model require different params
-        guidance = None
-        steps = None
-        safety_checker = None
-        interval = None
-        safety_tolerance = None
-        cfg = None # sd models
+        params = {}
         seed = None
-        image_format = "png"
-        
-
-        # Qwen 
-    
-        if not model_version.startswith("Qwen"):
-                
-            image_format = "jpg"
-
-            
-            if model_version == "dev":
-                guidance = st.slider(
-                    "Guidance - How closely the model follows your prompt, 1-10, default 3.5",
-                    min_value=0.0,
-                    max_value=10.0,
-                    value=3.5,
-                    step=0.01,
-                    format="%.2f"
+        uploaded_file = None
+        prep_future = None
+
+        # the widgets for each model are described in model_registry
+        for spec in model["params"]:
+            if spec["widget"] == "radio":
+                option_labels = spec.get("option_labels", {})
+                params[spec["name"]] = st.radio(
+                    spec["label"],
+                    options=spec["options"],
+                    index=spec["index"],
+                    format_func=lambda x, option_labels=option_labels: option_labels.get(x, x)
                 )
-            
-            if model_version.startswith("pro") or model_version.startswith("1"):
-                guidance = st.slider(
-                    "Guidance - How closely the model follows your prompt, 2-5, default is 3",
-                    min_value=2.0,
-                    max_value=5.0,
-                    value=3.0,
-                    step=0.01,
-                    format="%.2f"
-                )
-                
-            if model_version.startswith("pro") or model_version.startswith("1"):
-                steps = st.slider(
-                    "Steps - Quality/Detail of render, 1-100, default 25.",
-                    min_value=1,
-                    max_value=100,
-                    value=25,
-                    step=1
-                )    
-        
-                interval = st.slider(
-                    "Interval - Variance of the image, 4 being the most varied, default is 1",
-                    min_value=1.0,
-                    max_value=4.0,
-                    value=1.0,
-                    step=0.01,
-                    format="%.2f"
-                )  
-
-                safety_tolerance = st.slider(
-                    "Safety Tolerance - 1 to 5, 5 being least restrictive, 1 default (3 on default on here)",
-                    min_value=1,
-                    max_value=5,
-                    value=3,
-                    step=1
-                )     
-
-            if not model_version.startswith("pro") and not model_version.startswith("1") and not model_version.startswith("SD"):
-                safety_checker = st.radio(
-                    "Safety Checker - Turn on model NSFW checking",
-                    options=["Off", "On"],
-                    index=1,
-                    format_func=lambda x: "Disabled" if x == "On" else "Enabled"
+            else:
+                params[spec["name"]] = st.slider(
+                    spec["label"],
+                    **{k: spec[k] for k in ("min_value", "max_value", "value", "step", "format") if k in spec}
                 )
-            
-            if model_version == "SD 3.5 Large Turbo":
-                cfg =  st.slider(
-                    "CFG - Similarity to prompt, 0-20, default is 0 ",
-                    min_value=1.00,
-                    max_value=20.00,
-                    value=1.00,
-                    step=.05
-                )    
-                steps = st.slider(
-                    "Steps - Quality/Detail of render, 1-10, default 4.",
-                    min_value=1,
-                    max_value=10,
-                    value=4,
-                    step=1
-                )   
-
-            if model_version == "SD 3.5 Large":
-                cfg =  st.slider(
-                    "CFG - Similarity to prompt, 0-20, default is 3.5 ",
-                    min_value=0.0,
-                    max_value=20.0,
-                    value=3.5,
-                    step=.5
-                )    
-                steps = st.slider(
-                    "Steps - Quality/Detail of render, 1-50, default 35.",
-                    min_value=1,
-                    max_value=50,
-                    value=35,
-                    step=1
-                )   
-
-            
+
+        if model["seed"]:
             seed = st.number_input("Seed (optional)", min_value=0, max_value=2**32-1, step=1, value=None, key="seed")
 
-        else:
+        # Sweep - one prompt x seeds x a few values of each numeric param, as a grid
+        sweep_mode = False
+        sweep_combos = []
+        if model["seed"] or sweepable_params(model):
+            sweep_mode = st.checkbox("Sweep - one image per combination of the seeds / parameter values below, all at once", key="sweep_mode")
+        if sweep_mode:
+            sweep_axes = []
+            with st.container(border=True):
+                if model["seed"]:
+                    try:
+                        seeds = parse_seeds(st.text_input("Seeds (e.g. 1, 2, 3 or 1-4)", value="1-4", key="sweep_seeds"))
+                    except ValueError as e:
+                        seeds = []
+                        st.error(f"Seeds should be numbers, e.g. 1, 2, 3 or 1-4 ({e})")
+                    if seeds:
+                        sweep_axes.append(("seed", seeds))
+                for spec in sweepable_params(model):
+                    if st.checkbox(f"Sweep {spec['name']}", key=f"sweep_{spec['name']}"):
+                        low, high = st.slider(
+                            f"{spec['name']} from / to",
+                            value=(spec["min_value"], spec["max_value"]),
+                            key=f"sweep_range_{spec['name']}",
+                            **{k: spec[k] for k in ("min_value", "max_value", "step", "format") if k in spec}
+                        )
+                        count = st.number_input(f"How many {spec['name']} values", min_value=2, max_value=8, value=4, key=f"sweep_count_{spec['name']}")
+                        sweep_axes.append((spec["name"], sweep_values(spec, low, high, count)))
+                # counted first, a too-big sweep never gets built
+                sweep_count = sweep_size(sweep_axes) if sweep_axes else 0
+                if sweep_axes:
+                    st.caption(f"{sweep_count} images - " + " x ".join(f"{name} {values}" for name, values in sweep_axes))
+                if sweep_count > MAX_SWEEP_JOBS:
+                    st.warning(f"That's more than {MAX_SWEEP_JOBS} images, narrow the sweep down.")
+                elif sweep_count:
+                    sweep_combos = expand(sweep_axes)
+
+        max_concurrent = 4
+        if batch_mode or sweep_mode:
+            max_concurrent = st.slider("Max concurrent predictions (this session)", min_value=1, max_value=16, value=16 if sweep_mode else 4, step=1)
+
+        if model["accepts_image"]:
             # File uploader
             uploaded_file = st.file_uploader(
                 "Choose an image file", 
@@ -243,13 +285,12 @@ try:
                 image = Image.open(uploaded_file)
                 st.image(image, caption="Uploaded Image", use_container_width=True)
                 
-                # Save uploaded file temporarily to get a URL (for local testing)
-                # In production, you'd want to upload to a cloud service
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                    tmp_file.write(uploaded_file.getvalue())
-                    temp_path = tmp_file.name
+                # Shrunk to what the model uses and staged in the background (input_prep),
+                # replicate only gets each distinct image uploaded once
+                prep_future = submit_upload(uploaded_file, model.get("max_input_side"))
                 
                 st.success("✅ Image uploaded successfully!")
+                st.caption(describe_upload(prep_future))
                 
         
         replicate_key = st.text_input("Replicate Key - If not provided, will try to use the key in .env file", key="rep_key", type="password")
@@ -268,105 +309,50 @@ try:
             save_prompt_button = st.button("Save Last Prompt")
 
         if generate_button:
-            if input_prompt:
-                st.session_state.prompt_history.insert(0, input_prompt)
-                with st.spinner():
-                    input_dict = {
-                        "prompt": input_prompt,
-                        "aspect_ratio": aspect_ratio,
-                        "output_format": image_format,
-                        "output_quality": 100 # output_quality, note this is ignored if output is .png
-                    }
-               
-                    if seed is not None:
-                        input_dict["seed"] = seed
-                    
-                    if guidance is not None:
-                        input_dict["guidance"] = guidance
-                    
-                    if steps is not None:
-                        input_dict["steps"] = steps
-
-                    if safety_checker is not None:
-                        input_dict["disable_safety_checker"] = safety_checker == "On"
-                        
-                    if safety_tolerance is not None:    
-                        input_dict["safety_tolerance"] = safety_tolerance
-                    
-                    if cfg is not None:
-                         input_dict["cfg"] = cfg
-
-
-                    
-
-                    # Run the model with the prepared input
-                    try:
-                        client = None
-                        if replicate_key is None:
-                            client =   replicate.Client()
-                        else:
-                            client = replicate.Client(api_token=replicate_key)
-                        
-                        # refactor if this model list gets any bigger
-                        api_end_point = None 
-                        
-                        if model_version=="SD 3.5 Large Turbo":
-                            api_end_point = "stability-ai/stable-diffusion-3.5-large-turbo"
-                        elif model_version=="SD 3.5 Large":
-                            api_end_point = "stability-ai/stable-diffusion-3.5-large"
-                        elif model_version=="Qwen-Image":
-                            api_end_point =  "wavespeedai/qwen-image" # "qwen/qwen-image" - wavespeedai less restrictive
-                        elif model_version == "Qwen-Image-Edit":
-                            api_end_point = "qwen/qwen-image-edit"
-                           
-                        else:
-                            api_end_point = f"black-forest-labs/flux-{model_version}"
-                        
-                  
-
-                        
-
-                        # todo, make this toggles
-                        if model_version.startswith("Qwen"):
-                            input_dict["output_quality"] = 100
-                            input_dict["disable_safety_checker"] =  True
-
-
-                        # print(f"{input_dict}")
-                        # print(api_end_point)
-
-                        #print("->" + api_end_point)
-
-
-                        # Only add image if file is uploaded
-                        if uploaded_file is not None:
-                            with open(temp_path, "rb") as f:
-                                input_dict["image"] = f
-                                output = client.run(api_end_point, input=input_dict)
-                        else:
-                            output = client.run(api_end_point, input=input_dict)
-
-                        # output = client.run(
-                        #     api_end_point, 
-                        #     input=input_dict
-                        # )
-                        
-                        if isinstance(output, list) and len(output) > 0:
-                            output = output[0]
-
-                        # if not isinstance(output, str):
-                        #     st.error(f"Unexpected output format: {output}")
-                        # else:
-                        with st.spinner('Waiting for image to be ready...'):
-                            if wait_for_image(output, model_version):
-                                filepath = download_image(output, input_prompt)
-                                if filepath:
-                                    st.session_state.current_image = filepath
-                            else:
-                                st.error("Timed out waiting for image to be ready.")
-
-                    except Exception as e:
-                        st.error(f"Error generating image: {str(e)}")
+            prompts = [input_prompt]
+            if batch_mode:
+                prompts = [p.strip() for p in input_prompt.splitlines() if p.strip()]
+
+            if sweep_mode and not 0 < len(sweep_combos) <= MAX_SWEEP_JOBS:
+                st.warning(f"Pick between 1 and {MAX_SWEEP_JOBS} sweep combinations.")
+            elif input_prompt and prompts:
+                for prompt in prompts:
+                    get_prompt_store().add(prompt)
+                # Queue the jobs and carry on, the status panel below picks the results up
+                try:
+                    client = get_client(replicate_key or None)
+                    api_end_point = resolve_model_ref(model_version, replicate_key or None)
+
+                    # one job per prompt, the queue runs them in the background.
+                    # Only add image if file is uploaded
+                    image_path = None
+                    if prep_future is not None:
+                        image_path = prep_future.result()[0]
+                        st.caption(describe_upload(prep_future))
+                    # a sweep is one prompt with the swept values laid over the sliders
+                    combos = [{}]
+                    if sweep_mode:
+                        prompts = prompts[:1]
+                        combos = sweep_combos
+                        st.session_state.sweep = {"id": uuid.uuid4().hex, "combos": combos, "axes": sweep_axes}
+                    job_queue = get_job_queue()
+                    for prompt in prompts:
+                        for i, combo in enumerate(combos):
+                            job_params = dict(params, **combo)
+                            job = make_job(
+                                model_version, prompt, image_path=image_path, api_end_point=api_end_point,
+                                aspect_ratio=aspect_ratio, seed=job_params.pop("seed", seed), guidance=job_params.get("guidance"),
+                                steps=job_params.get("steps"), safety_checker=job_params.get("safety_checker"),
+                                safety_tolerance=job_params.get("safety_tolerance"), cfg=job_params.get("cfg")
+                            )
+                            if sweep_mode:
+                                job["sweep_id"] = st.session_state.sweep["id"]
+                                job["sweep_index"] = i
+                            job["user"] = current_user()
+                            job_queue.submit(st.session_state.session_id, client, job, cache=get_result_cache(), max_concurrent=max_concurrent)
+
+                except Exception as e:
+                    st.error(f"Error generating image: {str(e)}")
 
             else:
                 st.warning("Please enter a prompt.")
@@ -380,9 +366,19 @@ try:
             else:
                 st.warning("Please enter a prompt to save.")
 
-        # Display the current image
-        if st.session_state.current_image:
-            st.image(st.session_state.current_image, caption="Generated Image")
+        # Queued/running/finished jobs and the current image, polled while anything is in flight
+        active_jobs = get_job_queue().active_count(st.session_state.session_id)
+        st.fragment(run_every=JOB_POLL_SECONDS if active_jobs else None)(job_panel)()
+
+        # straight on to the editor / video pages with the current image (studio.py only)
+        if in_studio() and st.session_state.current_image and os.path.exists(st.session_state.current_image):
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🎨 Edit This Image"):
+                    send_image(st.session_state.current_image, EDIT_PAGE)
+            with col2:
+                if st.button("🎬 Make a Video of It"):
+                    send_image(st.session_state.current_image, VIDEO_PAGE)
 
     # Margin column (empty for spacing)
     with margin_col:
@@ -392,11 +388,25 @@ try:
     with right_column:
         st.subheader("Prompt History")
         
+        prompt_store = get_prompt_store()
+        history_query = st.text_input("Search prompts", key="history_query")
+        saved_only = st.checkbox("Saved prompts only", key="history_saved_only")
+        history_total = prompt_store.count(history_query, saved_only)
+
+        history_page = 1
+        history_pages = max(1, (history_total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+        if history_pages > 1:
+            history_page = st.number_input(f"Page (of {history_pages}, {history_total} prompts)", min_value=1, max_value=history_pages, value=1, step=1, key="history_page")
+
         prompt_history_container = st.container()
         
         with prompt_history_container:
-            for i, prompt in enumerate(st.session_state.prompt_history):
-                st.text(f"{i+1}. {prompt}")
+            # only the current page is ever read or rendered
+            offset = (history_page - 1) * HISTORY_PAGE_SIZE
+            for i, (prompt, use_count, last_used, saved) in enumerate(prompt_store.page(history_query, HISTORY_PAGE_SIZE, offset, saved_only)):
+                star = "★ " if saved else ""
+                uses = f"  (x{use_count})" if use_count > 1 else ""
+                st.text(f"{offset+i+1}. {star}{prompt}{uses}")
         
         st.markdown("""
             <style>
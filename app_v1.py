@@ -1,6 +1,6 @@
 import streamlit as st
-import replicate
-import requests
+import transport
+from clients import get_client, resolve_model_ref
 import time
 import os
 import re
@@ -33,7 +33,7 @@ try:
 
     def wait_for_image(url, model_version, max_attempts=10, delay=2):
         for attempt in range(max_attempts):
-            response = requests.head(url)
+            response = transport.head(url)
             if response.status_code == 200:
                 return True
             time.sleep(delay)
@@ -57,7 +57,7 @@ try:
         filename = f"{timestamp}_{clean_prompt}.{fileext}"
         filepath = os.path.join('output', filename)
         
-        response = requests.get(url)
+        response = transport.get(url)
         
         if response.status_code == 200:
             with open(filepath, 'wb') as file:
@@ -274,23 +274,10 @@ try:
 
                     # Run the model with the prepared input
                     try:
-                        client = None
-                        if replicate_key is None:
-                            client =   replicate.Client()
-                        else:
-                            client = replicate.Client(api_token=replicate_key)
+                        client = get_client(replicate_key or None)
                         
-                        # refactor if this model list gets any bigger
-                        api_end_point = None 
-                        
-                        if model_version=="SD 3.5 Large Turbo":
-                            api_end_point = "stability-ai/stable-diffusion-3.5-large-turbo"
-                        elif model_version=="SD 3.5 Large":
-                            api_end_point = "stability-ai/stable-diffusion-3.5-large"
-                        elif model_version=="Qwen-Image":
-                            api_end_point =  "wavespeedai/qwen-image" # "qwen/qwen-image" - wavespeedai less restrictive
-                        else:
-                            api_end_point = f"black-forest-labs/flux-{model_version}"
+                        # endpoints live in model_registry now
+                        api_end_point = resolve_model_ref(model_version, replicate_key or None)
                         
                         # print(f"{input_dict}")
                         # print(api_end_point)
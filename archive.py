@@ -0,0 +1,300 @@
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from funcs import OUTPUT_DIR, reserve_output_path, sniff_image_format, sqlite_connect
+from output_index import IMAGE_EXTENSIONS, get_output_index_if_exists
+from result_cache import file_sha256, get_result_cache
+
+# Archival recompression of output/: PNGs (and anything else stored without
+# loss) are rewritten as lossless WebP - or AVIF where this Pillow build has
+# it - on a process pool, one process per core.
+#
+#   python archive.py                 # output/, WebP
+#   python archive.py some/folder --format avif --dry-run
+#
+# The format comes from the file's magic bytes, not its extension (plenty of
+# ".png" files here are really JPEGs, those are left alone: a lossless copy
+# of a JPEG only gets bigger).  Every converted image is decoded again and
+# compared pixel for pixel before the original is deleted, and a sidecar
+# <new file>.orig.json keeps the original's name, size and sha256 (plus any
+# PNG text chunks, ICC profile and EXIF; the new file keeps the last two).  Each file is looked at once per (mtime, size), tracked
+# in output/.cache/archive.db, so re-running only touches new files.
+#
+# ARCHIVE_OUTPUTS=1 makes the apps run a pass in the background every
+# ARCHIVE_INTERVAL seconds (default 3600).
+
+ARCHIVE_DB = os.path.join(OUTPUT_DIR, ".cache", "archive.db")
+FORMATS = ["webp", "avif"]
+DEFAULT_FORMAT = "webp"
+# formats that hold the exact pixels, anything else is already as small as it should be
+LOSSLESS_SOURCES = ("png", "bmp", "tiff")
+# Pillow modes WebP / AVIF can hold without changing a pixel (no 16-bit PNGs)
+SUPPORTED_MODES = ("1", "L", "LA", "P", "PA", "RGB", "RGBA")
+# lossless WebP: quality is effort here, not loss
+WEBP_EFFORT = 80
+WEBP_METHOD = 4
+SIDECAR_SUFFIX = ".orig.json"
+# leave fresh outputs alone, a page may still be showing them
+MIN_AGE = 600
+# not worth swapping the file for less than this
+MIN_SAVING = 0.05
+DEFAULT_INTERVAL = 3600
+
+
+def available_format(target):
+    """target if this Pillow can write it, else WebP."""
+    from PIL import features
+
+    if target == "avif":
+        try:
+            if features.check("avif"):
+                return "avif"
+        except ValueError:
+            # older Pillow doesn't know the feature at all
+            pass
+    return "webp"
+
+
+def recompress(path, target=DEFAULT_FORMAT, min_saving=MIN_SAVING):
+    """Rewrite one image losslessly as target, runs in a pool process.
+
+    Returns a dict: status "archived" (with new_path), "kept" (not smaller /
+    not exact), "skipped" (not a lossless source) or "failed" (with error).
+    """
+    import numpy as np
+    from PIL import Image
+
+    result = {"path": path, "status": "skipped", "format": None, "new_path": None,
+              "bytes": os.path.getsize(path), "new_bytes": None, "sha256": None, "error": None}
+    tmp_path = None
+    try:
+        result["format"] = source_format = sniff_image_format(path)
+        if source_format not in LOSSLESS_SOURCES:
+            return result
+
+        with Image.open(path) as image:
+            image.load()
+            if image.mode not in SUPPORTED_MODES:
+                result["status"] = "kept"
+                return result
+            text = dict(getattr(image, "text", {}) or {})
+            mode = "RGBA" if image.mode in ("LA", "PA", "RGBA") or "transparency" in image.info else "RGB"
+            if image.mode in ("1", "L"):
+                mode = "L"
+            pixels = np.asarray(image.convert(mode))
+
+            # the colour profile and EXIF go along, same pixels under another profile would be another colour
+            metadata = {key: image.info[key] for key in ("icc_profile", "exif") if image.info.get(key)}
+
+            stem, _ = os.path.splitext(path)
+            tmp_path = f"{stem}.{target}.tmp"
+            if target == "avif":
+                image.convert(mode).save(tmp_path, format="AVIF", lossless=True, **metadata)
+            else:
+                # exact keeps the colour under fully transparent pixels too
+                image.convert(mode).save(tmp_path, format="WEBP", lossless=True, quality=WEBP_EFFORT,
+                                         method=WEBP_METHOD, exact=True, **metadata)
+
+        with Image.open(tmp_path) as converted:
+            exact = (np.array_equal(pixels, np.asarray(converted.convert(mode)))
+                     and converted.info.get("icc_profile") == metadata.get("icc_profile"))
+        new_bytes = os.path.getsize(tmp_path)
+        if not exact or new_bytes > result["bytes"] * (1 - min_saving):
+            os.remove(tmp_path)
+            result["status"] = "kept"
+            return result
+
+        result["sha256"] = file_sha256(path)
+        stat = os.stat(path)
+        new_path = reserve_output_path(os.path.dirname(path) or ".", os.path.basename(stem), target)
+        os.replace(tmp_path, new_path)
+        tmp_path = None
+        # same times as the original so the galleries keep their order
+        os.utime(new_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        sidecar = {
+            "original": os.path.basename(path), "format": source_format, "bytes": result["bytes"],
+            "sha256": result["sha256"], "archived": os.path.basename(new_path), "archived_format": target,
+            "archived_bytes": new_bytes, "archived_at": time.time(), "text": text,
+            # the archived file carries both too, this is the record of what the original had
+            "icc_profile": base64.b64encode(metadata["icc_profile"]).decode("ascii") if "icc_profile" in metadata else None,
+            "exif": base64.b64encode(metadata["exif"]).decode("ascii") if "exif" in metadata else None,
+        }
+        with open(new_path + SIDECAR_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(sidecar, f, indent=1)
+        os.remove(path)
+        result.update(status="archived", new_path=new_path, new_bytes=new_bytes)
+        return result
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        result.update(status="failed", error=str(e))
+        return result
+
+
+class Archiver:
+    def __init__(self, db_path=ARCHIVE_DB, target=DEFAULT_FORMAT, workers=None):
+        self.db_path = db_path
+        self.target = available_format(target)
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, status TEXT NOT NULL,"
+                " format TEXT, original_path TEXT, original_bytes INTEGER, original_sha256 TEXT, checked REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite_connect(self.db_path)
+
+    def candidates(self, output_dir=OUTPUT_DIR, min_age=MIN_AGE):
+        """Images in output_dir not looked at since they last changed, oldest first."""
+        with self._connect() as db:
+            seen = {row[0]: (row[1], row[2]) for row in db.execute("SELECT path, mtime_ns, size FROM files")}
+        cutoff = time.time() - min_age
+        found = []
+        with os.scandir(output_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                stat = entry.stat()
+                path = os.path.normpath(entry.path)
+                if stat.st_size == 0 or stat.st_mtime > cutoff or seen.get(path) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+        return [(path, size) for _, path, size in sorted(found)]
+
+    def run(self, output_dir=OUTPUT_DIR, min_age=MIN_AGE, progress=None):
+        """One incremental pass over output_dir, returns counts per status and bytes saved."""
+        summary = {"archived": 0, "kept": 0, "skipped": 0, "failed": 0, "saved_bytes": 0}
+        paths = [path for path, _ in self.candidates(output_dir, min_age)]
+        if not paths:
+            return summary
+        # spawn, not fork: the apps have threads (and sqlite handles) a fork would copy mid-flight
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(paths)), mp_context=context) as pool:
+            futures = [pool.submit(recompress, path, self.target) for path in paths]
+            for future in as_completed(futures):
+                result = future.result()
+                self._record(output_dir, result)
+                summary[result["status"]] += 1
+                if result["status"] == "archived":
+                    summary["saved_bytes"] += result["bytes"] - result["new_bytes"]
+                if progress:
+                    progress(result)
+        return summary
+
+    def _record(self, output_dir, result):
+        now = time.time()
+        rows = []
+        if result["status"] == "archived":
+            new_path = os.path.normpath(result["new_path"])
+            stat = os.stat(new_path)
+            rows.append((new_path, stat.st_mtime_ns, stat.st_size, "archived", self.target,
+                         os.path.normpath(result["path"]), result["bytes"], result["sha256"], now))
+            try:
+                index = get_output_index_if_exists(output_dir)
+                if index is not None:
+                    index.move(result["path"], new_path)
+                # the result cache only ever points into output/
+                if os.path.abspath(output_dir) == os.path.abspath(OUTPUT_DIR):
+                    get_result_cache().moved(result["path"], new_path)
+            except sqlite3.Error:
+                # the next index rebuild picks the new file up anyway
+                pass
+        elif os.path.exists(result["path"]):
+            stat = os.stat(result["path"])
+            rows.append((os.path.normpath(result["path"]), stat.st_mtime_ns, stat.st_size, result["status"],
+                         result["format"], None, result["bytes"], None, now))
+        with self._connect() as db:
+            if result["status"] == "archived":
+                db.execute("DELETE FROM files WHERE path = ?", (os.path.normpath(result["path"]),))
+            db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def start_background(self, output_dir=OUTPUT_DIR, interval=DEFAULT_INTERVAL):
+        """Run a pass every interval seconds on a daemon thread (once per process)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, args=(output_dir, interval), daemon=True,
+                                            name="archiver")
+            self._thread.start()
+
+    def _loop(self, output_dir, interval):
+        while True:
+            try:
+                if os.path.isdir(output_dir):
+                    self.run(output_dir)
+            except Exception as e:
+                print(f"archive pass failed: {e}", file=sys.stderr)
+            time.sleep(interval)
+
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+
+def get_archiver():
+    global _archiver
+    with _archiver_lock:
+        if _archiver is None:
+            _archiver = Archiver(target=os.environ.get("ARCHIVE_FORMAT", DEFAULT_FORMAT))
+    return _archiver
+
+
+def start_background_archiving():
+    """What the apps call at start-up, does nothing unless ARCHIVE_OUTPUTS is set."""
+    if os.environ.get("ARCHIVE_OUTPUTS", "").lower() in ("", "0", "false", "no"):
+        return
+    get_archiver().start_background(OUTPUT_DIR, float(os.environ.get("ARCHIVE_INTERVAL", DEFAULT_INTERVAL)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompress output images to lossless WebP/AVIF.")
+    parser.add_argument("folders", nargs="*", default=[OUTPUT_DIR])
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    parser.add_argument("--min-age", type=float, default=MIN_AGE, help="skip files changed in the last N seconds")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be looked at and stop")
+    args = parser.parse_args(argv)
+
+    for folder in args.folders:
+        # each folder keeps its own state next to its own index
+        archiver = Archiver(os.path.join(folder, ".cache", "archive.db"), args.format, args.workers)
+        if args.format != archiver.target:
+            print(f"this Pillow can't write {args.format}, using {archiver.target}")
+        if args.dry_run:
+            candidates = archiver.candidates(folder, args.min_age)
+            for path, size in candidates:
+                print(f"  {path} ({sniff_image_format(path) or '?'}, {size / 1024:.0f} KB)")
+            print(f"{folder}: {len(candidates)} files, {sum(size for _, size in candidates) / 1024 / 1024:.1f} MB to check")
+            continue
+
+        started = time.time()
+
+        def progress(result):
+            if result["status"] == "archived":
+                print(f"  {result['path']} -> {result['new_path']} "
+                      f"({result['bytes'] / 1024:.0f} KB -> {result['new_bytes'] / 1024:.0f} KB)")
+            elif result["status"] == "failed":
+                print(f"  {result['path']}: {result['error']}")
+
+        summary = archiver.run(folder, args.min_age, progress)
+        print(f"{folder}: {summary['archived']} archived, {summary['kept']} kept, {summary['skipped']} skipped, "
+              f"{summary['failed']} failed, {summary['saved_bytes'] / 1024 / 1024:.1f} MB saved "
+              f"in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import replicate
+from dotenv import load_dotenv
+
+from engine import DEFAULT_MAX_WORKERS, generate_many
+from funcs import ASPECT_RATIOS, MODEL_VERSIONS, OUTPUT_DIR, make_job, percentile
+from result_cache import get_result_cache
+
+# Headless batch runner, builds the same requests app.py does without streamlit.
+#
+#   python batch.py prompts.txt --model schnell --concurrency 8
+#
+# The prompts file is either one prompt per line, or JSONL where each line
+# can override the command line defaults:
+#
+#   {"prompt": "a cat", "model": "dev", "aspect_ratio": "16:9", "seed": 42, "guidance": 3.5}
+#
+# Blank lines and lines starting with # are skipped.
+
+JOB_PARAMS = ["aspect_ratio", "seed", "guidance", "steps", "cfg", "safety_checker", "safety_tolerance"]
+
+
+def read_jobs(path, defaults, output_dir=OUTPUT_DIR):
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith("{"):
+                try:
+                    spec = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_no}: bad JSON - {e}")
+            else:
+                spec = {"prompt": line}
+
+            if not spec.get("prompt"):
+                raise ValueError(f"{path}:{line_no}: missing prompt")
+
+            model_version = spec.get("model", defaults["model"])
+            if model_version not in MODEL_VERSIONS:
+                raise ValueError(f"{path}:{line_no}: unknown model {model_version!r}")
+
+            params = {name: spec.get(name, defaults.get(name)) for name in JOB_PARAMS}
+            jobs.append(make_job(model_version, spec["prompt"], image_path=spec.get("image"),
+                                 output_dir=output_dir, **params))
+    return jobs
+
+
+def summarize(results, wall_time):
+    # cache hits aren't predictions, keep them out of the latency numbers
+    latencies = [r["elapsed"] for r in results if r["filepath"] and not r.get("cached")]
+    ok = len([r for r in results if r["filepath"]])
+    summary = {
+        "jobs": len(results),
+        "ok": ok,
+        "cached": len([r for r in results if r.get("cached")]),
+        "failed": len(results) - ok,
+        "wall_time": wall_time,
+        "images_per_min": ok / wall_time * 60 if wall_time > 0 else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+    }
+    return summary
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a file of prompts through replicate without the streamlit UI.")
+    parser.add_argument("prompts_file", help="text file (one prompt per line) or JSONL")
+    parser.add_argument("--model", default="schnell", choices=MODEL_VERSIONS, help="default model for lines that don't set one")
+    parser.add_argument("--aspect-ratio", default="1:1", choices=ASPECT_RATIOS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--guidance", type=float, default=None)
+    parser.add_argument("--steps", type=int, default=None)
+    parser.add_argument("--cfg", type=float, default=None)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_WORKERS, help="max predictions in flight")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="always run, even seeded jobs that were run before")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if not os.environ.get("REPLICATE_API_TOKEN"):
+        print("REPLICATE_API_TOKEN is not set (environment or .env)", file=sys.stderr)
+        return 2
+
+    defaults = {
+        "model": args.model,
+        "aspect_ratio": args.aspect_ratio,
+        "seed": args.seed,
+        "guidance": args.guidance,
+        "steps": args.steps,
+        "cfg": args.cfg,
+    }
+    try:
+        jobs = read_jobs(args.prompts_file, defaults, args.output_dir)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if not jobs:
+        print("No prompts found.")
+        return 0
+
+    client = replicate.Client()
+    print(f"Running {len(jobs)} job(s), {args.concurrency} at a time...")
+
+    results = []
+    started = time.time()
+    cache = None if args.no_cache else get_result_cache()
+    for i, result in generate_many(client, jobs, args.concurrency, cache):
+        results.append(result)
+        job = result["job"]
+        if result["cached"]:
+            print(f"[{len(results)}/{len(jobs)}] cached {result['filepath']}")
+        elif result["filepath"]:
+            print(f"[{len(results)}/{len(jobs)}] {result['elapsed']:.1f}s  {result['filepath']}")
+        else:
+            print(f"[{len(results)}/{len(jobs)}] FAILED {job['model_version']} {job['prompt'][:40]!r}: {result['error']}")
+    summary = summarize(results, time.time() - started)
+
+    print()
+    print(f"{summary['ok']}/{summary['jobs']} ok ({summary['cached']} from cache), {summary['failed']} failed in {summary['wall_time']:.1f}s")
+    print(f"Throughput: {summary['images_per_min']:.1f} images/min")
+    print(f"Latency p50: {format_seconds(summary['p50'])}  p95: {format_seconds(summary['p95'])}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import replicate
+from PIL import Image
+
+from clients import resolve_model_ref
+from engine import VIDEO_MODEL, generate_many, run_video_job
+from fake_replicate import FakeReplicate
+from funcs import make_job, percentile
+from staging import get_upload_staging
+from telemetry import get_telemetry
+
+# End to end benchmark against fake_replicate.py, no credits spent.
+#
+#   python benchmark.py --jobs 50 --concurrency 8 --predict-delay 1 --output-size 2000000
+#
+# "images" runs jobs through the same path app.py / batch.py use (make_job ->
+# engine.run_job: scheduler, prediction, wait_for_image, download_image).
+# "video" runs engine.run_video_job, what wan22_test2.py's Generate button
+# calls (upload the source image, run the prediction, stream the video).
+#
+# Everything runs inside a scratch folder (output/, telemetry, indexes,
+# staged uploads) so the real output/ and upload staging are never touched.  Peak RSS is for the whole process, run
+# one scenario at a time to compare them.  Use --base-url to point at an
+# already running fake (python fake_replicate.py) instead of starting one.
+
+SCENARIOS = ["images", "video", "all"]
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None where we can't tell."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_images(client, count, concurrency, model_version):
+    jobs = [make_job(model_version, f"benchmark image {i}") for i in range(count)]
+    results = []
+    for _, result in generate_many(client, jobs, concurrency):
+        results.append({"ok": result["filepath"] is not None, "elapsed": result["elapsed"],
+                        "bytes": os.path.getsize(result["filepath"]) if result["filepath"] else 0,
+                        "error": result["error"]})
+    return results
+
+
+def run_video(client, image_path, prompt="benchmark video"):
+    # the same call wan22_test2.py's Generate button makes
+    result = run_video_job(client, resolve_model_ref(VIDEO_MODEL), image_path, prompt)
+    return {"ok": result["error"] is None, "elapsed": result["elapsed"], "bytes": result["bytes"], "error": result["error"]}
+
+
+def run_videos(client, count, concurrency, workdir):
+    image_path = os.path.join(workdir, "source.jpg")
+    Image.new("RGB", (1280, 720), (40, 90, 160)).save(image_path, quality=90)
+    with open(image_path, "rb") as f:
+        staged = get_upload_staging().stage(f.read(), "source.jpg")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for future in as_completed([pool.submit(run_video, client, staged) for _ in range(count)]):
+            results.append(future.result())
+    return results
+
+
+def report(name, results, wall_time):
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["elapsed"] for r in ok]
+    transferred = sum(r["bytes"] for r in ok)
+    errors = sorted({r["error"] for r in results if r["error"]})
+    rss = peak_rss()
+    return {
+        "scenario": name,
+        "jobs": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_time": wall_time,
+        "jobs_per_sec": len(results) / wall_time if wall_time else 0.0,
+        "files_per_sec": len(ok) / wall_time if wall_time else 0.0,
+        "mb_per_sec": transferred / 1024 / 1024 / wall_time if wall_time else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peak_rss_mb": rss / 1024 / 1024 if rss else None,
+        "errors": errors[:5],
+    }
+
+
+def stage_report(since):
+    # per-stage numbers from the telemetry the run itself wrote
+    return [
+        {"model": model, "stage": stage, "n": n, "p50": p50, "p95": p95, "p99": p99}
+        for model, stage, n, p50, p95, p99 in get_telemetry().summary(since)
+    ]
+
+
+def print_report(summary, stages):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    print(f"\n== {summary['scenario']} ==")
+    print(f"jobs {summary['jobs']}  ok {summary['ok']}  failed {summary['failed']}  wall {summary['wall_time']:.2f}s")
+    print(f"throughput {summary['jobs_per_sec']:.2f} jobs/s  {summary['files_per_sec']:.2f} files/s  {summary['mb_per_sec']:.1f} MB/s")
+    print(f"latency p50 {seconds(summary['p50'])}  p95 {seconds(summary['p95'])}  p99 {seconds(summary['p99'])}")
+    rss = summary["peak_rss_mb"]
+    print(f"peak RSS {'n/a' if rss is None else f'{rss:.0f} MB'}")
+    for error in summary["errors"]:
+        print(f"  error: {error}")
+    if stages:
+        print("stages (p50 / p95 / p99):")
+        for row in stages:
+            print(f"  {row['model'] or '?':<18} {row['stage']:<10} n={row['n']:<5} "
+                  f"{seconds(row['p50'])} / {seconds(row['p95'])} / {seconds(row['p99'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the generate paths against a local fake replicate.")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="all")
+    parser.add_argument("--jobs", type=int, default=40, help="image jobs")
+    parser.add_argument("--video-jobs", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model", default="schnell", help="image model to run as")
+    parser.add_argument("--queue-delay", type=float, default=0.2)
+    parser.add_argument("--predict-delay", type=float, default=1.0)
+    parser.add_argument("--output-size", type=int, default=1024 * 1024, help="bytes per image")
+    parser.add_argument("--video-size", type=int, default=20 * 1024 * 1024, help="bytes per video")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="predictions per minute for the scheduler (default: the app's REPLICATE_RATE_LIMIT)")
+    parser.add_argument("--base-url", default=None, help="use an already running fake replicate")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.rate_limit:
+        os.environ["REPLICATE_RATE_LIMIT"] = str(args.rate_limit)
+    # no webhooks, the fake can't call back through a tunnel
+    os.environ.pop("REPLICATE_WEBHOOK_URL", None)
+
+    fake = None
+    base_url = args.base_url
+    if not base_url:
+        fake = FakeReplicate(queue_delay=args.queue_delay, predict_delay=args.predict_delay,
+                             output_size=args.output_size, video_size=args.video_size,
+                             error_rate=args.error_rate).start()
+        base_url = fake.url
+    client = replicate.Client(api_token="benchmark", base_url=base_url)
+
+    results = {"config": vars(args), "scenarios": []}
+    workdir = tempfile.mkdtemp(prefix="flux_benchmark_")
+    # read when the staging is first used, which is below
+    os.environ["UPLOAD_STAGING_DIR"] = os.path.join(workdir, "uploads")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for name in (["images", "video"] if args.scenario == "all" else [args.scenario]):
+            started = time.time()
+            if name == "images":
+                scenario_results = run_images(client, args.jobs, args.concurrency, args.model)
+            else:
+                scenario_results = run_videos(client, args.video_jobs, args.concurrency, workdir)
+            summary = report(name, scenario_results, time.time() - started)
+            stages = stage_report(started)
+            print_report(summary, stages)
+            results["scenarios"].append(dict(summary, stages=stages))
+    finally:
+        os.chdir(cwd)
+        if fake is not None:
+            fake.close()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(f"\nscratch folder: {workdir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
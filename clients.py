@@ -0,0 +1,37 @@
+import streamlit as st
+
+from model_registry import get_model
+
+# replicate clients and model refs, built once per API token and shared by
+# every session and rerun in the process (st.cache_resource).  Outside a
+# streamlit run (batch.py) cache_resource still caches, it just warns.
+# replicate (and httpx / pydantic under it) is only imported once a client
+# is actually needed, not when a page first loads.
+
+
+@st.cache_resource(show_spinner=False)
+def get_client(api_token=None):
+    import replicate
+
+    # an empty token means "use REPLICATE_API_TOKEN from the environment / .env"
+    if api_token:
+        return replicate.Client(api_token=api_token)
+    return replicate.Client()
+
+
+@st.cache_resource(show_spinner=False)
+def _latest_version(api_token, endpoint):
+    return get_client(api_token).models.get(endpoint).latest_version
+
+
+def resolve_model_ref(model_version, api_token=None):
+    """What to run for a model: "owner/name" or "owner/name:version" if pinned."""
+    model = get_model(model_version)
+    version = model.get("version")
+    if version == "latest":
+        latest = _latest_version(api_token or None, model["endpoint"])
+        # official models don't expose versions, the models endpoint handles those
+        version = latest.id if latest is not None else None
+    if version:
+        return f"{model['endpoint']}:{version}"
+    return model["endpoint"]
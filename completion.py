@@ -0,0 +1,317 @@
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_registry import expected_latencies
+
+# Completion detection for replicate predictions.
+#
+# Instead of client.run + a fixed 2 second HEAD loop we create the prediction
+# ourselves and wait on its status:
+#
+#  - the create call uses replicate's "Prefer: wait" so short models (schnell
+#    finishes in about a second) come back already done,
+#  - otherwise we poll prediction.reload() with a backoff seeded from how long
+#    that model has taken before,
+#  - or, when REPLICATE_WEBHOOK_URL is set, a local webhook receiver gets told
+#    the moment the prediction completes and polling is only a slow fallback.
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+# rough seconds per prediction until we've seen a few real ones, the
+# per-model numbers live in model_registry
+DEFAULT_EXPECTED_LATENCY = 10.0
+
+MIN_POLL_DELAY = 0.25
+MAX_POLL_DELAY = 5.0
+# with a webhook configured polling is just a safety net
+WEBHOOK_FALLBACK_POLL_DELAY = 15.0
+# replicate's Prefer: wait is capped at 60 seconds
+MAX_PREFER_WAIT = 60
+MAX_BACKOFF = 60.0
+
+
+class PredictionFailed(RuntimeError):
+    pass
+
+
+class LatencyTracker:
+    """Moving average of prediction time per model, seeds the poll backoff."""
+
+    def __init__(self, seeds=None, alpha=0.3):
+        self.alpha = alpha
+        self._latencies = dict(seeds or {})
+        self._lock = threading.Lock()
+
+    def expected(self, model):
+        with self._lock:
+            return self._latencies.get(model_key(model), DEFAULT_EXPECTED_LATENCY)
+
+    def record(self, model, seconds):
+        key = model_key(model)
+        with self._lock:
+            previous = self._latencies.get(key)
+            if previous is None:
+                self._latencies[key] = seconds
+            else:
+                self._latencies[key] = previous + self.alpha * (seconds - previous)
+
+
+latency_tracker = LatencyTracker(expected_latencies())
+
+
+def model_key(model):
+    # "owner/name:version" and "owner/name" share stats
+    return model.split(":", 1)[0]
+
+
+def retry_after_seconds(error, attempt):
+    """How long replicate asked us to back off, exponential with jitter if it didn't say."""
+    # the python client doesn't expose the Retry-After header, but the
+    # problem detail reads "... Expected available in 8 seconds."
+    match = re.search(r"in (\d+(?:\.\d+)?) ?s", getattr(error, "detail", None) or str(error))
+    if match:
+        return min(MAX_BACKOFF, float(match.group(1)))
+    return min(MAX_BACKOFF, 2 ** attempt) * random.uniform(0.8, 1.2)
+
+
+def poll_delays(expected):
+    """Sleep schedule for polling: nap through most of the expected time, then back off."""
+    yield max(MIN_POLL_DELAY, expected * 0.7)
+    delay = max(MIN_POLL_DELAY, expected * 0.1)
+    while True:
+        yield delay
+        delay = min(MAX_POLL_DELAY, delay * 1.5)
+
+
+def prefer_wait_seconds(expected):
+    return int(min(MAX_PREFER_WAIT, max(1, expected * 2)))
+
+
+def create_prediction(client, ref, input, webhook=None, wait=None):
+    """Create a prediction for "owner/name" or "owner/name:version"."""
+    params = {}
+    if webhook:
+        params["webhook"] = webhook
+        params["webhook_events_filter"] = ["completed"]
+    if wait:
+        params["wait"] = wait
+
+    if ":" in ref:
+        version_id = ref.split(":", 1)[1]
+        return client.predictions.create(version=version_id, input=input, **params)
+    return client.models.predictions.create(model=ref, input=input, **params)
+
+
+def wait_for_prediction(prediction, expected=DEFAULT_EXPECTED_LATENCY, timeout=None, receiver=None):
+    """Block until the prediction reaches a terminal state and return it.
+
+    Raises PredictionFailed if it failed or was canceled and TimeoutError
+    (after canceling it) if it runs past timeout.  A 429 on a poll just
+    means polling slower, the prediction is still running.
+    """
+    from replicate.exceptions import ReplicateError
+
+    if timeout is None:
+        timeout = max(120.0, expected * 20)
+    deadline = time.time() + timeout
+
+    if receiver is not None:
+        delays = iter(lambda: WEBHOOK_FALLBACK_POLL_DELAY, None)
+    else:
+        delays = poll_delays(expected)
+
+    while prediction.status not in TERMINAL_STATUSES:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            try:
+                prediction.cancel()
+            except Exception:
+                pass
+            raise TimeoutError(f"Prediction {prediction.id} did not finish within {timeout:.0f}s")
+
+        delay = min(next(delays), remaining)
+        if receiver is not None:
+            payload = receiver.wait(prediction.id, delay)
+            if payload is not None and receiver.trusted:
+                # a signed webhook body is the full prediction, no need for a GET
+                prediction.status = payload["status"]
+                prediction.output = payload.get("output")
+                prediction.error = payload.get("error")
+                break
+        else:
+            time.sleep(delay)
+        for attempt in itertools.count():
+            try:
+                prediction.reload()
+                break
+            except ReplicateError as e:
+                if e.status != 429:
+                    raise
+                time.sleep(min(retry_after_seconds(e, attempt), max(0.0, deadline - time.time())))
+                if time.time() >= deadline:
+                    break
+
+    if prediction.status != "succeeded":
+        raise PredictionFailed(f"Prediction {prediction.status}: {prediction.error}")
+    return prediction
+
+
+def run_prediction(client, ref, input, receiver=None, tracker=latency_tracker, timings=None,
+                   scheduler=None, session=None):
+    """Like client.run but returns the finished prediction, its raw output is prediction.output.
+
+    With a scheduler (scheduler.py) the create waits its turn there and a 429
+    on it is retried; the wait for the result happens after the scheduler
+    has let go.  A timings dict gets "sent", when the create request went out.
+    """
+    expected = tracker.expected(ref)
+    started = None
+
+    def create():
+        nonlocal started
+        started = time.time()
+        if timings is not None:
+            timings["sent"] = started
+        if receiver is not None:
+            return create_prediction(client, ref, input, webhook=receiver.url)
+        return create_prediction(client, ref, input, wait=prefer_wait_seconds(expected))
+
+    prediction = scheduler.call(client, ref, create, session=session) if scheduler is not None else create()
+    if receiver is not None:
+        receiver.expect(prediction.id)
+
+    try:
+        wait_for_prediction(prediction, expected, receiver=receiver)
+    finally:
+        if receiver is not None:
+            receiver.forget(prediction.id)
+
+    tracker.record(ref, time.time() - started)
+    return prediction
+
+
+class WebhookReceiver:
+    """Tiny HTTP server replicate can POST completed predictions to.
+
+    Replicate needs a public URL, so public_url is whatever forwards to
+    host:port (a tunnel, reverse proxy...).  For local testing anything that
+    POSTs prediction JSON to it works.
+
+    Without a secret anyone who finds the URL can POST to it, so a webhook is
+    then only a wake-up and the prediction is reloaded from replicate before
+    its status or output is believed.
+    """
+
+    def __init__(self, public_url, host="127.0.0.1", port=0, secret=None):
+        self._payloads = {}
+        self._events = {}
+        self._lock = threading.Lock()
+        self._secret = secret
+        # payloads are only taken as the prediction when they're signed
+        self.trusted = bool(secret)
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if not receiver._valid(self.headers, body):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                receiver.deliver(payload)
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = public_url or f"http://{host}:{self.port}/"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def _valid(self, headers, body):
+        if not self._secret:
+            return True
+        from replicate.webhook import WebhookSigningSecret, Webhooks
+
+        try:
+            return Webhooks.validate(
+                headers={k.lower(): v for k, v in headers.items()},
+                body=body.decode("utf-8"),
+                secret=WebhookSigningSecret(key=self._secret),
+            )
+        except Exception:
+            return False
+
+    def _event(self, prediction_id):
+        with self._lock:
+            return self._events.setdefault(prediction_id, threading.Event())
+
+    def expect(self, prediction_id):
+        self._event(prediction_id)
+
+    def deliver(self, payload):
+        prediction_id = payload.get("id")
+        # only "completed" is asked for, anything else would just wake the waiter for nothing
+        if not prediction_id or payload.get("status") not in TERMINAL_STATUSES:
+            return
+        event = self._event(prediction_id)
+        with self._lock:
+            self._payloads[prediction_id] = payload
+        event.set()
+
+    def wait(self, prediction_id, timeout):
+        """The webhook payload for prediction_id, or None if nothing came in time."""
+        # the webhook can beat us here, deliver() keeps the payload until it's picked up
+        event = self._event(prediction_id)
+        if event.wait(timeout):
+            with self._lock:
+                event.clear()
+                return self._payloads.pop(prediction_id, None)
+        return None
+
+    def forget(self, prediction_id):
+        with self._lock:
+            self._events.pop(prediction_id, None)
+            self._payloads.pop(prediction_id, None)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_receiver = None
+_receiver_lock = threading.Lock()
+
+
+def get_webhook_receiver():
+    """The process-wide receiver, or None unless REPLICATE_WEBHOOK_URL is set."""
+    global _receiver
+    public_url = os.environ.get("REPLICATE_WEBHOOK_URL")
+    if not public_url:
+        return None
+    with _receiver_lock:
+        if _receiver is None:
+            _receiver = WebhookReceiver(
+                public_url,
+                host=os.environ.get("REPLICATE_WEBHOOK_HOST", "127.0.0.1"),
+                port=int(os.environ.get("REPLICATE_WEBHOOK_PORT", "8765")),
+                secret=os.environ.get("REPLICATE_WEBHOOK_SECRET"),
+            )
+    return _receiver
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from funcs import OUTPUT_DIR
+from output_index import get_output_index, indexed_row
+from thumbnails import THUMB_SIZE, get_thumbnail
+
+# Contact sheets: a batch of outputs as one labelled grid image.
+#
+#   python contact_sheet.py                      # newest 100 images in output/
+#   python contact_sheet.py a.png b.png --columns 2 --out sheet.jpg
+#
+# Tiles are decoded small (the cached gallery thumbnails, so a file is only
+# ever decoded at full size once) on a few threads and copied into one
+# preallocated numpy canvas; the captions are drawn in a single pass at the
+# end.  Captions come from the output index (prompt, model, seed, params).
+
+# same as the thumbnails, so tiles go straight in without another resize
+TILE_SIZE = max(THUMB_SIZE)
+CAPTION_LINES = 2
+LINE_HEIGHT = 12
+PADDING = 6
+BACKGROUND = (24, 24, 24)
+TEXT_COLOR = (225, 225, 225)
+# an empty slot (a job that failed), so the rest of the grid stays in place
+PLACEHOLDER = (48, 48, 48)
+MAX_WORKERS = 8
+# params worth a place in the caption, in this order
+CAPTION_PARAMS = ["guidance", "steps", "cfg", "safety_tolerance", "aspect_ratio"]
+
+
+def caption_for(row, path):
+    """Two short lines for a tile from its index row (None for unindexed files)."""
+    row = row or {}
+    first = row.get("prompt") or os.path.basename(path)
+    details = [row["model"]] if row.get("model") else []
+    if row.get("seed") is not None:
+        details.append(f"seed {row['seed']}")
+    try:
+        params = json.loads(row.get("params") or "{}")
+    except ValueError:
+        params = {}
+    details.extend(f"{name} {params[name]}" for name in CAPTION_PARAMS if params.get(name) is not None)
+    return [first, " · ".join(details)]
+
+
+def load_tile(path, tile_size):
+    """RGB uint8 array no bigger than tile_size on either side, None if it can't be read."""
+    try:
+        # the gallery thumbnails are already small and cached, only go to the
+        # original when the tile is bigger than they are
+        source = get_thumbnail(path) if tile_size <= max(THUMB_SIZE) else path
+        with Image.open(source) as image:
+            image.draft("RGB", (tile_size, tile_size))
+            image.thumbnail((tile_size, tile_size))
+            return np.asarray(image.convert("RGB"))
+    except Exception:
+        return None
+
+
+def _fit(text, font, width, draw):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def build_contact_sheet(paths, columns=None, tile_size=TILE_SIZE, captions=None):
+    """Compose paths into one grid, returns a PIL image.
+
+    captions is a list of line lists (one per path, None for one from the
+    output index), None reads them all from the index, [] leaves them off.
+    A None path is an empty grey tile that keeps its slot.
+    """
+    paths = list(paths)
+    if not any(paths):
+        raise ValueError("no images for the contact sheet")
+    if captions is None:
+        captions = [None] * len(paths)
+    if captions:
+        captions = [caption_for(indexed_row(path), path) if lines is None and path else lines or []
+                    for path, lines in zip(paths, captions)]
+
+    columns = columns or max(1, min(len(paths), int(np.ceil(np.sqrt(len(paths))))))
+    rows = (len(paths) + columns - 1) // columns
+    caption_height = CAPTION_LINES * LINE_HEIGHT + PADDING if captions else 0
+    cell_w = tile_size + PADDING * 2
+    cell_h = tile_size + PADDING * 2 + caption_height
+
+    canvas = np.empty((rows * cell_h, columns * cell_w, 3), dtype=np.uint8)
+    canvas[:] = BACKGROUND
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        tiles = pool.map(lambda path: load_tile(path, tile_size) if path else None, paths)
+        for i, (path, tile) in enumerate(zip(paths, tiles)):
+            if path is None:
+                top = (i // columns) * cell_h + PADDING
+                left = (i % columns) * cell_w + PADDING
+                canvas[top:top + tile_size, left:left + tile_size] = PLACEHOLDER
+                continue
+            if tile is None:
+                continue
+            h, w = tile.shape[:2]
+            top = (i // columns) * cell_h + PADDING + (tile_size - h) // 2
+            left = (i % columns) * cell_w + PADDING + (tile_size - w) // 2
+            canvas[top:top + h, left:left + w] = tile
+
+    sheet = Image.fromarray(canvas)
+    if captions:
+        draw = ImageDraw.Draw(sheet)
+        font = ImageFont.load_default()
+        for i, lines in enumerate(captions):
+            x = (i % columns) * cell_w + PADDING
+            y = (i // columns) * cell_h + PADDING + tile_size + PADDING // 2
+            for line in lines[:CAPTION_LINES]:
+                if line:
+                    draw.text((x, y), _fit(str(line), font, tile_size, draw), fill=TEXT_COLOR, font=font)
+                y += LINE_HEIGHT
+    return sheet
+
+
+def save_contact_sheet(sheet, out_path, quality=90):
+    if out_path.lower().endswith((".jpg", ".jpeg")):
+        sheet.save(out_path, quality=quality, optimize=True)
+    else:
+        sheet.save(out_path)
+    return out_path
+
+
+def recent_images(output_dir=OUTPUT_DIR, limit=100):
+    rows = get_output_index(output_dir).recent("image", limit)
+    return [row["path"] for row in rows if os.path.exists(row["path"])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make a labelled contact sheet from generated images.")
+    parser.add_argument("files", nargs="*", help="images to include (default: the newest in --output-dir)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--limit", type=int, default=100, help="how many of the newest images when no files are given")
+    parser.add_argument("--columns", type=int, default=None)
+    parser.add_argument("--tile", type=int, default=TILE_SIZE, help="tile size in pixels")
+    parser.add_argument("--no-captions", action="store_true")
+    parser.add_argument("--out", default=None, help="where to write it (default: output/contact_sheet_<timestamp>.jpg)")
+    args = parser.parse_args(argv)
+
+    paths = args.files or recent_images(args.output_dir, args.limit)
+    if not paths:
+        print("No images found.", file=sys.stderr)
+        return 1
+
+    started = time.time()
+    sheet = build_contact_sheet(paths, args.columns, args.tile, [] if args.no_captions else None)
+    # not in output/ itself, the index would pick the sheet up as a generation
+    out_path = args.out or os.path.join(args.output_dir, ".sheets", f"contact_sheet_{time.strftime('%Y%m%d_%H%M%S')}.jpg")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    save_contact_sheet(sheet, out_path)
+    print(f"{len(paths)} images -> {out_path} ({sheet.width}x{sheet.height}, {time.time() - started:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,565 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from funcs import OUTPUT_DIR, sqlite_connect
+from output_index import IMAGE_EXTENSIONS, indexed_row
+
+# Perceptual hashes of the images in output/, for "similar images" in the
+# gallery and for clearing out near-duplicates (sweeps and repeated prompts
+# make plenty).
+#
+#   python dedupe.py                        # groups of near-duplicates in output/
+#   python dedupe.py --delete               # ...and delete all but one of each
+#   python dedupe.py --similar output/x.png
+#
+# Each image is decoded small (JPEGs straight at a fraction of full size) on
+# a process pool, one process per core, and hashed in batches with numpy: a
+# 64-bit pHash (low frequencies of a 32x32 DCT) to find matches and a 64-bit
+# dHash (neighbouring pixel gradients) to confirm them.  Hashes are kept in
+# output/.cache/hashes.db by (mtime, size) so only new files are ever hashed;
+# engine.py and the Qwen page queue each new image as it's saved.
+#
+# Lookups don't compare against every hash: the pHash is split into four
+# 16-bit chunks, and two hashes within d bits of each other must agree to
+# within d // 4 bits on at least one chunk.  Each chunk is a table of 65536
+# buckets, so a lookup is a few bucket reads plus an exact check of the
+# handful of candidates, which keeps a full dedupe of 100k images to seconds.
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+# pHash bits that may differ for two images to count as near-duplicates
+DEFAULT_DISTANCE = 6
+# and the dHash has to agree to within this as well
+DHASH_DISTANCE = 10
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+# more than this many bits per chunk and checking every hash is cheaper
+MAX_CHUNK_RADIUS = 3
+# candidate pairs looked at in one go when grouping, bounds the memory it takes
+PAIR_BLOCK = 1 << 20
+# files per task sent to a worker process
+BATCH = 64
+# a full rescan of output/ at most this often
+SCAN_INTERVAL = 60
+
+
+def _dct_matrix(n=DCT_SIZE):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def _pack(bits):
+    """(N, 64) bools -> (N,) uint64, first bit highest."""
+    import numpy as np
+
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def hash_arrays(small, wide):
+    """(dhash, phash) uint64 arrays for a batch of greyscale images.
+
+    small is (N, 32, 32) for the pHash, wide (N, 8, 9) for the dHash.
+    """
+    import numpy as np
+
+    count = len(small)
+    dhash = wide[:, :, 1:] > wide[:, :, :-1]
+    dct = _dct_matrix()
+    low = (dct @ small @ dct.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(count, -1)
+    # the DC term is just the brightness, leave it out of the median
+    phash = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(dhash.reshape(count, -1)), _pack(phash)
+
+
+def load_small(path):
+    """The two small greyscale arrays hash_arrays wants, decoded as small as the format allows."""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft("RGB", (DCT_SIZE * 2, DCT_SIZE * 2))
+        image.thumbnail((DCT_SIZE * 2, DCT_SIZE * 2), Image.BOX, reducing_gap=2.0)
+        grey = image.convert("L")
+    return (np.asarray(grey.resize((DCT_SIZE, DCT_SIZE), Image.BOX), dtype=np.float32),
+            np.asarray(grey.resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX), dtype=np.int16))
+
+
+def hash_files(paths):
+    """Worker: [(path, mtime_ns, size, dhash, phash)] for the readable files in paths.
+
+    Hashes come back as signed 64-bit ints, which is what sqlite can store.
+    """
+    import numpy as np
+
+    found, small, wide = [], [], []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            pixels, gradient = load_small(path)
+        except Exception:
+            # unreadable or half written, the next scan tries again
+            continue
+        found.append((path, stat.st_mtime_ns, stat.st_size))
+        small.append(pixels)
+        wide.append(gradient)
+    if not found:
+        return []
+    dhash, phash = hash_arrays(np.stack(small), np.stack(wide))
+    return [(path, mtime_ns, size, int(d), int(p))
+            for (path, mtime_ns, size), d, p in zip(found, dhash.view(np.int64), phash.view(np.int64))]
+
+
+def _flip_masks(radius):
+    """Every CHUNK_BITS-bit XOR mask with at most radius bits set."""
+    import numpy as np
+
+    masks = [0]
+    for bits in range(1, radius + 1):
+        masks.extend(sum(1 << bit for bit in combo) for combo in itertools.combinations(range(CHUNK_BITS), bits))
+    return np.array(masks, dtype=np.int64)
+
+
+class MultiIndex:
+    """Hamming distance lookups over a fixed set of pHashes (and their dHashes)."""
+
+    def __init__(self, paths, dhashes, phashes):
+        self.paths = paths
+        self.dhashes = dhashes
+        self.phashes = phashes
+        self._position = {path: i for i, path in enumerate(paths)}
+        self._chunks = _chunk_tables(phashes)
+        self._masks = {}
+
+    def _flip_masks(self, radius):
+        if radius not in self._masks:
+            self._masks[radius] = _flip_masks(radius)
+        return self._masks[radius]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def position(self, path):
+        return self._position.get(os.path.normpath(path))
+
+    def _candidates(self, phash, max_distance):
+        import numpy as np
+
+        radius = max_distance // CHUNKS
+        if radius > MAX_CHUNK_RADIUS:
+            return np.arange(len(self.paths))
+        masks = self._flip_masks(radius)
+        found = []
+        for chunk, (_, order, starts, lengths) in enumerate(self._chunks):
+            wanted = ((int(phash) >> (chunk * CHUNK_BITS)) & ((1 << CHUNK_BITS) - 1)) ^ masks
+            found.extend(order[starts[value]:starts[value] + lengths[value]] for value in wanted if lengths[value])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def query(self, dhash, phash, max_distance=DEFAULT_DISTANCE, max_dhash_distance=DHASH_DISTANCE):
+        """(positions, pHash distances) of everything within max_distance, nearest first."""
+        import numpy as np
+
+        ids = self._candidates(phash, max_distance)
+        distance = np.bitwise_count(self.phashes[ids] ^ np.uint64(phash)).astype(np.int64)
+        keep = (distance <= max_distance) & (np.bitwise_count(self.dhashes[ids] ^ np.uint64(dhash)) <= max_dhash_distance)
+        ids, distance = ids[keep], distance[keep]
+        order = np.argsort(distance, kind="stable")
+        return ids[order], distance[order]
+
+    def groups(self, max_distance=DEFAULT_DISTANCE, max_dhash_distance=DHASH_DISTANCE):
+        """Lists of positions that are near-duplicates of each other (transitively), 2+ per group.
+
+        The same chunk trick as query(), done for all hashes at once.  Exact
+        repeats (the same pHash and dHash: black NSFW-filtered outputs, frames
+        of a sweep) are folded into one entry first, so they cost nothing.
+        Then per chunk and flip mask every hash's bucket is looked up and
+        expanded into candidate pairs a block at a time (never more than
+        PAIR_BLOCK at once), each pair only for the first chunk that finds it,
+        and the close ones merged into a union-find as they turn up.  Buckets
+        whose members have all been merged already are skipped, so a big
+        cluster of near-identical images is only expanded until it's joined.
+        """
+        import numpy as np
+
+        if not len(self.paths):
+            return []
+        keys, inverse = np.unique(np.stack([self.phashes, self.dhashes], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        phashes, dhashes = keys[:, 0], keys[:, 1]
+        labels = np.arange(len(keys))
+
+        radius = max_distance // CHUNKS
+        if radius > MAX_CHUNK_RADIUS:
+            # too far for the chunks to help, every unique hash against every other (still a block at a time)
+            chunks = [(np.zeros(len(keys), dtype=np.int64), np.arange(len(keys)),
+                       np.zeros(1, dtype=np.int64), np.array([len(keys)]))]
+            masks = np.zeros(1, dtype=np.int64)
+            limit = None
+        else:
+            chunks = _chunk_tables(phashes)
+            masks = self._flip_masks(radius)
+            limit = radius
+
+        positions = np.arange(len(keys))
+        for chunk, (values, order, bucket_starts, bucket_lengths) in enumerate(chunks):
+            for mask in masks:
+                wanted = values ^ mask
+                starts = bucket_starts[wanted]
+                done = 0
+                while done < len(keys):
+                    # a bucket whose members are all in one set already has nothing to add to it
+                    roots = _roots(labels, positions[done:])
+                    lengths = np.where(_settled(labels, order, bucket_starts, bucket_lengths)[wanted[done:]] == roots,
+                                       0, bucket_lengths[wanted[done:]])
+                    # as many hashes as fit in one block (at least one, a single bucket is at most len(keys))
+                    stop = done + max(1, int(np.searchsorted(np.cumsum(lengths), PAIR_BLOCK, "right")))
+                    span = lengths[:stop - done]
+                    first = np.repeat(np.arange(done, stop), span)
+                    step = np.arange(len(first)) - np.repeat(np.cumsum(span) - span, span)
+                    second = order[np.repeat(starts[done:stop], span) + step]
+                    done = stop
+                    keep = first < second
+                    first, second = first[keep], second[keep]
+                    difference = phashes[first] ^ phashes[second]
+                    if limit is not None:
+                        # an earlier chunk already found (and checked) this pair
+                        for earlier in range(chunk):
+                            part = (difference >> np.uint64(earlier * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)
+                            keep = np.bitwise_count(part) > limit
+                            first, second, difference = first[keep], second[keep], difference[keep]
+                    close = ((np.bitwise_count(difference) <= max_distance)
+                             & (np.bitwise_count(dhashes[first] ^ dhashes[second]) <= max_dhash_distance))
+                    _merge(labels, first[close], second[close])
+
+        # back from unique hashes to positions
+        roots = _roots(labels, np.arange(len(keys)))[inverse]
+        order = np.argsort(roots, kind="stable")
+        boundaries = np.flatnonzero(np.diff(roots[order])) + 1
+        return [group.tolist() for group in np.split(order, boundaries) if len(group) > 1]
+
+
+def _chunk_tables(phashes):
+    """Per chunk: every hash's chunk value, positions sorted by it, and where each of the 65536 values starts / how many."""
+    import numpy as np
+
+    tables = []
+    for chunk in range(CHUNKS):
+        values = ((phashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)).astype(np.int64)
+        order = np.argsort(values, kind="stable")
+        lengths = np.bincount(values, minlength=1 << CHUNK_BITS)
+        tables.append((values, order, np.cumsum(lengths) - lengths, lengths))
+    return tables
+
+
+def _settled(labels, order, bucket_starts, bucket_lengths):
+    """Per bucket: the set all its members are in, -1 if they're in more than one (or it's empty)."""
+    import numpy as np
+
+    settled = np.full(len(bucket_lengths), -1, dtype=np.int64)
+    used = np.flatnonzero(bucket_lengths)
+    if len(used):
+        roots = _roots(labels, order)
+        lowest = np.minimum.reduceat(roots, bucket_starts[used])
+        highest = np.maximum.reduceat(roots, bucket_starts[used])
+        settled[used] = np.where(lowest == highest, lowest, -1)
+    return settled
+
+
+def _roots(labels, ids):
+    while True:
+        parents = labels[ids]
+        if (parents == ids).all():
+            return ids
+        ids = parents
+
+
+def _merge(labels, first, second):
+    """Union-find on a numpy parent array: joins the sets of each (first, second) pair."""
+    import numpy as np
+
+    while len(first):
+        a, b = _roots(labels, first), _roots(labels, second)
+        apart = a != b
+        if not apart.any():
+            return
+        a, b = a[apart], b[apart]
+        # the bigger root points at the smaller; where several pairs share a
+        # root only one write wins, the loop picks the rest up next time round
+        np.minimum.at(labels, np.maximum(a, b), np.minimum(a, b))
+        first, second = first[apart], second[apart]
+
+
+class HashIndex:
+    def __init__(self, output_dir=OUTPUT_DIR, db_path=None, workers=None):
+        self.output_dir = output_dir
+        self.db_path = db_path or os.path.join(output_dir, ".cache", "hashes.db")
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._lookup = None
+        self._lookup_version = None
+        # new files one at a time, in this process (download_image)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-hash")
+        self._syncing = False
+        self._last_sync = 0
+        self._pending = 0
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,"
+                " dhash INTEGER NOT NULL, phash INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite_connect(self.db_path)
+
+    def _store(self, rows):
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", rows)
+
+    def add(self, path):
+        """Hash one file now, True if it could be read."""
+        rows = hash_files([os.path.normpath(path)])
+        self._store(rows)
+        return bool(rows)
+
+    def submit(self, path):
+        """Hash a freshly saved file in the background."""
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._add, path)
+
+    def _add(self, path):
+        try:
+            self.add(path)
+        except (OSError, sqlite3.Error):
+            pass
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stale(self):
+        """(files to hash, rows whose file is gone): new or changed images, and deleted ones."""
+        with self._connect() as db:
+            seen = {row[0]: (row[1], row[2]) for row in db.execute("SELECT path, mtime_ns, size FROM hashes")}
+        found, on_disk = [], set()
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.normpath(entry.path)
+                on_disk.add(path)
+                stat = entry.stat()
+                if stat.st_size and seen.get(path) != (stat.st_mtime_ns, stat.st_size):
+                    found.append(path)
+        return found, [path for path in seen if path not in on_disk]
+
+    def sync(self, progress=None):
+        """Hash everything new on a process pool, drop rows for deleted files.  Returns (hashed, dropped)."""
+        paths, gone = self.stale()
+        if gone:
+            with self._connect() as db:
+                db.executemany("DELETE FROM hashes WHERE path = ?", [(path,) for path in gone])
+        hashed = 0
+        with self._lock:
+            self._pending += len(paths)
+        try:
+            batches = [paths[i:i + BATCH] for i in range(0, len(paths), BATCH)]
+            if len(batches) == 1 or self.workers == 1:
+                results = map(hash_files, batches)
+                for batch, rows in zip(batches, results):
+                    hashed += self._finished(batch, rows, progress)
+            elif batches:
+                # spawn, not fork: the apps have threads (and sqlite handles) a fork would copy mid-flight
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(batches)), mp_context=context) as pool:
+                    futures = {pool.submit(hash_files, batch): batch for batch in batches}
+                    for future in as_completed(futures):
+                        hashed += self._finished(futures[future], future.result(), progress)
+        finally:
+            with self._lock:
+                self._pending -= len(paths) - hashed
+        return hashed, len(gone)
+
+    def _finished(self, batch, rows, progress):
+        self._store(rows)
+        with self._lock:
+            self._pending -= len(rows)
+        if progress:
+            progress(len(rows), len(batch))
+        return len(rows)
+
+    def sync_in_background(self):
+        """Start a sync on a thread unless one is running or ran in the last SCAN_INTERVAL seconds."""
+        with self._lock:
+            if self._syncing or time.time() - self._last_sync < SCAN_INTERVAL:
+                return
+            self._syncing = True
+            self._last_sync = time.time()
+        threading.Thread(target=self._sync_thread, daemon=True, name="image-hash-sync").start()
+
+    def _sync_thread(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"hashing output images failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    def pending(self):
+        """Files still waiting to be hashed (a sync that is still listing the folder counts as one)."""
+        with self._lock:
+            return self._pending + (1 if self._syncing and not self._pending else 0)
+
+    def lookup(self):
+        """A MultiIndex over everything hashed so far, rebuilt only when the table changed."""
+        import numpy as np
+
+        with self._connect() as db:
+            version = db.execute("SELECT COUNT(*), MAX(rowid) FROM hashes").fetchone()
+            with self._lock:
+                if self._lookup is not None and version == self._lookup_version:
+                    return self._lookup
+            rows = db.execute("SELECT path, dhash, phash FROM hashes").fetchall()
+        paths = [row[0] for row in rows]
+        dhashes = np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64)
+        phashes = np.array([row[2] for row in rows], dtype=np.int64).view(np.uint64)
+        lookup = MultiIndex(paths, dhashes, phashes)
+        with self._lock:
+            self._lookup, self._lookup_version = lookup, version
+        return lookup
+
+    def similar(self, path, max_distance=DEFAULT_DISTANCE, limit=None):
+        """[(path, distance)] of the images that look like path, nearest first, path itself left out."""
+        lookup = self.lookup()
+        position = lookup.position(path)
+        if position is None:
+            # not hashed yet
+            if not self.add(path):
+                return []
+            lookup = self.lookup()
+            position = lookup.position(path)
+        ids, distances = lookup.query(lookup.dhashes[position], lookup.phashes[position], max_distance)
+        found = [(lookup.paths[i], int(distance)) for i, distance in zip(ids, distances)
+                 if i != position and os.path.exists(lookup.paths[i])]
+        return found[:limit] if limit else found
+
+    def duplicates(self, max_distance=DEFAULT_DISTANCE, user=None):
+        """[{"keep": path, "remove": [paths], "users": [owners]}] for every group of near-duplicates, biggest savings first.
+
+        With a user only that user's files are ever removed (the one kept can be anyone's)."""
+        lookup = self.lookup()
+        plan = []
+        for group in lookup.groups(max_distance):
+            rows = [(lookup.paths[i], indexed_row(lookup.paths[i], self.output_dir)) for i in group]
+            rows = [(path, row) for path, row in rows if os.path.exists(path)]
+            if len(rows) < 2:
+                continue
+            rows.sort(key=_keep_order)
+            keep, remove = rows[0], rows[1:]
+            # pinned files are never removed, even as someone's duplicate
+            remove = [(path, row) for path, row in remove if not (row and row["pinned"])
+                      and (user is None or (row and row["user"]) == user)]
+            plan.append({
+                "keep": keep[0],
+                "remove": [path for path, row in remove],
+                "users": sorted({(row and row["user"]) or "" for path, row in remove}),
+            })
+        plan = [entry for entry in plan if entry["remove"]]
+        for entry in plan:
+            entry["bytes"] = sum(os.path.getsize(path) for path in entry["remove"])
+        plan.sort(key=lambda entry: -entry["bytes"])
+        return plan
+
+
+def _keep_order(item):
+    """Which of a group stays: pinned first, then the most pixels, then the oldest (the original)."""
+    path, row = item
+    row = row or {}
+    pixels = (row.get("width") or 0) * (row.get("height") or 0)
+    created = row.get("created") or os.path.getmtime(path)
+    return (not row.get("pinned"), -pixels, created)
+
+
+def remove_duplicates(plan, output_dir=OUTPUT_DIR):
+    """Delete the "remove" files of a duplicates() plan, returns (files, bytes) freed."""
+    from retention import delete_output
+
+    deleted = freed = 0
+    for entry in plan:
+        # the plan may be a while old, never leave a group without the one it keeps
+        if not os.path.exists(entry["keep"]):
+            continue
+        for path in entry["remove"]:
+            size = delete_output(path, output_dir)
+            if size is not None:
+                deleted += 1
+                freed += size
+    return deleted, freed
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_hash_index(output_dir=OUTPUT_DIR):
+    key = os.path.abspath(output_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = HashIndex(output_dir)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find (and delete) near-duplicate images by perceptual hash.")
+    parser.add_argument("folders", nargs="*", default=[OUTPUT_DIR])
+    parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE,
+                        help=f"pHash bits that may differ (of 64, default {DEFAULT_DISTANCE})")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    parser.add_argument("--similar", default=None, help="list the images that look like this one and stop")
+    parser.add_argument("--user", default=None, help="only delete this user's files (the output index's user column)")
+    parser.add_argument("--delete", action="store_true",
+                        help="delete all but one of each group (without it the duplicates are only listed)")
+    args = parser.parse_args(argv)
+
+    for folder in args.folders:
+        index = HashIndex(folder, workers=args.workers)
+        started = time.time()
+        hashed, dropped = index.sync()
+        print(f"{folder}: hashed {hashed} new image(s), dropped {dropped} deleted in {time.time() - started:.1f}s")
+
+        if args.similar:
+            for path, distance in index.similar(args.similar, args.distance):
+                print(f"  {distance:2d}  {path}")
+            continue
+
+        started = time.time()
+        plan = index.duplicates(args.distance, args.user)
+        for entry in plan:
+            print(f"  keep {entry['keep']}")
+            for path in entry["remove"]:
+                print(f"    - {path}")
+        total = sum(entry["bytes"] for entry in plan)
+        print(f"{folder}: {len(plan)} group(s), {sum(len(entry['remove']) for entry in plan)} duplicate(s), "
+              f"{total / 1024 / 1024:.1f} MB, found in {time.time() - started:.1f}s")
+        if args.delete and plan:
+            deleted, freed = remove_duplicates(plan, folder)
+            print(f"{folder}: deleted {deleted} file(s), freed {freed / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
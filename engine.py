@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from completion import get_webhook_receiver, run_prediction
+from dedupe import get_hash_index
+from funcs import OUTPUT_DIR, reserve_output_path, wait_for_image, download_image
+from output_index import get_output_index
+from result_cache import cache_key
+from scheduler import get_scheduler
+from staging import get_upload_staging
+from telemetry import prediction_times, record_generation
+
+# Concurrent generation engine.  A job is a plain dict:
+#
+#   {
+#       "api_end_point": "black-forest-labs/flux-schnell",
+#       "input": {...},            # the input_dict sent to replicate
+#       "prompt": "a cat",         # used for the output filename
+#       "fileext": "png",
+#       "image_path": None,        # optional local file sent as input["image"],
+#                                  # uploaded once per content hash (staging.py)
+#       "output_dir": "output",
+#       "session": None,           # who asked, for fair scheduling between sessions
+#       "user": None,              # logged-in user, for per-user quotas (retention.py)
+#   }
+#
+# funcs.make_job builds these the same way app.py does.
+#
+# Each job runs the prediction (see completion.py) -> wait_for_image ->
+# download_image on its own worker thread, so a batch takes about as long as
+# its slowest prediction.
+#
+# run_video_job is the same for one WAN image-to-video generation
+# (wan22_test2.py, benchmark.py).
+
+DEFAULT_MAX_WORKERS = 4
+VIDEO_MODEL = "WAN 2.2 I2V Fast"
+
+
+def first_output(output):
+    if isinstance(output, list) and len(output) > 0:
+        output = output[0]
+    return output
+
+
+def output_url(output):
+    """URL of a prediction output, a plain string or a FileOutput depending on the client version."""
+    output = first_output(output)
+    if isinstance(output, str):
+        return output
+    url = getattr(output, "url", None)
+    if url is None:
+        return str(output)
+    return url() if callable(url) else url
+
+
+def run_job(client, job, cache=None):
+    """Run a single job start to finish, returns a result dict (never raises).
+
+    With a result_cache.ResultCache, seeded jobs that have been run before
+    come straight back from output/ with result["cached"] set.
+    """
+    result = {"job": job, "filepath": None, "error": None, "cached": False, "started": time.time()}
+    timings = {"submitted": result["started"]}
+    prediction = None
+    try:
+        input_dict = dict(job["input"])
+        image_path = job.get("image_path")
+
+        key = cache_key(job["api_end_point"], input_dict, image_path) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached:
+                result["filepath"] = cached
+                result["cached"] = True
+                result["elapsed"] = time.time() - result["started"]
+                return result
+
+        receiver = get_webhook_receiver()
+        if image_path:
+            input_dict["image"] = get_upload_staging().remote_url(client, image_path)
+        # the create waits for a rate limit token / free model slot and retries 429s (scheduler.py)
+        prediction = run_prediction(client, job["api_end_point"], input_dict, receiver=receiver, timings=timings,
+                                    scheduler=get_scheduler(), session=job.get("session"))
+        timings["returned"] = time.time()
+        timings.update(prediction_times(prediction))
+        result["predict_seconds"] = timings["returned"] - result["started"]
+
+        output = first_output(prediction.output)
+        result["output"] = str(output)
+
+        if wait_for_image(output):
+            timings["ready"] = time.time()
+            output_dir = job.get("output_dir") or OUTPUT_DIR
+            result["filepath"] = download_image(output, job["prompt"], job.get("fileext", "png"), output_dir, timings)
+            result["download_seconds"] = timings["saved"] - timings["ready"]
+            record_output(job, result, prediction.id, output_dir)
+            # perceptual hash for "similar images", on a background thread (dedupe.py)
+            get_hash_index(output_dir).submit(result["filepath"])
+            if key is not None:
+                cache.put(key, result["filepath"])
+        else:
+            result["error"] = "Timed out waiting for image to be ready."
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["elapsed"] = time.time() - result["started"]
+    result["timings"] = timings
+    record_generation(
+        model=job.get("model_version"), endpoint=job["api_end_point"],
+        prediction_id=getattr(prediction, "id", None),
+        status="failed" if result["error"] else "succeeded", error=result["error"], **timings
+    )
+    return result
+
+
+def record_output(job, result, prediction_id, output_dir=OUTPUT_DIR):
+    try:
+        get_output_index(output_dir).record(
+            result["filepath"],
+            model=job.get("model_version"),
+            endpoint=job["api_end_point"],
+            prompt=job["prompt"],
+            params=job["input"],
+            seed=job["input"].get("seed"),
+            prediction_id=prediction_id,
+            predict_seconds=result.get("predict_seconds"),
+            download_seconds=result.get("download_seconds"),
+            total_seconds=time.time() - result["started"],
+            user=job.get("user"),
+        )
+    except sqlite3.Error:
+        # the image is saved either way, a rebuild will pick it up
+        pass
+
+
+def run_video_job(client, model_ref, image_path, prompt, output_dir=OUTPUT_DIR, session=None, user=None):
+    """Generate one video from the image at image_path, returns a result dict (never raises).
+
+    The video is streamed to output_dir/generated_video_<timestamp>.mp4 and
+    recorded in the output index and telemetry, like run_job does for images.
+    """
+    import transport  # requests, only once there's something to download
+
+    result = {"filepath": None, "video_url": None, "prediction_id": None, "bytes": 0, "error": None,
+              "started": time.time()}
+    timings = {"submitted": result["started"]}
+    try:
+        input_dict = {
+            # uploaded once, the URL is reused for more videos from the same image
+            "image": get_upload_staging().remote_url(client, image_path),
+            "prompt": prompt,
+            "disable_safety_checker": True,
+        }
+        prediction = run_prediction(client, model_ref, input_dict, receiver=get_webhook_receiver(), timings=timings,
+                                    scheduler=get_scheduler(), session=session)
+        result["prediction_id"] = prediction.id
+        timings["returned"] = timings["ready"] = time.time()
+        timings.update(prediction_times(prediction))
+        result["video_url"] = output_url(prediction.output)
+
+        filepath = reserve_output_path(output_dir, f"generated_video_{time.strftime('%Y%m%d_%H%M%S')}", "mp4")
+        try:
+            result["bytes"] = transport.download_to_file(result["video_url"], filepath, timings=timings)[0]
+        except Exception:
+            os.remove(filepath)
+            raise
+        timings["saved"] = time.time()
+        result["filepath"] = filepath
+        try:
+            get_output_index(output_dir).record(filepath, model=VIDEO_MODEL, endpoint=model_ref, prompt=prompt,
+                                                params=input_dict, prediction_id=prediction.id, user=user)
+        except sqlite3.Error:
+            # same as record_output, a rebuild picks it up
+            pass
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["elapsed"] = time.time() - result["started"]
+    result["timings"] = timings
+    record_generation(
+        model=VIDEO_MODEL, endpoint=model_ref, prediction_id=result["prediction_id"],
+        status="failed" if result["error"] else "succeeded", error=result["error"], **timings
+    )
+    return result
+
+
+def generate_many(client, jobs, max_workers=DEFAULT_MAX_WORKERS, cache=None):
+    """Run jobs concurrently and yield (index, result) as each one finishes."""
+    if not jobs:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+        futures = {pool.submit(run_job, client, job, cache): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def generate_all(client, jobs, max_workers=DEFAULT_MAX_WORKERS, cache=None):
+    """Like generate_many but returns the results in job order."""
+    results = [None] * len(jobs)
+    for i, result in generate_many(client, jobs, max_workers, cache):
+        results[i] = result
+    return results
@@ -2,4 +2,4 @@
 @echo off
 cd /d c:\somepath\somefolder
 call .venv\Scripts\activate.bat
-streamlit run app.py --server.port 8501
\ No newline at end of file
+streamlit run studio.py --server.port 8501
\ No newline at end of file
@@ -0,0 +1,228 @@
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the bits of replicate's API this project uses, for
+# benchmark.py (and poking at things without spending credits):
+#
+#   POST /v1/models/<owner>/<name>/predictions   create (honours Prefer: wait=N)
+#   POST /v1/predictions                         create by version
+#   GET  /v1/predictions/<id>                    reload
+#   POST /v1/predictions/<id>/cancel
+#   POST /v1/files                               upload, returns urls["get"]
+#   GET/HEAD /outputs/<id>.<ext>                 file delivery, supports Range
+#
+# Point a client at it with replicate.Client(api_token="fake", base_url=server.url).
+# Predictions sit in "starting" for queue_delay, "processing" for
+# predict_delay and then succeed (or fail, error_rate of the time) with
+# output_size bytes of output (video_size for video models).
+
+DEFAULT_CHUNK = 64 * 1024
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeReplicate:
+    def __init__(self, host="127.0.0.1", port=0, queue_delay=0.5, predict_delay=2.0, output_size=1024 * 1024,
+                 error_rate=0.0, jitter=0.1, seed=None, video_size=None):
+        self.queue_delay = queue_delay
+        self.predict_delay = predict_delay
+        self.output_size = output_size
+        self.video_size = video_size or output_size
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._predictions = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                fake._handle(self, "POST")
+
+            def do_GET(self):
+                fake._handle(self, "GET")
+
+            def do_HEAD(self):
+                fake._handle(self, "HEAD")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _delay(self, seconds):
+        return max(0.0, seconds * self._random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _create(self, model, version, body):
+        now = time.time()
+        with self._lock:
+            prediction_id = f"fake{next(self._ids)}"
+            started = now + self._delay(self.queue_delay)
+            record = {
+                "id": prediction_id,
+                "model": model or "fake/model",
+                "version": version or "",
+                "input": body.get("input") or {},
+                "created": now,
+                "started": started,
+                "completed": started + self._delay(self.predict_delay),
+                "fails": self._random.random() < self.error_rate,
+                "canceled": None,
+                "ext": "mp4" if "video" in (model or "") else (body.get("input") or {}).get("output_format", "png"),
+            }
+            self._predictions[prediction_id] = record
+        return record
+
+    def _json(self, record):
+        now = time.time()
+        data = {
+            "id": record["id"], "model": record["model"], "version": record["version"], "input": record["input"],
+            "logs": "", "error": None, "output": None, "metrics": {}, "created_at": iso(record["created"]),
+            "started_at": None, "completed_at": None,
+            "urls": {"get": f"{self.url}/v1/predictions/{record['id']}", "cancel": f"{self.url}/v1/predictions/{record['id']}/cancel"},
+        }
+        if record["canceled"] is not None:
+            data.update(status="canceled", completed_at=iso(record["canceled"]))
+        elif now < record["started"]:
+            data["status"] = "starting"
+        elif now < record["completed"]:
+            data.update(status="processing", started_at=iso(record["started"]))
+        elif record["fails"]:
+            data.update(status="failed", error="fake failure", started_at=iso(record["started"]),
+                        completed_at=iso(record["completed"]))
+        else:
+            data.update(status="succeeded", started_at=iso(record["started"]), completed_at=iso(record["completed"]),
+                        output=[f"{self.url}/outputs/{record['id']}.{record['ext']}"])
+        return data
+
+    def _handle(self, handler, method):
+        with self._lock:
+            self.requests += 1
+        path = handler.path.split("?", 1)[0]
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length) if length else b""
+
+        if method == "POST" and path == "/v1/files":
+            return self._send_json(handler, 201, {
+                "id": f"file{next(self._ids)}", "name": "upload", "content_type": "application/octet-stream",
+                "size": len(raw), "etag": "", "checksums": {}, "metadata": {}, "created_at": iso(time.time()),
+                "expires_at": iso(time.time() + 24 * 3600), "urls": {"get": f"{self.url}/uploads/{len(raw)}"},
+            })
+
+        if method == "POST" and path.startswith("/v1/") and path.endswith("/predictions"):
+            body = json.loads(raw or b"{}")
+            model = path[len("/v1/models/"):-len("/predictions")] if path.startswith("/v1/models/") else None
+            record = self._create(model, body.get("version"), body)
+            wait = _prefer_wait(handler.headers.get("Prefer"))
+            if wait:
+                # like replicate, hold the response until it's done or the wait runs out
+                time.sleep(max(0.0, min(record["completed"], record["created"] + wait) - time.time()))
+            return self._send_json(handler, 201, self._json(record))
+
+        if path.startswith("/v1/predictions/"):
+            parts = path.split("/")
+            record = self._predictions.get(parts[3])
+            if record is None:
+                return self._send_json(handler, 404, {"detail": "Not found", "status": 404})
+            if method == "POST" and len(parts) > 4 and parts[4] == "cancel":
+                if record["canceled"] is None and time.time() < record["completed"]:
+                    record["canceled"] = time.time()
+            return self._send_json(handler, 200, self._json(record))
+
+        if path.startswith("/outputs/") and method in ("GET", "HEAD"):
+            return self._send_file(handler, method)
+
+        return self._send_json(handler, 404, {"detail": "Not found", "status": 404})
+
+    def _send_json(self, handler, status, data):
+        body = json.dumps(data).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _send_file(self, handler, method):
+        size = self.video_size if handler.path.endswith(".mp4") else self.output_size
+        start = 0
+        status = 200
+        range_header = handler.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            start = int(range_header[6:].split("-", 1)[0] or 0)
+            status = 206
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(size - start))
+        if status == 206:
+            handler.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        handler.end_headers()
+        if method == "HEAD":
+            return
+        chunk = b"\0" * DEFAULT_CHUNK
+        remaining = size - start
+        try:
+            while remaining > 0:
+                n = min(remaining, DEFAULT_CHUNK)
+                handler.wfile.write(chunk[:n])
+                remaining -= n
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def _prefer_wait(value):
+    if not value or not value.startswith("wait"):
+        return None
+    if "=" in value:
+        try:
+            return float(value.split("=", 1)[1])
+        except ValueError:
+            return None
+    return 60.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake replicate API.")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--queue-delay", type=float, default=0.5)
+    parser.add_argument("--predict-delay", type=float, default=2.0)
+    parser.add_argument("--output-size", type=int, default=1024 * 1024, help="bytes per output file")
+    parser.add_argument("--video-size", type=int, default=None, help="bytes per video, defaults to --output-size")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    fake = FakeReplicate(port=args.port, queue_delay=args.queue_delay, predict_delay=args.predict_delay,
+                         output_size=args.output_size, error_rate=args.error_rate, video_size=args.video_size)
+    print(f"fake replicate on {fake.url} (REPLICATE_BASE_URL={fake.url})")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import math
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from model_registry import IMAGE_MODELS, get_model
+
+# Shared helpers for the streamlit apps.  Nothing in here should touch st.*
+# so the same code can run from worker threads.
+
+OUTPUT_DIR = "output"
+
+MODEL_VERSIONS = IMAGE_MODELS
+ASPECT_RATIOS = ["1:1", "16:9", "9:16", "21:9", "2:3", "3:2", "4:5", "5:4", "9:21"]
+
+
+def get_api_end_point(model_version):
+    """Model ref to run: owner/name, or owner/name:version when the registry pins a version id."""
+    model = get_model(model_version)
+    version = model.get("version")
+    if version and version != "latest":
+        return f"{model['endpoint']}:{version}"
+    return model["endpoint"]
+
+
+def get_image_format(model_version):
+    return get_model(model_version)["output_format"]
+
+
+def get_file_ext(model_version):
+    return get_model(model_version)["fileext"]
+
+
+def build_input_dict(model_version, prompt, aspect_ratio="1:1", seed=None, guidance=None, steps=None,
+                     safety_checker=None, safety_tolerance=None, cfg=None):
+    """Build the input sent to replicate, None params are left out."""
+    input_dict = {
+        "prompt": prompt,
+        "aspect_ratio": aspect_ratio,
+        "output_format": get_image_format(model_version),
+        "output_quality": 100  # output_quality, note this is ignored if output is .png
+    }
+
+    if seed is not None:
+        input_dict["seed"] = seed
+
+    if guidance is not None:
+        input_dict["guidance"] = guidance
+
+    if steps is not None:
+        input_dict["steps"] = steps
+
+    if safety_checker is not None:
+        input_dict["disable_safety_checker"] = safety_checker == "On"
+
+    if safety_tolerance is not None:
+        input_dict["safety_tolerance"] = safety_tolerance
+
+    if cfg is not None:
+        input_dict["cfg"] = cfg
+
+    # todo, make this toggles
+    if model_version.startswith("Qwen"):
+        input_dict["output_quality"] = 100
+        input_dict["disable_safety_checker"] = True
+
+    return input_dict
+
+
+def make_job(model_version, prompt, image_path=None, output_dir=OUTPUT_DIR, api_end_point=None, **params):
+    """A job dict for engine.py built the same way app.py builds its requests."""
+    return {
+        "model_version": model_version,
+        "api_end_point": api_end_point or get_api_end_point(model_version),
+        "input": build_input_dict(model_version, prompt, **params),
+        "prompt": prompt,
+        "fileext": get_file_ext(model_version),
+        "image_path": image_path,
+        "output_dir": output_dir,
+    }
+
+
+@contextmanager
+def sqlite_connect(path):
+    """Short-lived sqlite connection, commits on success, always closes.
+
+    One connection per call keeps the little sqlite stores safe to use from
+    worker threads and several streamlit sessions at once.
+    """
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def parse_timestamp(value):
+    """Replicate's ISO 8601 timestamps ("...Z") as epoch seconds, None if missing/unparseable."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def clean_prompt_for_filename(prompt):
+    clean_prompt = re.sub(r'[^a-zA-Z0-9 ]', '', prompt)
+    clean_prompt = clean_prompt.strip()[:30]
+    clean_prompt = clean_prompt.replace(' ', '_')
+    return clean_prompt
+
+
+def wait_for_image(url, timeout=20, delay=0.25, max_delay=2):
+    # once the prediction has succeeded the file is normally already there, so
+    # probe straight away and only back off if the CDN hasn't caught up yet
+    import transport
+
+    deadline = time.time() + timeout
+    while True:
+        response = transport.head(url)
+        if response.status_code == 200:
+            return True
+        if time.time() + delay > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(max_delay, delay * 2)
+
+
+def reserve_output_path(output_dir, stem, fileext):
+    """Claim a free output_dir/stem.fileext (adding _1, _2...) and return it.
+
+    The empty file is created with O_EXCL so concurrent downloads landing in
+    the same second with the same prompt never pick the same name.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+
+    counter = 0
+    while True:
+        suffix = f"_{counter}" if counter else ""
+        filepath = os.path.join(output_dir, f"{stem}{suffix}.{fileext}")
+        try:
+            os.close(os.open(filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return filepath
+        except FileExistsError:
+            counter += 1
+
+
+# leading bytes of the image formats we might get back, the extension a model
+# is registered with (or a URL ends in) isn't always what's in the file
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+]
+
+
+def sniff_image_format(path):
+    """"png", "jpg", "webp", "avif", "gif", "bmp", "tiff" from the file's magic bytes, None if unknown."""
+    with open(path, "rb") as f:
+        header = f.read(32)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"avif", b"avis"):
+        return "avif"
+    for signature, name in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return name
+    return None
+
+
+def download_image(url, prompt, fileext="png", output_dir=OUTPUT_DIR, timings=None, stem=None):
+    """Save the image at url into output_dir and return the filepath.
+
+    The extension follows what actually arrived (magic bytes), fileext is
+    only the guess.  A timings dict gets first_byte, saved and bytes filled in.
+    The file is named <timestamp>_<prompt> unless a stem is given.
+    """
+    import transport
+
+    if stem is None:
+        stem = f"{int(time.time())}_{clean_prompt_for_filename(prompt)}"
+    filepath = reserve_output_path(output_dir, stem, fileext)
+
+    try:
+        # streamed to a .part file and renamed over the reserved name when complete
+        transport.download_to_file(url, filepath, timings=timings)
+    except Exception:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
+
+    actual = sniff_image_format(filepath)
+    if actual and actual != fileext.lower().replace("jpeg", "jpg"):
+        renamed = reserve_output_path(output_dir, stem, actual)
+        os.replace(filepath, renamed)
+        filepath = renamed
+    if timings is not None:
+        timings["saved"] = time.time()
+    return filepath
@@ -0,0 +1,146 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from staging import get_upload_staging
+
+# Shrinks source images before they're uploaded.  Phone photos come in at
+# 20-40 MB but the edit/video models work at far lower resolution, so we
+# downsample to the model's max_input_side (model_registry), drop EXIF/ICC
+# metadata and re-encode.  The work runs on a small thread pool so the page
+# keeps rendering while a big photo is being decoded.
+
+JPEG_QUALITY = 92
+WEBP_QUALITY = 90
+MAX_WORKERS = 2
+# futures kept around for reruns, oldest dropped first
+MAX_PENDING = 32
+# image.info keys that carry EXIF (GPS included), ICC or XMP, by format
+METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp")
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="input-prep")
+_futures = OrderedDict()
+_futures_lock = threading.Lock()
+
+
+def prepare_image(data, max_side):
+    """Downsample/re-encode image bytes.  Returns (bytes, ext, info).
+
+    The original bytes come back untouched only if re-encoding wouldn't
+    make them smaller, the image is already within max_side and there's no
+    EXIF, ICC or XMP in it to strip.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        original_size = image.size
+        has_metadata = any(image.info.get(key) for key in METADATA_KEYS)
+        if max_side:
+            # JPEGs decode straight at a reduced scale when they're far too big
+            image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)  # keep the orientation once EXIF is gone
+        if max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        out = io.BytesIO()
+        if has_alpha:
+            image.convert("RGBA").save(out, format="WEBP", quality=WEBP_QUALITY, method=4)
+            ext = ".webp"
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+            ext = ".jpg"
+        new_size = image.size
+
+    prepared = out.getvalue()
+    info = {
+        "original_bytes": len(data),
+        "original_size": original_size,
+        "bytes": len(prepared),
+        "size": new_size,
+        "stripped": has_metadata,
+    }
+    if len(prepared) >= len(data) and new_size == original_size and not has_metadata:
+        info["bytes"] = len(data)
+        return data, None, info
+    return prepared, ext, info
+
+
+def prepare_and_stage(data, filename, max_side):
+    """prepare_image then stage the result, returns (staged path, info)."""
+    try:
+        prepared, ext, info = prepare_image(data, max_side)
+    except (OSError, Image.DecompressionBombError):
+        # PIL can't read it, let the model have a go with the original
+        prepared, ext = data, None
+        info = {"original_bytes": len(data), "bytes": len(data)}
+    if ext:
+        filename = os.path.splitext(filename)[0] + ext
+    return get_upload_staging().stage(prepared, filename), info
+
+
+def submit_upload(uploaded_file, max_side):
+    """Start preparing a streamlit UploadedFile in the background, returns a Future.
+
+    Reruns with the same upload get the same Future back instead of redoing
+    the work.  The Future's result is (staged path, info).
+    """
+    key = (getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}", max_side)
+    return _submit(key, lambda: prepare_and_stage(uploaded_file.getvalue(), uploaded_file.name, max_side))
+
+
+def submit_path(path, max_side):
+    """submit_upload for a file already on disk (an output handed over from another page)."""
+    key = (f"{os.path.abspath(path)}:{os.stat(path).st_mtime_ns}", max_side)
+    return _submit(key, lambda: _prepare_path(path, max_side))
+
+
+def _prepare_path(path, max_side):
+    with open(path, "rb") as f:
+        data = f.read()
+    return prepare_and_stage(data, os.path.basename(path), max_side)
+
+
+def _submit(key, fn):
+    with _futures_lock:
+        future = _futures.get(key)
+        if future is None:
+            future = _executor.submit(fn)
+            _futures[key] = future
+            while len(_futures) > MAX_PENDING:
+                _futures.popitem(last=False)
+        else:
+            _futures.move_to_end(key)
+    return future
+
+
+def describe_upload(future):
+    """One line for the page about where the background preparation is at."""
+    if not future.done():
+        return "Optimising the image for upload in the background..."
+    if future.exception() is not None:
+        return f"Couldn't prepare the image: {future.exception()}"
+    return describe_savings(future.result()[1])
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def describe_savings(info):
+    saved = info["original_bytes"] - info["bytes"]
+    if saved <= 0 and info.get("stripped"):
+        return f"Metadata (EXIF/GPS, ICC, XMP) stripped for upload ({format_bytes(info['bytes'])})"
+    if saved <= 0:
+        return f"Image sent as is ({format_bytes(info['bytes'])})"
+    ow, oh = info["original_size"]
+    w, h = info["size"]
+    percent = 100.0 * saved / info["original_bytes"]
+    return (f"Optimised for upload: {ow}x{oh} → {w}x{h}, "
+            f"{format_bytes(info['original_bytes'])} → {format_bytes(info['bytes'])} ({percent:.0f}% smaller)")
@@ -0,0 +1,123 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import run_job
+
+# In-process job queue for the UI.  Generate puts jobs here and returns
+# straight away; the worker pool runs them with engine.run_job and the page
+# polls jobs() to show what's queued/running/done.  Entries are plain dicts:
+#
+#   {"id": 3, "session": "...", "job": {...}, "status": "queued",
+#    "submitted": t, "started": None, "finished": None, "result": None}
+#
+# status goes queued -> running -> done / failed.  Each session can cap how
+# many of its own jobs run at once (the batch slider in app.py); jobs over
+# the cap wait in the queue rather than holding a worker.
+
+MAX_WORKERS = 16
+# finished entries kept around for the status panel, oldest dropped first
+MAX_FINISHED = 200
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueue:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generate")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = OrderedDict()
+        self._pending = deque()
+        self._running = {}
+
+    def submit(self, session, client, job, cache=None, max_concurrent=None):
+        """Queue a job for session, returns its id."""
+        entry = {
+            "id": next(self._ids),
+            "session": session,
+            "job": dict(job, session=session),
+            "status": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "result": None,
+        }
+        with self._lock:
+            self._jobs[entry["id"]] = entry
+            self._pending.append((entry, client, cache, max_concurrent))
+            self._dispatch()
+        return entry["id"]
+
+    def _dispatch(self):
+        # called with the lock held, starts whatever is under its session's cap
+        waiting = deque()
+        while self._pending:
+            item = self._pending.popleft()
+            entry, client, cache, max_concurrent = item
+            running = self._running.get(entry["session"], 0)
+            if max_concurrent and running >= max_concurrent:
+                waiting.append(item)
+                continue
+            self._running[entry["session"]] = running + 1
+            self._executor.submit(self._run, entry, client, cache)
+        self._pending = waiting
+
+    def _run(self, entry, client, cache):
+        with self._lock:
+            entry["status"] = "running"
+            entry["started"] = time.time()
+        error = "stopped unexpectedly"
+        result = None
+        try:
+            result = run_job(client, entry["job"], cache)
+        except Exception as e:
+            # run_job catches the generation's own errors, this is anything after (telemetry, index...)
+            error = str(e)
+        finally:
+            if result is None:
+                result = {"job": entry["job"], "filepath": None, "error": error, "cached": False,
+                          "started": entry["started"], "elapsed": time.time() - entry["started"]}
+            with self._lock:
+                # never leave the entry "running" or the session's slot taken, whatever happened
+                entry["result"] = result
+                entry["status"] = "failed" if result["error"] else "done"
+                entry["finished"] = time.time()
+                self._running[entry["session"]] -= 1
+                self._prune()
+                self._dispatch()
+
+    def _prune(self):
+        finished = [job_id for job_id, entry in self._jobs.items() if entry["status"] not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self._jobs[job_id]
+
+    def jobs(self, session):
+        """Copies of session's entries, newest first."""
+        with self._lock:
+            return [dict(entry) for entry in reversed(self._jobs.values()) if entry["session"] == session]
+
+    def active_count(self, session):
+        with self._lock:
+            return sum(1 for entry in self._jobs.values()
+                       if entry["session"] == session and entry["status"] in ACTIVE_STATUSES)
+
+    def clear_finished(self, session):
+        with self._lock:
+            for job_id in [job_id for job_id, entry in self._jobs.items()
+                           if entry["session"] == session and entry["status"] not in ACTIVE_STATUSES]:
+                del self._jobs[job_id]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+    return _queue
@@ -0,0 +1,295 @@
+import hashlib
+import mimetypes
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from funcs import OUTPUT_DIR
+
+# Saved outputs (videos mostly) go to the browser straight from disk.  Out of
+# the box streamlit's st.video(path) and st.download_button(data=...) read the
+# whole file into the Python process and keep it there for the session, which
+# for a few 50 MB videos per session adds up fast.
+#
+# By default use_disk_media_storage() (startup.init_process) swaps streamlit's
+# in-memory media storage for DiskMediaFileStorage: a file handed over by path
+# is only registered, and streamlit's own /media endpoint streams it from the
+# file a chunk at a time (Range requests included, so seeking works).  Same
+# origin and same unguessable URLs as before, nothing extra to expose.
+# media_download_url() is the download link for a file served that way.
+# MEDIA_IN_MEMORY=1 keeps streamlit's storage as it was, the fallback.
+#
+# MediaServer is the other option, a separate little server for when the
+# files should bypass the streamlit process altogether.  Files go out with
+# socket.sendfile (zero copy where the OS has it) and support Range requests.
+# Only files inside the output folder with a media extension are served, but
+# to anyone who can reach the port: there's no login, so put it behind
+# whatever guards the app.  It's off unless MEDIA_SERVER_URL is set to the
+# address the *browser* uses to reach MEDIA_SERVER_HOST:MEDIA_SERVER_PORT
+# (http://localhost:8766 when browser and app are on one machine, a proxied
+# URL on a shared server).
+
+# bytes read per write when streamlit streams a file from disk
+DISK_CHUNK_SIZE = 256 * 1024
+MEDIA_EXTENSIONS = (".mp4", ".webm", ".mov", ".webp", ".png", ".jpg", ".jpeg", ".avif", ".gif")
+# the only hidden folders worth serving (made-for-display derivatives)
+PUBLIC_HIDDEN_DIRS = (".thumbs", ".previews", ".sheets")
+
+
+class MediaServer:
+    def __init__(self, root=OUTPUT_DIR, host="127.0.0.1", port=0, public_url=None):
+        self.root = os.path.realpath(root)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._serve(self, send_body=True)
+
+            def do_HEAD(self):
+                server._serve(self, send_body=False)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = (public_url or f"http://{'localhost' if host in ('127.0.0.1', '0.0.0.0') else host}:{self.port}").rstrip("/")
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url_for(self, path, download=False):
+        """Browser URL for a file under the output folder."""
+        relative = os.path.relpath(os.path.realpath(path), self.root).replace(os.sep, "/")
+        url = f"{self.url}/{urllib.parse.quote(relative)}"
+        return url + "?download=1" if download else url
+
+    def _resolve(self, url_path):
+        relative = urllib.parse.unquote(url_path.lstrip("/"))
+        path = os.path.realpath(os.path.join(self.root, relative))
+        # nothing outside the output folder, no dotfiles (.index.db, .cache/...)
+        if os.path.commonpath([path, self.root]) != self.root or not path.lower().endswith(MEDIA_EXTENSIONS):
+            return None
+        if any(part.startswith(".") and part not in PUBLIC_HIDDEN_DIRS
+               for part in os.path.relpath(path, self.root).split(os.sep)):
+            return None
+        return path if os.path.isfile(path) else None
+
+    def _serve(self, handler, send_body):
+        url_path, _, query = handler.path.partition("?")
+        path = self._resolve(url_path)
+        if path is None:
+            handler.send_response(404)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        byte_range = _parse_range(handler.headers.get("Range"), size)
+        if byte_range == "invalid":
+            handler.send_response(416)
+            handler.send_header("Content-Range", f"bytes */{size}")
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        if byte_range:
+            start, end = byte_range
+            status = 206
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        handler.send_header("Content-Length", str(end - start + 1))
+        handler.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if "download=1" in query.split("&"):
+            handler.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        handler.end_headers()
+        if not send_body or size == 0:
+            return
+        try:
+            with open(path, "rb") as file:
+                handler.wfile.flush()
+                handler.connection.sendfile(file, start, end - start + 1)
+        except (BrokenPipeError, ConnectionResetError):
+            # the player hung up (seeking, closed tab), nothing to do
+            pass
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _parse_range(value, size):
+    """(start, end) for a single "bytes=a-b" range, None for no/unsupported ranges, "invalid" if unsatisfiable."""
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    first, _, last = value[6:].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            # suffix range, the last N bytes
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+_media_server = None
+_media_server_lock = threading.Lock()
+
+
+def get_media_server():
+    """The process-wide server, started on first use, None unless MEDIA_SERVER_URL is set."""
+    global _media_server
+    public_url = os.environ.get("MEDIA_SERVER_URL")
+    if not public_url:
+        return None
+    with _media_server_lock:
+        if _media_server is None:
+            _media_server = MediaServer(host=os.environ.get("MEDIA_SERVER_HOST", "127.0.0.1"),
+                                        port=int(os.environ.get("MEDIA_SERVER_PORT", "8766")),
+                                        public_url=public_url)
+    return _media_server
+
+
+_storage_classes = None
+_storage_lock = threading.Lock()
+
+
+class FileRange:
+    """Bytes start:end of a file, read a chunk at a time when iterated.
+
+    Stands in for the bytes streamlit's media handler expects: it takes len()
+    and slices of it (Range requests) and writes out whatever iterating it gives.
+    """
+
+    def __init__(self, path, start, end):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError("FileRange only takes plain slices")
+        start, end, _ = item.indices(len(self))
+        return FileRange(self.path, self.start + start, self.start + max(start, end))
+
+    def __iter__(self):
+        with open(self.path, "rb") as file:
+            file.seek(self.start)
+            remaining = len(self)
+            while remaining > 0:
+                chunk = file.read(min(DISK_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _disk_media_storage_class():
+    # streamlit is only imported once a page actually runs, and the class is
+    # built once so isinstance checks hold
+    global _storage_classes
+    with _storage_lock:
+        if _storage_classes is None:
+            _storage_classes = _make_disk_media_storage_class()
+    return _storage_classes
+
+
+def _make_disk_media_storage_class():
+    from streamlit.runtime.media_file_storage import MediaFileStorageError
+    from streamlit.runtime.memory_media_file_storage import MemoryFile, MemoryMediaFileStorage
+
+    class DiskMediaFileStorage(MemoryMediaFileStorage):
+        """streamlit's media storage, except files given by path stay on disk (bytes still go in memory)."""
+
+        def load_and_get_id(self, path_or_data, mimetype, kind, filename=None):
+            if not isinstance(path_or_data, str):
+                return super().load_and_get_id(path_or_data, mimetype, kind, filename)
+            try:
+                stat = os.stat(path_or_data)
+            except OSError as e:
+                raise MediaFileStorageError(f"Error opening '{path_or_data}'") from e
+            # a changed file is a new id, browsers never get a stale copy
+            key = f"{os.path.realpath(path_or_data)}\0{stat.st_mtime_ns}\0{stat.st_size}\0{mimetype}\0{filename}"
+            file_id = hashlib.sha224(key.encode("utf-8")).hexdigest()
+            if file_id not in self._files_by_id:
+                content = FileRange(path_or_data, 0, stat.st_size)
+                self._files_by_id[file_id] = MemoryFile(content=content, mimetype=mimetype, kind=kind, filename=filename)
+            return file_id
+
+        def get_stats(self):
+            from streamlit.runtime.stats import CacheStat, group_stats
+
+            # only what's actually held in memory
+            return group_stats([
+                CacheStat(category_name="st_memory_media_file_storage", cache_name="", byte_length=len(file.content))
+                for file in self._files_by_id.copy().values() if not isinstance(file.content, FileRange)
+            ])
+
+    return DiskMediaFileStorage, MemoryMediaFileStorage
+
+
+def use_disk_media_storage():
+    """Have streamlit serve files passed by path from disk (see the top of the file), True once it does."""
+    if os.environ.get("MEDIA_IN_MEMORY"):
+        return False
+    from streamlit import runtime
+    from streamlit.web.server.media_file_handler import MediaFileHandler
+
+    if not runtime.exists():
+        return False
+    manager = runtime.get_instance().media_file_mgr
+    disk_class, memory_class = _disk_media_storage_class()
+    with _storage_lock:
+        storage = manager._storage
+        if isinstance(storage, disk_class):
+            return True
+        if type(storage) is not memory_class:
+            # someone configured their own storage, leave it be
+            return False
+        disk = disk_class(storage._media_endpoint)
+        # the same dict, URLs already handed out keep working
+        disk._files_by_id = storage._files_by_id
+        manager._storage = disk
+        MediaFileHandler.initialize_storage(disk)
+    return True
+
+
+def media_source(path):
+    """What to give st.video / st.image for a saved file: a media server URL, or the path itself."""
+    media_server = get_media_server()
+    return media_server.url_for(path) if media_server else path
+
+
+def media_download_url(path):
+    """A link that downloads path from disk, None if only st.download_button (in memory) can do it."""
+    media_server = get_media_server()
+    if media_server:
+        return media_server.url_for(path, download=True)
+    from streamlit import config, runtime
+
+    if not runtime.exists() or not use_disk_media_storage():
+        return None
+    url = runtime.get_instance().media_file_mgr.add(
+        path, mimetypes.guess_type(path)[0] or "application/octet-stream", f"download:{os.path.abspath(path)}",
+        file_name=os.path.basename(path), is_for_static_download=True,
+    )
+    # relative to the server root, the page itself can be anywhere below it
+    base = (config.get_option("server.baseUrlPath") or "").strip("/")
+    return f"/{base}{url}" if base else url
@@ -0,0 +1,209 @@
+# Everything the apps need to know about each replicate model in one place:
+# endpoint, optional pinned version, the parameter widgets, output format and
+# roughly how long a prediction takes.  app.py draws its sliders from
+# "params", funcs.build_input_dict / get_api_end_point read the rest.
+#
+# "version" pins a model version ("owner/name:version" is then what gets run).
+# Leave it None to run whatever replicate currently serves for the model - that
+# goes through the models endpoint and needs no version lookup.  "latest"
+# looks the current version up once per token and sticks with it for the
+# life of the process (see clients.resolve_model_ref).
+#
+# "max_concurrent" caps how many predictions of the model the whole process
+# has in flight at once (scheduler.py).
+#
+# "max_input_side" is the longest side source images are shrunk to before
+# upload on models that take one (input_prep.py).
+
+GUIDANCE_DEV = {
+    "name": "guidance", "widget": "slider",
+    "label": "Guidance - How closely the model follows your prompt, 1-10, default 3.5",
+    "min_value": 0.0, "max_value": 10.0, "value": 3.5, "step": 0.01, "format": "%.2f",
+}
+GUIDANCE_PRO = {
+    "name": "guidance", "widget": "slider",
+    "label": "Guidance - How closely the model follows your prompt, 2-5, default is 3",
+    "min_value": 2.0, "max_value": 5.0, "value": 3.0, "step": 0.01, "format": "%.2f",
+}
+STEPS_PRO = {
+    "name": "steps", "widget": "slider",
+    "label": "Steps - Quality/Detail of render, 1-100, default 25.",
+    "min_value": 1, "max_value": 100, "value": 25, "step": 1,
+}
+# shown but never sent, same as it always has been ("sent": False keeps it out of sweeps)
+INTERVAL_PRO = {
+    "name": "interval", "widget": "slider", "sent": False,
+    "label": "Interval - Variance of the image, 4 being the most varied, default is 1",
+    "min_value": 1.0, "max_value": 4.0, "value": 1.0, "step": 0.01, "format": "%.2f",
+}
+SAFETY_TOLERANCE_PRO = {
+    "name": "safety_tolerance", "widget": "slider",
+    "label": "Safety Tolerance - 1 to 5, 5 being least restrictive, 1 default (3 on default on here)",
+    "min_value": 1, "max_value": 5, "value": 3, "step": 1,
+}
+# "On" here means the checker is disabled, the labels are flipped by format_func
+SAFETY_CHECKER = {
+    "name": "safety_checker", "widget": "radio",
+    "label": "Safety Checker - Turn on model NSFW checking",
+    "options": ["Off", "On"], "index": 1,
+    "option_labels": {"On": "Disabled", "Off": "Enabled"},
+}
+
+MODELS = {
+    "Qwen-Image": {
+        "endpoint": "wavespeedai/qwen-image",  # "qwen/qwen-image" - wavespeedai less restrictive
+        "version": None,
+        "kind": "image",
+        "output_format": "png",
+        "fileext": "png",
+        "expected_latency": 6.0,
+        "max_concurrent": 8,
+        "accepts_image": True,
+        "max_input_side": 1536,
+        "seed": False,
+        "params": [],
+    },
+    "Qwen-Image-Edit": {
+        "endpoint": "qwen/qwen-image-edit",
+        "version": None,
+        "kind": "image",
+        "output_format": "png",
+        "fileext": "png",
+        "expected_latency": 8.0,
+        "max_concurrent": 8,
+        "accepts_image": True,
+        "max_input_side": 1536,
+        "seed": False,
+        "params": [],
+    },
+    "schnell": {
+        "endpoint": "black-forest-labs/flux-schnell",
+        "version": None,
+        "kind": "image",
+        "output_format": "jpg",
+        "fileext": "png",
+        "expected_latency": 1.5,
+        "max_concurrent": 16,
+        "accepts_image": False,
+        "seed": True,
+        "params": [SAFETY_CHECKER],
+    },
+    "dev": {
+        "endpoint": "black-forest-labs/flux-dev",
+        "version": None,
+        "kind": "image",
+        "output_format": "jpg",
+        "fileext": "png",
+        "expected_latency": 4.0,
+        "max_concurrent": 16,
+        "accepts_image": False,
+        "seed": True,
+        "params": [GUIDANCE_DEV, SAFETY_CHECKER],
+    },
+    "pro": {
+        "endpoint": "black-forest-labs/flux-pro",
+        "version": None,
+        "kind": "image",
+        "output_format": "jpg",
+        "fileext": "png",
+        "expected_latency": 8.0,
+        "max_concurrent": 8,
+        "accepts_image": False,
+        "seed": True,
+        "params": [GUIDANCE_PRO, STEPS_PRO, INTERVAL_PRO, SAFETY_TOLERANCE_PRO],
+    },
+    "1.1-pro": {
+        "endpoint": "black-forest-labs/flux-1.1-pro",
+        "version": None,
+        "kind": "image",
+        "output_format": "jpg",
+        "fileext": "png",
+        "expected_latency": 6.0,
+        "max_concurrent": 8,
+        "accepts_image": False,
+        "seed": True,
+        "params": [GUIDANCE_PRO, STEPS_PRO, INTERVAL_PRO, SAFETY_TOLERANCE_PRO],
+    },
+    "SD 3.5 Large Turbo": {
+        "endpoint": "stability-ai/stable-diffusion-3.5-large-turbo",
+        "version": None,
+        "kind": "image",
+        "output_format": "jpg",
+        "fileext": "png",
+        "expected_latency": 6.0,
+        "max_concurrent": 8,
+        "accepts_image": False,
+        "seed": True,
+        "params": [
+            {
+                "name": "cfg", "widget": "slider",
+                "label": "CFG - Similarity to prompt, 0-20, default is 0 ",
+                "min_value": 1.00, "max_value": 20.00, "value": 1.00, "step": .05,
+            },
+            {
+                "name": "steps", "widget": "slider",
+                "label": "Steps - Quality/Detail of render, 1-10, default 4.",
+                "min_value": 1, "max_value": 10, "value": 4, "step": 1,
+            },
+        ],
+    },
+    "SD 3.5 Large": {
+        "endpoint": "stability-ai/stable-diffusion-3.5-large",
+        "version": None,
+        "kind": "image",
+        "output_format": "jpg",
+        "fileext": "png",
+        "expected_latency": 25.0,
+        "max_concurrent": 4,
+        "accepts_image": False,
+        "seed": True,
+        "params": [
+            {
+                "name": "cfg", "widget": "slider",
+                "label": "CFG - Similarity to prompt, 0-20, default is 3.5 ",
+                "min_value": 0.0, "max_value": 20.0, "value": 3.5, "step": .5,
+            },
+            {
+                "name": "steps", "widget": "slider",
+                "label": "Steps - Quality/Detail of render, 1-50, default 35.",
+                "min_value": 1, "max_value": 50, "value": 35, "step": 1,
+            },
+        ],
+    },
+    "WAN 2.2 I2V Fast": {
+        "endpoint": "wan-video/wan-2.2-i2v-fast",
+        "version": None,
+        "kind": "video",
+        "output_format": "mp4",
+        "fileext": "mp4",
+        "expected_latency": 90.0,
+        "max_concurrent": 2,
+        "accepts_image": True,
+        "max_input_side": 1280,
+        "seed": False,
+        "params": [],
+    },
+}
+
+# what app.py offers, in this order
+IMAGE_MODELS = [name for name, model in MODELS.items() if model["kind"] == "image"]
+
+
+def get_model(model_version):
+    """Registry entry by display name, anything unknown is treated as a flux model."""
+    model = MODELS.get(model_version)
+    if model is None:
+        model = dict(MODELS["schnell"], endpoint=f"black-forest-labs/flux-{model_version}")
+    return model
+
+
+def find_by_endpoint(endpoint):
+    endpoint = endpoint.split(":", 1)[0]
+    for name, model in MODELS.items():
+        if model["endpoint"] == endpoint:
+            return name, model
+    return None, None
+
+
+def expected_latencies():
+    return {model["endpoint"]: model["expected_latency"] for model in MODELS.values()}
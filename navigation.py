@@ -0,0 +1,46 @@
+import streamlit as st
+
+# The pages of the combined app (streamlit run studio.py) and handing an
+# image from one page to the next.
+#
+# All pages run in one process, so they already share everything built as a
+# process-wide singleton: the HTTP pool (transport), replicate clients
+# (clients), output index, upload staging, job queue, scheduler, telemetry
+# and preview extractor.  Per-browser state (session_id, the image being
+# handed over) lives in st.session_state, which every page of a session sees.
+#
+# Each page still runs on its own with "streamlit run <page>.py", the
+# hand-over buttons just don't show then.
+
+PAGES = [
+    ("app.py", "Image Generator", "🖼️"),
+    ("qwen_test.py", "Image Editor", "🎨"),
+    ("wan22_test2.py", "Video Generator", "🎬"),
+    ("perf_dashboard.py", "Performance", "⏱️"),
+]
+EDIT_PAGE = "qwen_test.py"
+VIDEO_PAGE = "wan22_test2.py"
+
+
+def build_pages():
+    return [st.Page(path, title=title, icon=icon, default=(i == 0)) for i, (path, title, icon) in enumerate(PAGES)]
+
+
+def in_studio():
+    """True when running as a page of studio.py (st.switch_page only works there)."""
+    return st.session_state.get("studio", False)
+
+
+def send_image(path, page):
+    """Open page with path as its source image."""
+    st.session_state.source_image = path
+    st.switch_page(page)
+
+
+def source_image():
+    """The image handed over from another page, None if there isn't one."""
+    return st.session_state.get("source_image")
+
+
+def clear_source_image():
+    st.session_state.source_image = None
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from funcs import OUTPUT_DIR, sqlite_connect
+
+# SQLite index of everything saved to output/.  Rows are written when a file
+# is saved, so the galleries and file lists are queries instead of listing
+# the folder and stat-ing every file on each rerun, and the prompt / model /
+# params that made a file aren't lost once it's on disk.
+#
+# Folders from before the index existed (or files copied in by hand) are
+# picked up with:
+#
+#   python output_index.py --rebuild
+
+INDEX_NAME = ".index.db"
+IMAGE_EXTENSIONS = ('.webp', '.png', '.jpg', '.jpeg', '.avif')
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov')
+
+COLUMNS = [
+    "path", "filename", "kind", "model", "endpoint", "prompt", "params", "seed", "prediction_id",
+    "bytes", "width", "height", "created", "predict_seconds", "download_seconds", "total_seconds", "user",
+]
+# added after the first release, ALTERed into older index files on open.
+# pinned / accessed are kept out of COLUMNS, record() doesn't touch them
+ADDED_COLUMNS = [("user", "TEXT"), ("pinned", "INTEGER NOT NULL DEFAULT 0"), ("accessed", "REAL")]
+
+
+def file_kind(path):
+    lower = path.lower()
+    if lower.endswith(IMAGE_EXTENSIONS):
+        return "image"
+    if lower.endswith(VIDEO_EXTENSIONS):
+        return "video"
+    return None
+
+
+def image_size(path):
+    # only reads the header
+    try:
+        from PIL import Image
+
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None, None
+
+
+class OutputIndex:
+    def __init__(self, output_dir=OUTPUT_DIR):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, INDEX_NAME)
+        os.makedirs(output_dir, exist_ok=True)
+        self.is_new = not os.path.exists(self.path)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                " id INTEGER PRIMARY KEY,"
+                " path TEXT NOT NULL UNIQUE, filename TEXT NOT NULL, kind TEXT NOT NULL,"
+                " model TEXT, endpoint TEXT, prompt TEXT, params TEXT, seed INTEGER, prediction_id TEXT,"
+                " bytes INTEGER, width INTEGER, height INTEGER, created REAL NOT NULL,"
+                " predict_seconds REAL, download_seconds REAL, total_seconds REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS outputs_kind_created ON outputs (kind, created)")
+            db.execute("CREATE INDEX IF NOT EXISTS outputs_model ON outputs (model)")
+            existing = {row[1] for row in db.execute("PRAGMA table_info(outputs)")}
+            for name, declaration in ADDED_COLUMNS:
+                if name not in existing:
+                    db.execute(f"ALTER TABLE outputs ADD COLUMN {name} {declaration}")
+            db.execute("CREATE INDEX IF NOT EXISTS outputs_user ON outputs (user)")
+
+    def _connect(self):
+        return sqlite_connect(self.path)
+
+    def record(self, path, **fields):
+        """Add or update the row for path, size/dimensions are filled in from the file.
+
+        An existing row keeps its id, pinned and accessed, only COLUMNS are written."""
+        row = {name: fields.get(name) for name in COLUMNS}
+        row["path"] = os.path.normpath(path)
+        row["filename"] = os.path.basename(path)
+        row["kind"] = fields.get("kind") or file_kind(path) or "other"
+        if isinstance(row["params"], dict):
+            # the image input is an open file handle, not worth keeping
+            row["params"] = json.dumps({k: v for k, v in row["params"].items() if k != "image"}, default=str)
+        if row["bytes"] is None:
+            row["bytes"] = os.path.getsize(path)
+        if row["kind"] == "image" and row["width"] is None:
+            row["width"], row["height"] = image_size(path)
+        if row["created"] is None:
+            row["created"] = time.time()
+
+        with self._connect() as db:
+            # not INSERT OR REPLACE, that deletes the old row first and a re-record would unpin the file
+            db.execute(
+                f"INSERT INTO outputs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+                f" ON CONFLICT(path) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in COLUMNS[1:])}",
+                [row[name] for name in COLUMNS],
+            )
+
+    def move(self, old_path, new_path):
+        """The file at old_path now lives at new_path (recompressed, renamed), metadata stays."""
+        with self._connect() as db:
+            moved = db.execute(
+                "UPDATE outputs SET path = ?, filename = ?, bytes = ? WHERE path = ?",
+                (os.path.normpath(new_path), os.path.basename(new_path), os.path.getsize(new_path),
+                 os.path.normpath(old_path)),
+            ).rowcount
+        if not moved:
+            self.record(new_path)
+
+    def remove(self, path):
+        with self._connect() as db:
+            db.execute("DELETE FROM outputs WHERE path = ?", (os.path.normpath(path),))
+
+    def get(self, path):
+        with self._connect() as db:
+            db.row_factory = _dict_row
+            return db.execute("SELECT * FROM outputs WHERE path = ?", (os.path.normpath(path),)).fetchone()
+
+    def count(self, kind=None):
+        with self._connect() as db:
+            if kind:
+                return db.execute("SELECT COUNT(*) FROM outputs WHERE kind = ?", (kind,)).fetchone()[0]
+            return db.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def recent(self, kind=None, limit=50, offset=0):
+        """Newest rows first, as dicts."""
+        with self._connect() as db:
+            db.row_factory = _dict_row
+            if kind:
+                return db.execute(
+                    "SELECT * FROM outputs WHERE kind = ? ORDER BY created DESC LIMIT ? OFFSET ?",
+                    (kind, limit, offset),
+                ).fetchall()
+            return db.execute(
+                "SELECT * FROM outputs ORDER BY created DESC LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+
+    def pin(self, path, pinned=True):
+        """Pinned files are never removed by retention.py."""
+        with self._connect() as db:
+            db.execute("UPDATE outputs SET pinned = ? WHERE path = ?", (int(bool(pinned)), os.path.normpath(path)))
+
+    def touch(self, paths, when=None):
+        """Mark paths as just looked at (the galleries call this for what they show)."""
+        when = when or time.time()
+        with self._connect() as db:
+            db.executemany("UPDATE outputs SET accessed = ? WHERE path = ?",
+                           [(when, os.path.normpath(path)) for path in paths])
+
+    def usage(self, user=None):
+        """(files, bytes) in the index, for one user if given."""
+        with self._connect() as db:
+            if user is not None:
+                row = db.execute("SELECT COUNT(*), SUM(bytes) FROM outputs WHERE user = ?", (user,)).fetchone()
+            else:
+                row = db.execute("SELECT COUNT(*), SUM(bytes) FROM outputs").fetchone()
+        return row[0], row[1] or 0
+
+    def usage_by_user(self):
+        """{user: (files, bytes)} for files that have a user."""
+        with self._connect() as db:
+            return {user: (files, total or 0) for user, files, total in db.execute(
+                "SELECT user, COUNT(*), SUM(bytes) FROM outputs WHERE user IS NOT NULL GROUP BY user")}
+
+    def eviction_order(self, user=None, by_access=True, before=None, limit=500, offset=0):
+        """Unpinned rows, least recently used (or oldest) first, created before `before`."""
+        order = "COALESCE(accessed, created)" if by_access else "created"
+        where = ["pinned = 0"]
+        args = []
+        if user is not None:
+            where.append("user = ?")
+            args.append(user)
+        if before is not None:
+            where.append("created < ?")
+            args.append(before)
+        with self._connect() as db:
+            db.row_factory = _dict_row
+            return db.execute(
+                f"SELECT * FROM outputs WHERE {' AND '.join(where)} ORDER BY {order}, id LIMIT ? OFFSET ?",
+                args + [limit, offset],
+            ).fetchall()
+
+    def rebuild(self):
+        """Sync the index with the folder: add unindexed files, drop rows for missing ones.
+
+        Rows that already exist keep their metadata.  Returns (added, removed).
+        """
+        with self._connect() as db:
+            indexed = {row[0] for row in db.execute("SELECT path FROM outputs")}
+
+        on_disk = set()
+        added = 0
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or file_kind(entry.name) is None:
+                    continue
+                path = os.path.normpath(entry.path)
+                on_disk.add(path)
+                if path in indexed:
+                    continue
+                stat = entry.stat()
+                if stat.st_size == 0:
+                    # a download still in progress
+                    continue
+                self.record(path, bytes=stat.st_size, created=stat.st_mtime, prompt=_prompt_from_filename(entry.name))
+                added += 1
+
+        missing = indexed - on_disk
+        if missing:
+            with self._connect() as db:
+                db.executemany("DELETE FROM outputs WHERE path = ?", [(path,) for path in missing])
+        return added, len(missing)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _prompt_from_filename(filename):
+    # {timestamp}_{clean_prompt}.ext is all that's left of the prompt for old files
+    stem = os.path.splitext(filename)[0]
+    timestamp, _, rest = stem.partition("_")
+    if timestamp.isdigit() and rest:
+        return rest.replace("_", " ")
+    return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_output_index(output_dir=OUTPUT_DIR):
+    """Process-wide index for output_dir.  A brand new index is filled from the folder once."""
+    key = os.path.abspath(output_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = OutputIndex(output_dir)
+            if index.is_new:
+                index.rebuild()
+            _indexes[key] = index
+    return index
+
+
+def get_output_index_if_exists(output_dir=OUTPUT_DIR):
+    """get_output_index for a folder that already has an index, None otherwise (never starts one in some random folder)."""
+    if not os.path.exists(os.path.join(output_dir, INDEX_NAME)):
+        return None
+    return get_output_index(output_dir)
+
+
+def indexed_row(path, output_dir=None):
+    """path's row from the index of output_dir (default: path's folder), None if there isn't one."""
+    index = get_output_index_if_exists(output_dir or os.path.dirname(path) or ".")
+    if index is None:
+        return None
+    try:
+        return index.get(path)
+    except sqlite3.Error:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the SQLite index of generated outputs.")
+    parser.add_argument("--rebuild", action="store_true", help="scan the folder and sync the index with it")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+
+    index = OutputIndex(args.output_dir)
+    if args.rebuild or index.is_new:
+        started = time.time()
+        added, removed = index.rebuild()
+        print(f"Indexed {added} new file(s), dropped {removed} missing in {time.time() - started:.1f}s")
+    print(f"{index.count('image')} image(s), {index.count('video')} video(s) in {index.path}")
+
+
+if __name__ == "__main__":
+    main()
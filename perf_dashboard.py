@@ -0,0 +1,92 @@
+import streamlit as st
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from funcs import percentile
+from telemetry import STAGES, get_telemetry, stage_durations
+
+# Where generation time goes, from the telemetry every app writes
+# (telemetry.py).  Run with: streamlit run perf_dashboard.py
+
+st.set_page_config(page_title="Generation Performance", page_icon="⏱️", layout="wide")
+
+st.title("⏱️ Generation Performance")
+st.write("Per-stage latency for every generation made from app.py, qwen_test.py, wan22_test2.py and batch.py.")
+
+RANGES = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "Last 30 days": 30 * 86400, "Everything": None}
+BUCKETS = {"Hour": "h", "Day": "D"}
+STAGE_NAMES = list(STAGES) + ["overhead"]
+STAGE_HELP = {
+    "schedule": "job start → request sent (upload, rate limiter / model slot)",
+    "queue": "replicate: created → a worker started it",
+    "predict": "replicate: started → completed",
+    "ready": "we saw it finish → output URL answered",
+    "first_byte": "output URL answered → first byte",
+    "download": "first byte → file saved",
+    "total": "job start → file saved",
+    "overhead": "round trip minus replicate's own time (network, polling / webhook lag)",
+}
+
+col1, col2 = st.columns([1, 2])
+with col1:
+    range_name = st.selectbox("Time range", list(RANGES), index=2)
+with col2:
+    models = st.multiselect("Models", get_telemetry().models(), default=[])
+
+since = time.time() - RANGES[range_name] if RANGES[range_name] else None
+rows = get_telemetry().rows(since, models or None)
+
+if not rows:
+    st.info("No generations recorded for this range yet.")
+    st.stop()
+
+succeeded = [row for row in rows if row["status"] == "succeeded"]
+failed = len(rows) - len(succeeded)
+transferred = sum(row["bytes"] or 0 for row in succeeded)
+
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("Generations", len(rows))
+m2.metric("Failed", failed, f"{100.0 * failed / len(rows):.1f}%", delta_color="inverse")
+m3.metric("p50 total", f"{percentile([stage_durations(row).get('total') for row in succeeded if row['saved']], 50) or 0:.1f}s")
+m4.metric("Transferred", f"{transferred / 1024 / 1024:.1f} MB")
+
+st.subheader("Percentiles per model and stage (seconds)")
+summary = get_telemetry().summary(since, models or None)
+st.dataframe(
+    pd.DataFrame(
+        [
+            {"model": model, "stage": stage, "what": STAGE_HELP.get(stage, ""), "n": n, "p50": p50, "p95": p95, "p99": p99}
+            for model, stage, n, p50, p95, p99 in summary
+        ]
+    ),
+    hide_index=True,
+    use_container_width=True,
+    column_config={name: st.column_config.NumberColumn(format="%.2f") for name in ("p50", "p95", "p99")},
+)
+
+st.subheader("Over time")
+col1, col2, col3 = st.columns(3)
+with col1:
+    stage = st.selectbox("Stage", STAGE_NAMES, index=STAGE_NAMES.index("total"), help="\n\n".join(f"{k}: {v}" for k, v in STAGE_HELP.items()))
+with col2:
+    pct = st.selectbox("Percentile", [50, 95, 99])
+with col3:
+    bucket = st.selectbox("Bucket", list(BUCKETS))
+
+samples = [
+    {"time": datetime.fromtimestamp(row["submitted"]), "model": row["model"] or "?", "seconds": stage_durations(row)[stage]}
+    for row in succeeded if stage in stage_durations(row)
+]
+if samples:
+    frame = pd.DataFrame(samples)
+    frame["time"] = frame["time"].dt.floor(BUCKETS[bucket])
+    series = frame.groupby(["time", "model"])["seconds"].agg(lambda values: percentile(list(values), pct)).unstack("model")
+    st.line_chart(series)
+else:
+    st.info(f"No {stage} timings in this range.")
+
+with st.expander("Recent failures"):
+    for row in [row for row in rows if row["status"] != "succeeded"][-20:][::-1]:
+        st.text(f"{datetime.fromtimestamp(row['submitted']):%Y-%m-%d %H:%M:%S}  {row['model']}  {row['error']}")
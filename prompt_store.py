@@ -0,0 +1,141 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from funcs import sqlite_connect
+
+# Persistent prompt history / library.  Every prompt is stored once with how
+# often and when it was last used; full-text search uses SQLite FTS5 (plain
+# LIKE if this sqlite was built without it).  The history panel only ever
+# asks for one page, so a long history costs nothing per rerun.
+
+PROMPTS_DIR = "prompts"
+STORE_PATH = os.path.join(PROMPTS_DIR, "prompts.db")
+SAVED_PROMPTS_PATH = os.path.join(PROMPTS_DIR, "saved_prompts.txt")
+
+
+class PromptStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        is_new = not os.path.exists(path)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS prompts ("
+                " id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE,"
+                " use_count INTEGER NOT NULL DEFAULT 0, saved INTEGER NOT NULL DEFAULT 0,"
+                " first_used REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS prompts_last_used ON prompts (last_used)")
+            self.fts = _create_fts(db)
+        if is_new:
+            self.import_saved_prompts()
+
+    def _connect(self):
+        return sqlite_connect(self.path)
+
+    def add(self, text, saved=False):
+        """Record a use of text, bumping its count if it's been used before."""
+        text = text.strip()
+        if not text:
+            return
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO prompts (text, use_count, saved, first_used, last_used) VALUES (?, 1, ?, ?, ?)"
+                " ON CONFLICT(text) DO UPDATE SET use_count = use_count + 1, last_used = excluded.last_used,"
+                " saved = MAX(saved, excluded.saved)",
+                (text, int(saved), now, now),
+            )
+
+    def save(self, text):
+        """Mark text as saved, returns False if it already was."""
+        text = text.strip()
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT saved FROM prompts WHERE text = ?", (text,)).fetchone()
+            if row and row[0]:
+                return False
+            db.execute(
+                "INSERT INTO prompts (text, use_count, saved, first_used, last_used) VALUES (?, 0, 1, ?, ?)"
+                " ON CONFLICT(text) DO UPDATE SET saved = 1",
+                (text, now, now),
+            )
+        return True
+
+    def _where(self, query, saved_only):
+        clauses, args = [], []
+        match = fts_query(query) if query else None
+        if match:
+            if self.fts:
+                clauses.append("id IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)")
+                args.append(match)
+            else:
+                for word in query.split():
+                    clauses.append("text LIKE ?")
+                    args.append(f"%{word}%")
+        if saved_only:
+            clauses.append("saved = 1")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def count(self, query=None, saved_only=False):
+        where, args = self._where(query, saved_only)
+        with self._connect() as db:
+            return db.execute(f"SELECT COUNT(*) FROM prompts{where}", args).fetchone()[0]
+
+    def page(self, query=None, limit=20, offset=0, saved_only=False):
+        """Most recently used first, as (text, use_count, last_used, saved) tuples."""
+        where, args = self._where(query, saved_only)
+        with self._connect() as db:
+            return db.execute(
+                f"SELECT text, use_count, last_used, saved FROM prompts{where}"
+                " ORDER BY last_used DESC LIMIT ? OFFSET ?",
+                args + [limit, offset],
+            ).fetchall()
+
+    def import_saved_prompts(self, path=SAVED_PROMPTS_PATH):
+        """Pull in prompts/saved_prompts.txt (prompts separated by blank lines)."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8", errors="replace") as f:
+            prompts = [p.strip() for p in re.split(r"\n\s*\n", f.read()) if p.strip()]
+        for text in prompts:
+            self.save(text)
+        return len(prompts)
+
+
+def _create_fts(db):
+    # external content table kept in sync by triggers
+    try:
+        db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(text, content='prompts', content_rowid='id')")
+    except sqlite3.OperationalError:
+        return False
+    db.execute(
+        "CREATE TRIGGER IF NOT EXISTS prompts_ai AFTER INSERT ON prompts BEGIN"
+        " INSERT INTO prompts_fts(rowid, text) VALUES (new.id, new.text); END"
+    )
+    db.execute(
+        "CREATE TRIGGER IF NOT EXISTS prompts_ad AFTER DELETE ON prompts BEGIN"
+        " INSERT INTO prompts_fts(prompts_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+    )
+    return True
+
+
+def fts_query(query):
+    # every word as a quoted prefix term, so user input can't be FTS syntax
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_prompt_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PromptStore()
+    return _store
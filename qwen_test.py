@@ -1,14 +1,34 @@
 import streamlit as st
-import replicate
+import mimetypes
 import os
 from PIL import Image
-import tempfile
-import requests
 from datetime import datetime
+import time
+import uuid
 
+from clients import get_client, resolve_model_ref
+from completion import get_webhook_receiver, run_prediction
+from dedupe import get_hash_index, remove_duplicates
+from funcs import download_image
+from input_prep import describe_upload, submit_path, submit_upload
+from model_registry import get_model
+from navigation import VIDEO_PAGE, clear_source_image, in_studio, send_image, source_image
+from output_index import get_output_index
+from retention import current_user, pin_checkbox
+from scheduler import get_scheduler
+from staging import get_upload_staging
+from startup import init_process
+from telemetry import prediction_times, record_generation
+from thumbnails import get_thumbnail, page_count
 
-from dotenv import load_dotenv
-load_dotenv()
+
+init_process()
+
+prep_future = None
+
+# identifies this browser session to the scheduler
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Create output directory if it doesn't exist
 OUTPUT_DIR = "output"
@@ -35,13 +55,19 @@ if uploaded_file is not None:
     image = Image.open(uploaded_file)
     st.image(image, caption="Uploaded Image", use_column_width=True)
     
-    # Save uploaded file temporarily to get a URL (for local testing)
-    # In production, you'd want to upload to a cloud service
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        temp_path = tmp_file.name
+    # Shrunk to the model's input size and staged under its content hash in the background
+    prep_future = submit_upload(uploaded_file, get_model("Qwen-Image-Edit")["max_input_side"])
     
     st.success("✅ Image uploaded successfully!")
+    st.caption(describe_upload(prep_future))
+elif source_image() and os.path.exists(source_image()):
+    # handed over from another page (navigation.py), no upload needed
+    st.image(source_image(), caption=f"From {os.path.basename(source_image())}", use_container_width=True)
+    prep_future = submit_path(source_image(), get_model("Qwen-Image-Edit")["max_input_side"])
+    st.caption(describe_upload(prep_future))
+    if st.button("Use a different image"):
+        clear_source_image()
+        st.rerun()
     
 replicate_key = st.text_input("Replicate Key - If not provided, will try to use the key in .env file", key="rep_key", type="password")
     
@@ -60,31 +86,33 @@ if replicate_key != None and replicate_key != "":
     # Process button
     if st.button("🔄 Edit Image", type="primary"):
         if prompt.strip():
+            timings = {"submitted": time.time()}
             try:
                 with st.spinner("Processing your image... This may take a minute."):
-                    # For this example, we'll use the temp file path
-                    # In production, you'd upload to a cloud service and use that URL
-                    with open(temp_path, "rb") as f:
-                        input_data = {
-                            "image": f,  # For local files
-                            "prompt": prompt,
-                            "output_quality": output_quality,
-                            "disable_safety_checker": True
-
-                        }
-
-
-                        client = None
-                        if replicate_key is None:
-                            client =   replicate.Client()
-                        else:
-                            client = replicate.Client(api_token=replicate_key)
-                        
-                        # Run the Replicate model
-                        output = client.run(
-                            "qwen/qwen-image-edit",
-                            input=input_data
-                        )
+                    client = get_client(replicate_key or None)
+                    temp_path = prep_future.result()[0]
+                    st.caption(describe_upload(prep_future))
+
+                    input_data = {
+                        # uploaded to replicate once, later edits of the same image reuse the URL
+                        "image": get_upload_staging().remote_url(client, temp_path),
+                        "prompt": prompt,
+                        "output_quality": output_quality,
+                        "disable_safety_checker": True
+
+                    }
+
+                    # Run the Replicate model, waiting our turn behind other sessions / rate limits
+                    model_ref = resolve_model_ref("Qwen-Image-Edit", replicate_key or None)
+                    prediction = run_prediction(
+                        client, model_ref, input_data, receiver=get_webhook_receiver(), timings=timings,
+                        scheduler=get_scheduler(), session=st.session_state.session_id,
+                    )
+                    timings["returned"] = timings["ready"] = time.time()
+                    timings.update(prediction_times(prediction))
+                    output = prediction.output
+                    if isinstance(output, str):
+                        output = [output]
                     
                     # Process and save outputs
                     if output:
@@ -94,69 +122,165 @@ if replicate_key != None and replicate_key != "":
                         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                         
                         # Display and save each output
+                        saved_bytes = 0
                         for index, item in enumerate(output):
-                            # Get the image data
-                            if hasattr(item, 'read'):
-                                image_data = item.read()
-                            else:
-                                # If it's a URL, download it
-                                response = requests.get(str(item))
-                                image_data = response.content
-                            
-                            # Save to output folder
-                            filename = f"edited_{timestamp}_{index}.webp"
-                            filepath = os.path.join(OUTPUT_DIR, filename)
-                            
-                            with open(filepath, "wb") as file:
-                                file.write(image_data)
+                            # Save to output folder, streamed straight to disk under a name nobody
+                            # else has, with the extension of whatever format actually came back
+                            filepath = download_image(item, prompt, "webp", OUTPUT_DIR, timings,
+                                                      stem=f"edited_{timestamp}_{index}")
+                            saved_bytes += os.path.getsize(filepath)
+                            get_output_index().record(
+                                filepath, model="Qwen-Image-Edit", endpoint=get_model("Qwen-Image-Edit")["endpoint"],
+                                prompt=prompt, params=input_data, prediction_id=prediction.id, user=current_user()
+                            )
+                            get_hash_index(OUTPUT_DIR).submit(filepath)
                             
                             # Display the result
-                            st.image(image_data, caption=f"Edited Image {index + 1}")
+                            st.image(filepath, caption=f"Edited Image {index + 1}")
                             st.success(f"💾 Saved as: {filepath}")
+                            st.session_state.last_edited = filepath
                             
                             # Download button
-                            st.download_button(
-                                label=f"📥 Download Image {index + 1}",
-                                data=image_data,
-                                file_name=filename,
-                                mime="image/webp"
-                            )
+                            with open(filepath, "rb") as file:
+                                st.download_button(
+                                    label=f"📥 Download Image {index + 1}",
+                                    data=file,
+                                    file_name=os.path.basename(filepath),
+                                    mime=mimetypes.guess_type(filepath)[0]
+                                )
+                        timings["bytes"] = saved_bytes
+                        record_generation(
+                            model="Qwen-Image-Edit", endpoint=model_ref, prediction_id=prediction.id,
+                            status="succeeded", **timings
+                        )
                     else:
                         st.error("❌ No output received from the model")
                         
             except Exception as e:
+                record_generation(model="Qwen-Image-Edit", status="failed", error=str(e), **timings)
                 st.error(f"❌ An error occurred: {str(e)}")
                 st.info("💡 Make sure you have set up your Replicate API token and have credits available")
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
         else:
             st.warning("⚠️ Please enter a prompt describing the changes you want to make")
 
 else:
     st.info("👆 Please upload an image to get started")
 
+# the last edit straight on to the video page (studio.py only)
+last_edited = st.session_state.get("last_edited")
+if in_studio() and last_edited and os.path.exists(last_edited):
+    if st.button(f"🎬 Make a Video of {os.path.basename(last_edited)}"):
+        send_image(last_edited, VIDEO_PAGE)
+
 # Display recent outputs
+GALLERY_PAGE_SIZE = 12
+SIMILAR_LIMIT = 12
+DUPLICATE_GROUPS_SHOWN = 5
+
+
+def similar_panel(output_index):
+    """The images that look like the one picked with 🔍 Similar."""
+    target = st.session_state.get("similar_to")
+    if not target:
+        return
+    if not os.path.exists(target):
+        st.session_state.similar_to = None
+        return
+    hash_index = get_hash_index(OUTPUT_DIR)
+    # anything saved before hashing existed gets picked up in the background
+    hash_index.sync_in_background()
+    st.subheader(f"🔍 Similar to {os.path.basename(target)}")
+    matches = hash_index.similar(target, limit=SIMILAR_LIMIT)
+    if not matches:
+        st.write("Nothing similar found.")
+    cols = st.columns(4)
+    for i, (path, distance) in enumerate(matches):
+        with cols[i % 4]:
+            st.image(get_thumbnail(path), caption=f"{os.path.basename(path)} · {distance} bits apart",
+                     use_container_width=True)
+    if hash_index.pending():
+        st.caption(f"⏳ {hash_index.pending()} images still being hashed, more may turn up")
+    if st.button("Close similar images"):
+        st.session_state.similar_to = None
+        st.rerun()
+
+
+def duplicates_panel():
+    """Groups of near-duplicates in output/, and a button to keep one of each."""
+    hash_index = get_hash_index(OUTPUT_DIR)
+    user = current_user()
+    with st.expander("🧹 Near-duplicates"):
+        if st.button("Find near-duplicates"):
+            hash_index.sync_in_background()
+            # behind a login only your own files are offered for deletion
+            st.session_state.duplicate_plan = hash_index.duplicates(user=user)
+        if hash_index.pending():
+            st.caption(f"⏳ {hash_index.pending()} images still being hashed, search again when it's done")
+        plan = st.session_state.get("duplicate_plan")
+        if plan is None:
+            st.write("Finds images that are all but identical (sweeps, repeated prompts) and keeps one of each.")
+            return
+        if not plan:
+            if not hash_index.pending():
+                st.write("No near-duplicates found.")
+            return
+        removable = sum(len(entry["remove"]) for entry in plan)
+        st.write(f"{len(plan)} groups, {removable} duplicates, "
+                 f"{sum(entry['bytes'] for entry in plan) / (1024 * 1024):.1f} MB")
+        for entry in plan[:DUPLICATE_GROUPS_SHOWN]:
+            paths = [entry["keep"]] + entry["remove"]
+            cols = st.columns(min(len(paths), 6))
+            for i, path in enumerate(paths[:6]):
+                with cols[i]:
+                    if os.path.exists(path):
+                        st.image(get_thumbnail(path), caption="keep" if i == 0 else "duplicate",
+                                 use_container_width=True)
+        owners = sorted({owner or "no user" for entry in plan for owner in entry["users"]})
+        if user is None:
+            # no login, so everyone's files are in the plan
+            confirmed = st.checkbox(f"Delete files belonging to: {', '.join(owners)}", key="duplicates_confirm")
+        else:
+            st.caption(f"Only your ({user}) files are deleted")
+            confirmed = True
+        if st.button(f"🗑️ Delete {removable} duplicates", type="primary", disabled=not confirmed):
+            deleted, freed = remove_duplicates(plan, OUTPUT_DIR)
+            st.session_state.duplicate_plan = None
+            st.success(f"Deleted {deleted} duplicates, {freed / (1024 * 1024):.1f} MB freed")
+
+
 st.header("📁 Recent Outputs")
-if os.path.exists(OUTPUT_DIR) and os.listdir(OUTPUT_DIR):
-    output_files = [f for f in os.listdir(OUTPUT_DIR) if f.endswith(('.webp', '.png', '.jpg', '.jpeg'))]
-    output_files.sort(reverse=True)  # Most recent first
-    
-    if output_files:
-        st.write(f"Found {len(output_files)} saved images:")
-        
-        # Show thumbnails of recent outputs
+if os.path.exists(OUTPUT_DIR):
+    output_index = get_output_index(OUTPUT_DIR)
+    total_images = output_index.count("image")
+
+    if total_images:
+        st.write(f"Found {total_images} saved images:")
+
+        similar_panel(output_index)
+        duplicates_panel()
+
+        pages = page_count(total_images, GALLERY_PAGE_SIZE)
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key="gallery_page")
+
+        # Show thumbnails for this page only
         cols = st.columns(3)
-        for i, filename in enumerate(output_files[:6]):  # Show only last 6
+        rows = output_index.recent("image", limit=GALLERY_PAGE_SIZE, offset=(page - 1) * GALLERY_PAGE_SIZE)
+        # seen counts as used, retention.py deletes the least recently seen first
+        output_index.touch([row["path"] for row in rows])
+        for i, row in enumerate(rows):
             with cols[i % 3]:
-                filepath = os.path.join(OUTPUT_DIR, filename)
                 try:
-                    image = Image.open(filepath)
-                    st.image(image, caption=filename, use_column_width=True)
+                    st.image(get_thumbnail(row["path"]), caption=row["filename"], use_container_width=True)
+                    if row["prompt"]:
+                        st.caption(row["prompt"][:120])
+                    pin_checkbox(row)
+                    if st.button("🔍 Similar", key=f"similar_{row['id']}"):
+                        st.session_state.similar_to = row["path"]
+                        st.rerun()
                 except Exception as e:
-                    st.error(f"Could not load {filename}")
+                    st.error(f"Could not load {row['filename']}")
     else:
         st.write("No output files found yet.")
 else:
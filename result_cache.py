@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from funcs import OUTPUT_DIR, sqlite_connect
+
+# Result cache for deterministic generations.  With a pinned seed the same
+# endpoint + input_dict gives the same image, so instead of paying for a new
+# prediction we hand back the file already sitting in output/.
+#
+# Entries only point at files in output/, evicting an entry never deletes
+# the image.  Entries whose file has been deleted are dropped on lookup.
+
+CACHE_PATH = os.path.join(OUTPUT_DIR, ".cache", "results.db")
+MAX_ENTRIES = 5000
+# total size of the files the cache will vouch for before evicting
+MAX_BYTES = 5 * 1024 ** 3
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_cacheable(input_dict):
+    # without a seed every run is a different image
+    return input_dict.get("seed") is not None
+
+
+def cache_key(api_end_point, input_dict, image_path=None):
+    """Canonical hash of the request, None if it isn't deterministic."""
+    if not is_cacheable(input_dict):
+        return None
+    request = {"endpoint": api_end_point, "input": {k: v for k, v in input_dict.items() if k != "image"}}
+    if image_path:
+        request["image_sha256"] = file_sha256(image_path)
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, filepath TEXT NOT NULL, bytes INTEGER NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def _connect(self):
+        return sqlite_connect(self.path)
+
+    def get(self, key):
+        """Filepath of the cached result for key, or None."""
+        if key is None:
+            return None
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT filepath FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, filepath):
+        if key is None or not filepath:
+            return
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, filepath, bytes, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, filepath, os.path.getsize(filepath), now, now),
+            )
+            self._evict(db)
+
+    def moved(self, old_path, new_path):
+        """Point entries for old_path at new_path (same image, different file)."""
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE results SET filepath = ?, bytes = ? WHERE filepath IN (?, ?)",
+                       (new_path, os.path.getsize(new_path), old_path, os.path.normpath(old_path)))
+
+    def _evict(self, db):
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM results").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, bytes FROM results ORDER BY last_used").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM results WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def stats(self):
+        with self._connect() as db:
+            count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM results").fetchone()
+        return {"entries": count, "bytes": total}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+    return _cache
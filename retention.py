@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from funcs import OUTPUT_DIR
+from output_index import get_output_index, get_output_index_if_exists
+
+# Disk quotas for output/: once a folder (or one user's share of it) is over
+# its byte or file budget, the least recently viewed files are deleted until
+# it fits again.  Pinned files (the 📌 Keep boxes in the galleries) are never
+# touched, nor is anything younger than RETENTION_MIN_AGE.
+#
+#   python retention.py --max-bytes 20G --dry-run    # what would go
+#   python retention.py --max-files 5000 --policy age
+#
+# Everything is worked out from the output index (its byte counts and
+# created / last viewed times), so a pass is a couple of aggregate queries
+# while the folder is under quota and never lists the folder.  Deleting a
+# file also deletes its thumbnail, video preview and archive sidecar.
+#
+# The apps run a pass in the background every RETENTION_INTERVAL seconds
+# (default 600) when a quota is set, from the environment:
+#
+#   RETENTION_MAX_BYTES / RETENTION_MAX_FILES            whole folder
+#   RETENTION_USER_MAX_BYTES / RETENTION_USER_MAX_FILES  each user
+#   RETENTION_POLICY=lru|age                             default lru
+#
+# or per folder, from a .retention.json in it with the same keys in lower
+# case without the prefix ({"max_bytes": "5G", "user_max_files": 200}).
+# Users only exist when the apps sit behind a proxy that logs people in and
+# passes the name on in USER_HEADER (default X-Forwarded-User); files without
+# a user only count towards the folder quota.
+
+QUOTA_FILE = ".retention.json"
+QUOTA_KEYS = ["max_bytes", "max_files", "user_max_bytes", "user_max_files", "policy"]
+POLICIES = ["lru", "age"]
+DEFAULT_POLICY = "lru"
+DEFAULT_INTERVAL = 600
+# a page may still be showing anything newer
+MIN_AGE = 3600
+BATCH = 500
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(value):
+    """Bytes from 123, "500M", "20G", "1.5T"; None stays None."""
+    if value is None or isinstance(value, int):
+        return value
+    text = str(value).strip().upper().removesuffix("B")
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(float(text))
+
+
+def format_size(value):
+    for unit in ("T", "G", "M", "K"):
+        if value >= SIZE_UNITS[unit]:
+            return f"{value / SIZE_UNITS[unit]:.1f} {unit}B"
+    return f"{value} B"
+
+
+def load_quota(output_dir=OUTPUT_DIR, **overrides):
+    """Quota for output_dir: overrides, then its .retention.json, then RETENTION_* variables."""
+    quota = {key: os.environ.get(f"RETENTION_{key.upper()}") or None for key in QUOTA_KEYS}
+    try:
+        with open(os.path.join(output_dir, QUOTA_FILE), encoding="utf-8") as f:
+            quota.update({key: value for key, value in json.load(f).items() if key in QUOTA_KEYS})
+    except FileNotFoundError:
+        pass
+    quota.update({key: value for key, value in overrides.items() if value is not None})
+    for key in ("max_bytes", "user_max_bytes"):
+        quota[key] = parse_size(quota[key])
+    for key in ("max_files", "user_max_files"):
+        quota[key] = int(quota[key]) if quota[key] is not None else None
+    quota["policy"] = quota["policy"] or DEFAULT_POLICY
+    if quota["policy"] not in POLICIES:
+        raise ValueError(f"unknown retention policy {quota['policy']!r}, expected one of {POLICIES}")
+    return quota
+
+
+def has_limits(quota):
+    return any(quota[key] is not None for key in ("max_bytes", "max_files", "user_max_bytes", "user_max_files"))
+
+
+def current_user():
+    """The logged-in user of this browser session (from USER_HEADER), None without one."""
+    import streamlit as st
+
+    try:
+        return st.context.headers.get(os.environ.get("USER_HEADER", "X-Forwarded-User")) or None
+    except Exception:
+        # not running in a streamlit session
+        return None
+
+
+def pin_checkbox(row, output_dir=OUTPUT_DIR):
+    """The 📌 Keep box under a gallery item, row is its output index row."""
+    import streamlit as st
+
+    st.checkbox("📌 Keep", value=bool(row["pinned"]), key=f"pin_{row['id']}",
+                help="Kept files are never deleted to make room (retention.py)",
+                on_change=get_output_index(output_dir).pin, args=(row["path"], not row["pinned"]))
+
+
+def derived_files(path):
+    """Files made from path (thumbnail, video preview folder, archive sidecar) that go when it goes."""
+    from archive import SIDECAR_SUFFIX
+    from thumbnails import thumbnail_path
+    from video_previews import preview_dir
+
+    found = [path + SIDECAR_SUFFIX]
+    try:
+        found.append(thumbnail_path(path))
+        found.append(preview_dir(path))
+    except OSError:
+        pass
+    return found
+
+
+def delete_output(path, output_dir=OUTPUT_DIR):
+    """Delete an output with everything made from it and its index row, returns the bytes freed (None if it was gone)."""
+    # derivatives are keyed on the file's mtime/size, find them before it's gone
+    extras = derived_files(path) if os.path.exists(path) else []
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        # already gone, the row was stale
+        size = None
+    for extra in extras:
+        if os.path.isdir(extra):
+            shutil.rmtree(extra, ignore_errors=True)
+        elif os.path.exists(extra):
+            os.remove(extra)
+    index = get_output_index_if_exists(output_dir)
+    if index is not None:
+        index.remove(path)
+    return size
+
+
+class RetentionManager:
+    def __init__(self, output_dir=OUTPUT_DIR, quota=None, min_age=None):
+        self.output_dir = output_dir
+        self.quota = quota if quota is not None else load_quota(output_dir)
+        self.min_age = float(os.environ.get("RETENTION_MIN_AGE", MIN_AGE)) if min_age is None else min_age
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def plan(self, now=None):
+        """Rows that have to go to get back under quota, in the order they'd be deleted."""
+        index = get_output_index(self.output_dir)
+        quota = self.quota
+        by_access = quota["policy"] == "lru"
+        before = (now or time.time()) - self.min_age
+        chosen = {}
+
+        def take(files, used, max_files, max_bytes, user=None):
+            # walks the unpinned rows oldest first, a batch at a time, until within both limits
+            offset = 0
+            while (max_files is not None and files > max_files) or (max_bytes is not None and used > max_bytes):
+                rows = index.eviction_order(user, by_access, before, BATCH, offset)
+                if not rows:
+                    break
+                offset += len(rows)
+                for row in rows:
+                    if (max_files is None or files <= max_files) and (max_bytes is None or used <= max_bytes):
+                        break
+                    if row["path"] in chosen:
+                        # already counted
+                        continue
+                    chosen[row["path"]] = row
+                    files -= 1
+                    used -= row["bytes"] or 0
+
+        if quota["user_max_files"] is not None or quota["user_max_bytes"] is not None:
+            for user, (files, used) in index.usage_by_user().items():
+                take(files, used, quota["user_max_files"], quota["user_max_bytes"], user)
+        if quota["max_files"] is not None or quota["max_bytes"] is not None:
+            files, used = index.usage()
+            # what the per-user pass already frees counts here too
+            files -= len(chosen)
+            used -= sum(row["bytes"] or 0 for row in chosen.values())
+            take(files, used, quota["max_files"], quota["max_bytes"])
+        return list(chosen.values())
+
+    def report(self, rows=None):
+        """Text summary of usage against the quota and what a pass would delete."""
+        index = get_output_index(self.output_dir)
+        rows = self.plan() if rows is None else rows
+        files, used = index.usage()
+        quota = self.quota
+        lines = [f"{self.output_dir}: {files} files, {format_size(used)}"
+                 f" (quota {quota['max_files'] if quota['max_files'] is not None else '-'} files,"
+                 f" {format_size(quota['max_bytes']) if quota['max_bytes'] is not None else '-'}, {quota['policy']})"]
+        for user, (user_files, user_bytes) in sorted(index.usage_by_user().items()):
+            lines.append(f"  {user}: {user_files} files, {format_size(user_bytes)}")
+        for row in rows:
+            seen = row["accessed"] or row["created"]
+            lines.append(f"  - {row['filename']} ({format_size(row['bytes'] or 0)}, "
+                         f"{'last viewed' if row['accessed'] else 'made'} {time.strftime('%Y-%m-%d %H:%M', time.localtime(seen))}"
+                         f"{', ' + row['user'] if row['user'] else ''})")
+        lines.append(f"{len(rows)} files, {format_size(sum(row['bytes'] or 0 for row in rows))} to delete")
+        return "\n".join(lines)
+
+    def run(self, rows=None):
+        """One pass (or delete the rows of an earlier plan()), returns (files deleted, bytes freed)."""
+        rows = self.plan() if rows is None else rows
+        deleted = freed = 0
+        for row in rows:
+            size = delete_output(row["path"], self.output_dir)
+            if size is not None:
+                deleted += 1
+                freed += size
+        return deleted, freed
+
+    def start_background(self, interval=DEFAULT_INTERVAL):
+        """Run a pass every interval seconds on a daemon thread (once per manager)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, args=(interval,), daemon=True, name="retention")
+            self._thread.start()
+
+    def _loop(self, interval):
+        while True:
+            try:
+                if os.path.isdir(self.output_dir):
+                    self.run()
+            except (OSError, sqlite3.Error) as e:
+                print(f"retention pass failed: {e}", file=sys.stderr)
+            time.sleep(interval)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_retention_manager(output_dir=OUTPUT_DIR):
+    key = os.path.abspath(output_dir)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = RetentionManager(output_dir)
+    return manager
+
+
+def start_background_retention(output_dir=OUTPUT_DIR):
+    """What the apps call at start-up, does nothing unless a quota is configured."""
+    manager = get_retention_manager(output_dir)
+    if has_limits(manager.quota):
+        manager.start_background(float(os.environ.get("RETENTION_INTERVAL", DEFAULT_INTERVAL)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete the least recently used outputs to stay under a quota.")
+    parser.add_argument("folders", nargs="*", default=[OUTPUT_DIR])
+    parser.add_argument("--max-bytes", default=None, help="e.g. 500M, 20G")
+    parser.add_argument("--max-files", type=int, default=None)
+    parser.add_argument("--user-max-bytes", default=None)
+    parser.add_argument("--user-max-files", type=int, default=None)
+    parser.add_argument("--policy", choices=POLICIES, default=None,
+                        help="lru: least recently viewed first, age: oldest first")
+    parser.add_argument("--min-age", type=float, default=None, help="never delete files younger than N seconds (default 3600)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted and stop")
+    args = parser.parse_args(argv)
+
+    for folder in args.folders:
+        quota = load_quota(folder, max_bytes=args.max_bytes, max_files=args.max_files,
+                           user_max_bytes=args.user_max_bytes, user_max_files=args.user_max_files, policy=args.policy)
+        if not has_limits(quota):
+            print(f"{folder}: no quota set (--max-bytes / --max-files, RETENTION_* or {QUOTA_FILE})")
+            continue
+        manager = RetentionManager(folder, quota, args.min_age)
+        rows = manager.plan()
+        print(manager.report(rows))
+        if args.dry_run:
+            continue
+        started = time.time()
+        deleted, freed = manager.run(rows)
+        print(f"{folder}: deleted {deleted} files, freed {format_size(freed)} in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
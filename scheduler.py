@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from completion import model_key, retry_after_seconds
+from model_registry import find_by_endpoint
+from staging import account_key
+
+# Process-wide scheduler in front of every prediction, shared by all the
+# streamlit sessions (and batch.py) in this process:
+#
+#  - one token bucket per API key for prediction creates.  A 429 pauses the
+#    bucket for as long as replicate asks and halves its rate, every success
+#    after that wins a little of the rate back (up to the configured one),
+#  - at most "max_concurrent" (model_registry) creates of a model in flight
+#    at once.  Only the create goes through here (completion.run_prediction),
+#    the wait for the result doesn't hold anything,
+#  - sessions take turns: whoever has waited is served round robin, so one
+#    person's 50 prompt batch doesn't starve everyone else.
+#
+# REPLICATE_RATE_LIMIT sets predictions per minute (replicate's default
+# limit for creating predictions is 600/min).
+
+DEFAULT_RATE_LIMIT = 600
+DEFAULT_BURST = 10
+DEFAULT_MODEL_CONCURRENCY = 4
+MIN_RATE = 1 / 60.0
+RATE_RECOVERY = 1.05
+MAX_RATE_LIMIT_RETRIES = 5
+
+
+class RateLimited(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def take(self):
+        """Take a token, returns 0 or how many seconds until one is available."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def throttled(self, retry_after):
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate * RATE_RECOVERY)
+
+
+class Scheduler:
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, burst=DEFAULT_BURST):
+        self.rate = rate_limit / 60.0
+        self.burst = burst
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._running = {}
+        # session -> tickets waiting, in the order the sessions get served
+        self._waiting = OrderedDict()
+
+    def call(self, client, ref, fn, session=None):
+        """Run fn() (which creates one prediction for ref) when it's our turn.
+
+        fn must only create the prediction: a 429 calls it again, so anything
+        after the create (waiting for the result) belongs outside.  The model
+        slot is held until fn returns, anything but a 429 is raised as is.
+        """
+        # by now the client has pulled replicate in anyway
+        from replicate.exceptions import ReplicateError
+
+        key = account_key(client)
+        model = model_key(ref)
+        with self._slot(key, model, session):
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                if attempt:
+                    self._wait_turn(key, model, session, needs_slot=False)
+                try:
+                    result = fn()
+                except ReplicateError as e:
+                    if e.status != 429:
+                        raise
+                    if attempt == MAX_RATE_LIMIT_RETRIES:
+                        raise RateLimited(f"Replicate is still rate limiting after {attempt + 1} tries: {e}") from e
+                    with self._cond:
+                        self._bucket(key).throttled(retry_after_seconds(e, attempt))
+                    continue
+                with self._cond:
+                    self._bucket(key).succeeded()
+                return result
+
+    @contextmanager
+    def _slot(self, key, model, session):
+        self._wait_turn(key, model, session, needs_slot=True)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[model] -= 1
+                self._cond.notify_all()
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _wait_turn(self, key, model, session, needs_slot):
+        ticket = {"key": key, "model": model, "needs_slot": needs_slot, "granted": False}
+        with self._cond:
+            self._waiting.setdefault(session, deque()).append(ticket)
+            while True:
+                wait = self._grant()
+                if ticket["granted"]:
+                    return
+                self._cond.wait(wait)
+
+    def _grant(self):
+        # called with the lock held.  Goes round the waiting sessions handing
+        # out what's free; a session that got something moves to the back.
+        # Returns how long until a token frees up (None if it's on a slot).
+        next_token = None
+        progress = True
+        while progress:
+            progress = False
+            for session in list(self._waiting):
+                tickets = self._waiting[session]
+                for ticket in tickets:
+                    if ticket["needs_slot"] and self._running.get(ticket["model"], 0) >= model_concurrency(ticket["model"]):
+                        continue
+                    wait = self._bucket(ticket["key"]).take()
+                    if wait:
+                        next_token = wait if next_token is None else min(next_token, wait)
+                        continue
+                    if ticket["needs_slot"]:
+                        self._running[ticket["model"]] = self._running.get(ticket["model"], 0) + 1
+                    ticket["granted"] = True
+                    tickets.remove(ticket)
+                    del self._waiting[session]
+                    if tickets:
+                        self._waiting[session] = tickets
+                    progress = True
+                    self._cond.notify_all()
+                    break
+                if progress:
+                    break
+        return next_token
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": {model: count for model, count in self._running.items() if count},
+                "waiting": sum(len(tickets) for tickets in self._waiting.values()),
+                "rates": {key: bucket.rate * 60 for key, bucket in self._buckets.items()},
+            }
+
+
+def model_concurrency(model):
+    _, entry = find_by_endpoint(model)
+    return (entry or {}).get("max_concurrent", DEFAULT_MODEL_CONCURRENCY)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(float(os.environ.get("REPLICATE_RATE_LIMIT") or DEFAULT_RATE_LIMIT))
+    return _scheduler
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from funcs import parse_timestamp, sqlite_connect
+
+# Upload staging for image inputs (Qwen-Image-Edit, WAN).
+#
+# Uploaded files are written once under their content hash instead of a new
+# NamedTemporaryFile on every rerun, and the replicate file URL from the
+# first upload is reused for as long as replicate keeps the file, so editing
+# the same source image again doesn't send the whole thing again.  Staged
+# files are evicted by age and total size (least recently used first).
+
+# UPLOAD_STAGING_DIR overrides it (benchmark.py points it at its scratch folder)
+STAGING_DIR = os.path.join(tempfile.gettempdir(), "flux_gui_uploads")
+STAGING_TTL = 24 * 60 * 60
+MAX_STAGING_BYTES = 1024 ** 3
+# replicate file URLs expire, stop reusing them a bit before they do
+REMOTE_TTL = 23 * 60 * 60
+REMOTE_MARGIN = 10 * 60
+# don't walk the staging folder more than this often
+EVICT_INTERVAL = 60
+# uploads of the same file wait for each other, a fixed set of locks picked by
+# hash so there's no lock per file to clean up (two files rarely share one)
+UPLOAD_LOCK_STRIPES = 64
+
+
+def account_key(client):
+    # files belong to an account, key remote URLs by (a hash of) the token
+    token = getattr(client, "_api_token", None) or os.environ.get("REPLICATE_API_TOKEN", "")
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+class UploadStaging:
+    def __init__(self, staging_dir=STAGING_DIR, ttl=STAGING_TTL, max_bytes=MAX_STAGING_BYTES):
+        self.staging_dir = staging_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(staging_dir, "remote.db")
+        self._lock = threading.Lock()
+        self._upload_locks = [threading.Lock() for _ in range(UPLOAD_LOCK_STRIPES)]
+        self._last_evict = 0
+        os.makedirs(staging_dir, exist_ok=True)
+        with sqlite_connect(self.db_path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS remote ("
+                " sha256 TEXT NOT NULL, account TEXT NOT NULL, url TEXT NOT NULL, expires REAL NOT NULL,"
+                " PRIMARY KEY (sha256, account))"
+            )
+
+    def stage(self, data, filename=""):
+        """Write data under its content hash (once) and return the local path."""
+        sha = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(filename)[1].lower() or ".bin"
+        path = os.path.join(self.staging_dir, sha + ext)
+        if os.path.exists(path):
+            # bump the mtime, eviction goes least recently used first
+            os.utime(path)
+        else:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def stage_uploaded_file(self, uploaded_file):
+        """stage() for a streamlit UploadedFile."""
+        return self.stage(uploaded_file.getvalue(), uploaded_file.name)
+
+    def remote_url(self, client, path):
+        """Replicate file URL for the file at path, uploading only if this account hasn't got it yet."""
+        sha = self._sha_for(path)
+        account = account_key(client)
+        key = (sha, account)
+
+        # one upload per file even when several jobs want it at once
+        with self._upload_locks[hash(key) % len(self._upload_locks)]:
+            with sqlite_connect(self.db_path) as db:
+                row = db.execute(
+                    "SELECT url, expires FROM remote WHERE sha256 = ? AND account = ?", key
+                ).fetchone()
+            if row and row[1] - REMOTE_MARGIN > time.time():
+                return row[0]
+
+            uploaded = client.files.create(path)
+            url = uploaded.urls["get"]
+            expires = parse_timestamp(getattr(uploaded, "expires_at", None)) or time.time() + REMOTE_TTL
+            with sqlite_connect(self.db_path) as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO remote (sha256, account, url, expires) VALUES (?, ?, ?, ?)",
+                    (sha, account, url, expires),
+                )
+            return url
+
+    def _sha_for(self, path):
+        # staged files are already named by their hash
+        name = os.path.splitext(os.path.basename(path))[0]
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.staging_dir) and len(name) == 64:
+            return name
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def evict(self, force=False):
+        """Drop staged files past the TTL, then the oldest until under max_bytes."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_evict < EVICT_INTERVAL:
+                return
+            self._last_evict = now
+
+        files = []
+        with os.scandir(self.staging_dir) as entries:
+            for entry in entries:
+                # remote.db (plus its -journal) and half-written files
+                if not entry.is_file() or entry.name.startswith("remote.db") or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if now - mtime < self.ttl and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        with sqlite_connect(self.db_path) as db:
+            db.execute("DELETE FROM remote WHERE expires < ?", (now,))
+
+
+_staging = None
+_staging_lock = threading.Lock()
+
+
+def get_upload_staging():
+    global _staging
+    with _staging_lock:
+        if _staging is None:
+            _staging = UploadStaging(os.environ.get("UPLOAD_STAGING_DIR") or STAGING_DIR)
+    return _staging
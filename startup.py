@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import streamlit as st
+
+# Process start-up for the streamlit pages, and a report of what it costs.
+#
+# init_process() is the one-time setup every page calls at the top (reading
+# .env, the archive.py background pass when ARCHIVE_OUTPUTS is set, the
+# retention.py one when a quota is, videos and downloads served from disk
+# instead of memory, see media_server.py).  It runs once per process, not on every
+# rerun.  The heavy modules (replicate / httpx / pydantic, requests, numpy)
+# are imported where they're first used, so a page renders without them.
+#
+#   python startup.py                          # all pages
+#   python startup.py app.py --json now.json --baseline before.json
+#
+# Each page is run twice in a fresh interpreter (streamlit's AppTest, under
+# -X importtime): the first run is the cold start, the second the cost of a
+# rerun.  With --baseline the numbers are compared to an earlier --json file
+# and the exit code is 1 if anything got more than --tolerance slower.
+
+PAGES = ["app.py", "qwen_test.py", "wan22_test2.py", "perf_dashboard.py"]
+TOP_IMPORTS = 12
+DEFAULT_TOLERANCE = 0.25
+# small numbers are mostly noise, don't fail a run over 20ms
+MIN_REGRESSION_SECONDS = 0.02
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+sys.stderr.write("--- page ---\\n")
+sys.stderr.flush()
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+first = time.perf_counter()
+at.run()
+second = time.perf_counter()
+print(json.dumps({
+    "streamlit_import": imported - started,
+    "cold_start": first - imported,
+    "rerun": second - first,
+    "exceptions": [e.value for e in at.exception],
+}))
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def init_process():
+    """Once per process: load .env, serve media from disk, start background archiving / retention if asked for.  Returns when that happened."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from media_server import use_disk_media_storage
+
+    use_disk_media_storage()
+    from archive import start_background_archiving
+
+    start_background_archiving()
+    from retention import start_background_retention
+
+    start_background_retention()
+    return time.time()
+
+
+def parse_importtime(stderr):
+    """{top level package: cumulative seconds} for what the page imported itself."""
+    totals = {}
+    lines = stderr.splitlines()
+    if "--- page ---" in lines:
+        # everything before is streamlit's own start-up
+        lines = lines[lines.index("--- page ---") + 1:]
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line.split("|", 2))
+        if "." in name:
+            continue
+        try:
+            totals[name] = totals.get(name, 0.0) + int(cumulative) / 1e6
+        except ValueError:
+            continue
+    return totals
+
+
+def measure_page(page):
+    """Cold start, rerun and biggest imports for one page, in a fresh interpreter."""
+    page = os.path.abspath(page)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(page), os.environ.get("PYTHONPATH")])))
+    # a scratch folder, pages create output/ and friends where they run
+    with tempfile.TemporaryDirectory(prefix="startup_") as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE, page],
+            cwd=workdir, env=env, capture_output=True, text=True, timeout=600,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(page)} failed to start:\n{result.stderr[-2000:]}")
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr)
+    probe["imports"] = dict(sorted(imports.items(), key=lambda item: -item[1])[:TOP_IMPORTS])
+    return probe
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Lines describing what got slower than baseline by more than tolerance."""
+    regressions = []
+    for page, numbers in results.items():
+        before = baseline.get(page)
+        if not before:
+            continue
+        for name in ("cold_start", "rerun"):
+            if name not in before:
+                continue
+            slower = numbers[name] - before[name]
+            if slower > MIN_REGRESSION_SECONDS and numbers[name] > before[name] * (1 + tolerance):
+                regressions.append(f"{page} {name}: {before[name]:.3f}s -> {numbers[name]:.3f}s")
+    return regressions
+
+
+def print_report(page, numbers):
+    print(f"\n== {page} ==")
+    print(f"streamlit import {numbers['streamlit_import']:.3f}s  cold start {numbers['cold_start']:.3f}s  "
+          f"rerun {numbers['rerun']:.3f}s")
+    for error in numbers["exceptions"]:
+        print(f"  exception: {error}")
+    if numbers["imports"]:
+        print("imports on first run (cumulative):")
+        for name, seconds in numbers["imports"].items():
+            print(f"  {name:<24} {seconds * 1000:7.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start and rerun time of the streamlit pages.")
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--json", default=None, help="write the numbers to this file")
+    parser.add_argument("--baseline", default=None, help="an earlier --json file to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown as a fraction (default 0.25)")
+    args = parser.parse_args(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for page in args.pages:
+        path = page if os.path.exists(page) else os.path.join(here, page)
+        results[os.path.basename(page)] = numbers = measure_page(path)
+        print_report(os.path.basename(page), numbers)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nslower than the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nwithin the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import streamlit as st
+
+from navigation import build_pages
+from startup import init_process
+
+# Every page in one process: streamlit run studio.py
+#
+# Instead of app.py, qwen_test.py and wan22_test2.py as three streamlit
+# servers on three ports (three interpreters, three copies of the
+# replicate / PIL stack, three HTTP pools), they're pages of this one and
+# share the process-wide clients, output index and job queue.  See
+# navigation.py for the page list.
+
+init_process()
+st.session_state.studio = True
+st.navigation(build_pages()).run()
@@ -0,0 +1,76 @@
+import itertools
+import math
+import re
+
+# Seed / parameter sweeps: one prompt times a list of seeds times a few
+# values of each numeric parameter, expanded into a grid of jobs.  The values
+# come from the same slider definitions app.py draws (model_registry), so a
+# sweep can't ask a model for something its slider wouldn't allow.
+
+MAX_SWEEP_JOBS = 64
+# what the seed inputs allow
+MAX_SEED = 2**32 - 1
+
+
+def sweepable_params(model):
+    """The model's numeric slider params that actually get sent."""
+    return [spec for spec in model["params"] if spec["widget"] == "slider" and spec.get("sent", True)]
+
+
+def parse_seeds(text):
+    """"1, 2, 7" or "1-4" (or a mix) -> [1, 2, 7] / [1, 2, 3, 4].
+
+    Raises ValueError on junk, on backwards ranges ("5-1"), on seeds above
+    MAX_SEED and on more than MAX_SWEEP_JOBS seeds, before expanding anything."""
+    seeds = []
+    for part in re.split(r"[,\s]+", text.strip()):
+        if not part:
+            continue
+        if "-" in part:
+            low, high = (int(x) for x in part.split("-", 1))
+            if high < low:
+                raise ValueError(f"seed range {part} runs backwards, did you mean {high}-{low}?")
+            if high > MAX_SEED:
+                raise ValueError(f"seed range {part} goes past {MAX_SEED}, the largest seed")
+            if len(seeds) + high - low + 1 > MAX_SWEEP_JOBS:
+                raise ValueError(f"seed range {part} is more than {MAX_SWEEP_JOBS} seeds")
+            seeds.extend(range(low, high + 1))
+        else:
+            seed = int(part)
+            if seed > MAX_SEED:
+                raise ValueError(f"seed {part} is past {MAX_SEED}, the largest seed")
+            seeds.append(seed)
+        if len(seeds) > MAX_SWEEP_JOBS:
+            raise ValueError(f"more than {MAX_SWEEP_JOBS} seeds")
+    return list(dict.fromkeys(seeds))
+
+
+def sweep_values(spec, low, high, count):
+    """count evenly spaced values from low to high, snapped to the slider's step."""
+    step = spec.get("step", 1)
+    is_int = isinstance(step, int) and isinstance(spec["min_value"], int)
+    if count <= 1 or low == high:
+        values = [low]
+    else:
+        values = [low + (high - low) * i / (count - 1) for i in range(count)]
+    snapped = []
+    for value in values:
+        value = spec["min_value"] + round((value - spec["min_value"]) / step) * step
+        value = min(spec["max_value"], max(spec["min_value"], value))
+        snapped.append(int(value) if is_int else round(value, 4))
+    return list(dict.fromkeys(snapped))
+
+
+def sweep_size(axes):
+    """How many combinations expand(axes) would give, without building them."""
+    return math.prod(len(values) for _, values in axes)
+
+
+def expand(axes):
+    """[(name, values), ...] -> one dict per combination, first axis varying slowest."""
+    names = [name for name, _ in axes]
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values for _, values in axes))]
+
+
+def describe(combo):
+    return ", ".join(f"{name} {value}" for name, value in combo.items())
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import threading
+import time
+
+from funcs import OUTPUT_DIR, parse_timestamp, percentile, sqlite_connect
+
+# Per-stage timings for every generation, so we can see where the time goes
+# instead of one spinner.  One row per prediction with wall clock timestamps:
+#
+#   submitted   the job started (upload, wait for our turn)    (local clock)
+#   sent        we asked replicate for a prediction            (local clock)
+#   created     replicate accepted it                          (replicate's clock)
+#   started     a model worker picked it up                    (replicate's clock)
+#   completed   the model finished                             (replicate's clock)
+#   returned    we noticed it had finished (poll / webhook)    (local clock)
+#   ready       the output URL answered (wait_for_image)       (local clock)
+#   first_byte  first byte of the output arrived               (local clock)
+#   saved       the file was in output/                        (local clock)
+#
+# The two clocks are never subtracted from each other, see STAGES.
+# perf_dashboard.py shows p50/p95/p99 per model and stage.
+
+TELEMETRY_PATH = os.path.join(OUTPUT_DIR, ".cache", "telemetry.db")
+
+COLUMNS = [
+    "model", "endpoint", "prediction_id", "status", "error", "submitted", "sent", "created", "started",
+    "completed", "returned", "ready", "first_byte", "saved", "bytes",
+]
+
+# stage name -> (from, to) timestamp columns
+STAGES = {
+    "schedule": ("submitted", "sent"),
+    "queue": ("created", "started"),
+    "predict": ("started", "completed"),
+    "ready": ("returned", "ready"),
+    "first_byte": ("ready", "first_byte"),
+    "download": ("first_byte", "saved"),
+    "total": ("submitted", "saved"),
+}
+
+
+def stage_durations(row):
+    """Seconds per stage for one row (a dict), stages we have no timestamps for are left out."""
+    durations = {}
+    for stage, (start, end) in STAGES.items():
+        if row.get(start) is not None and row.get(end) is not None:
+            durations[stage] = max(0.0, row[end] - row[start])
+    # what's left of the round trip once replicate's own time is taken out:
+    # network, Prefer: wait / poll / webhook lag.  Only differences, so no clock skew.
+    if None not in (row.get("sent"), row.get("returned"), row.get("created"), row.get("completed")):
+        durations["overhead"] = max(0.0, (row["returned"] - row["sent"]) - (row["completed"] - row["created"]))
+    return durations
+
+
+def prediction_times(prediction):
+    """created/started/completed off a replicate prediction, as epoch seconds."""
+    return {
+        name: parse_timestamp(getattr(prediction, f"{name}_at", None))
+        for name in ("created", "started", "completed")
+    }
+
+
+class Telemetry:
+    def __init__(self, path=TELEMETRY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with sqlite_connect(path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                " id INTEGER PRIMARY KEY, model TEXT, endpoint TEXT, prediction_id TEXT, status TEXT, error TEXT,"
+                " submitted REAL NOT NULL, sent REAL, created REAL, started REAL, completed REAL, returned REAL,"
+                " ready REAL, first_byte REAL, saved REAL, bytes INTEGER)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS generations_submitted ON generations (submitted)")
+            # the dashboard's model list reads just this
+            db.execute("CREATE INDEX IF NOT EXISTS generations_model ON generations (model)")
+
+    def record(self, **fields):
+        fields = {k: v for k, v in fields.items() if k in COLUMNS}
+        fields.setdefault("submitted", time.time())
+        names = ", ".join(fields)
+        marks = ", ".join("?" for _ in fields)
+        with sqlite_connect(self.path) as db:
+            db.execute(f"INSERT INTO generations ({names}) VALUES ({marks})", list(fields.values()))
+
+    def rows(self, since=None, models=None):
+        """Rows as dicts, oldest first."""
+        where, args = [], []
+        if since is not None:
+            where.append("submitted >= ?")
+            args.append(since)
+        if models:
+            where.append(f"model IN ({', '.join('?' for _ in models)})")
+            args.extend(models)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM generations"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with sqlite_connect(self.path) as db:
+            return [dict(zip(COLUMNS, row)) for row in db.execute(sql + " ORDER BY submitted", args)]
+
+    def models(self):
+        """Every model that has a generation recorded, sorted."""
+        with sqlite_connect(self.path) as db:
+            return [row[0] for row in db.execute("SELECT DISTINCT model FROM generations WHERE model IS NOT NULL AND model != '' ORDER BY model")]
+
+    def summary(self, since=None, models=None):
+        """[(model, stage, count, p50, p95, p99)] over succeeded generations."""
+        samples = {}
+        for row in self.rows(since, models):
+            if row["status"] != "succeeded":
+                continue
+            for stage, seconds in stage_durations(row).items():
+                samples.setdefault((row["model"], stage), []).append(seconds)
+        order = list(STAGES) + ["overhead"]
+        return [
+            (model, stage, len(values), percentile(values, 50), percentile(values, 95), percentile(values, 99))
+            for (model, stage), values in sorted(samples.items(), key=lambda item: (item[0][0] or "", order.index(item[0][1])))
+        ]
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+    return _telemetry
+
+
+def record_generation(**fields):
+    """Telemetry.record that never gets in the way of the generation itself."""
+    try:
+        get_telemetry().record(**fields)
+    except sqlite3.Error:
+        pass
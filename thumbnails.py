@@ -0,0 +1,57 @@
+import hashlib
+import os
+import threading
+
+from PIL import Image
+
+from funcs import OUTPUT_DIR
+
+# Small WebP previews for the galleries.  A thumbnail is made once per
+# (path, mtime, size) and reused on every rerun after that, so a gallery page
+# only ever decodes the few small files it actually shows.
+
+THUMB_DIR = os.path.join(OUTPUT_DIR, ".thumbs")
+THUMB_SIZE = (320, 320)
+THUMB_QUALITY = 80
+
+
+def thumbnail_path(filepath, size=THUMB_SIZE, thumb_dir=THUMB_DIR):
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}|{stat.st_mtime_ns}|{stat.st_size}|{size[0]}x{size[1]}"
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    # fan out so one folder doesn't end up with 100k entries
+    return os.path.join(thumb_dir, name[:2], f"{name}.webp")
+
+
+def make_thumbnail(filepath, thumb_path, size=THUMB_SIZE):
+    with Image.open(filepath) as image:
+        # JPEGs can decode straight at 1/2, 1/4, 1/8 scale, far cheaper than full size
+        image.draft("RGB", size)
+        image.thumbnail(size)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        # one temp file per writer, two sessions (or the contact sheet CLI) can
+        # make the same thumbnail at once
+        tmp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            image.save(tmp_path, format="WEBP", quality=THUMB_QUALITY, method=4)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, thumb_path)
+
+
+def get_thumbnail(filepath, size=THUMB_SIZE, thumb_dir=THUMB_DIR):
+    """Path of a cached thumbnail for filepath, made on first use."""
+    thumb_path = thumbnail_path(filepath, size, thumb_dir)
+    if not os.path.exists(thumb_path):
+        make_thumbnail(filepath, thumb_path, size)
+    return thumb_path
+
+
+def page_count(total, page_size):
+    return max(1, (total + page_size - 1) // page_size)
+
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# One pooled requests.Session for the whole process.  Every output fetch
+# (polling, image and video downloads) goes through here so connections to
+# the replicate delivery CDN get reused instead of paying TCP+TLS each time.
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+# connections kept per host, with pool_block the pool also caps how many
+# can be open to a single host at once
+MAX_CONNECTIONS_PER_HOST = 16
+MAX_HOSTS = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=MAX_HOSTS,
+                    pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+                    pool_block=True,
+                    max_retries=2,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return get_session().request(method, str(url), **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault("allow_redirects", True)
+    return request("HEAD", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 3
+
+
+class DownloadError(IOError):
+    pass
+
+
+def download_to_file(url, filepath, chunk_size=CHUNK_SIZE, retries=DOWNLOAD_RETRIES, timings=None):
+    """Stream url to filepath without holding the body in memory.
+
+    Data goes to filepath + ".part" and is only renamed into place once the
+    byte count matches Content-Length.  A dropped connection resumes with a
+    Range request.  Returns (bytes written, sha256 hex digest).  A timings
+    dict gets the time of the first byte and the byte count.
+
+    The body is asked for unencoded: Content-Length and Range count the bytes
+    on the wire, iter_content hands back decoded ones, the two only agree
+    without gzip.  A server that compresses anyway gets no size check and a
+    retry starts from the beginning.
+    """
+    part_path = filepath + ".part"
+    sha = hashlib.sha256()
+    written = 0
+    expected = None
+    attempt = 0
+    resumable = True
+
+    with open(part_path, "wb") as file:
+        while True:
+            headers = {"Accept-Encoding": "identity"}
+            if written and resumable:
+                headers["Range"] = f"bytes={written}-"
+            try:
+                with get(url, headers=headers, stream=True) as response:
+                    if response.headers.get("Content-Encoding", "identity").lower() not in ("", "identity"):
+                        resumable = False
+                        expected = None
+                    if written and (response.status_code == 200 or not resumable):
+                        # server ignored the range (or compressed, so offsets mean nothing), start over
+                        file.seek(0)
+                        file.truncate()
+                        sha = hashlib.sha256()
+                        written = 0
+                    if response.status_code not in (200, 206):
+                        raise DownloadError(f"Failed to download {url}. Status code: {response.status_code}")
+
+                    if expected is None and resumable:
+                        expected = _content_length(response, written)
+
+                    for chunk in response.iter_content(chunk_size):
+                        if timings is not None and "first_byte" not in timings:
+                            timings["first_byte"] = time.time()
+                        file.write(chunk)
+                        sha.update(chunk)
+                        written += len(chunk)
+
+                if expected is None or written >= expected:
+                    break
+                # connection closed early without an error, resume below
+                error = DownloadError(f"Truncated download of {url}: got {written} of {expected} bytes")
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+            except Exception:
+                file.close()
+                os.remove(part_path)
+                raise
+
+            attempt += 1
+            if attempt > retries:
+                file.close()
+                os.remove(part_path)
+                raise error
+            time.sleep(0.5 * attempt)
+
+    if expected is not None and written != expected:
+        os.remove(part_path)
+        raise DownloadError(f"Size mismatch downloading {url}: got {written} of {expected} bytes")
+
+    os.replace(part_path, filepath)
+    if timings is not None:
+        timings["bytes"] = written
+    return written, sha.hexdigest()
+
+
+def _content_length(response, offset):
+    # 206 responses carry the full size in Content-Range: bytes 100-999/1000
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return offset + int(length) if response.status_code == 206 else int(length)
+    return None
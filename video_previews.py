@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from funcs import OUTPUT_DIR
+from output_index import VIDEO_EXTENSIONS
+
+# Poster frames, duration / resolution and a small animated WebP for the
+# videos in output/, for wan22_test2.py's File Management grid.
+#
+# Everything is made on a background pool and cached under
+# output/.previews by (path, mtime, size), like thumbnails.py does for
+# images, so the page only ever reads a small JSON file and points the
+# browser at two small WebPs.  Duration and resolution come from the MP4
+# header (no decoding).  Frames need ffmpeg: found on PATH or via
+# FFMPEG_BINARY; without it the grid still shows the metadata, just no
+# pictures.
+
+PREVIEW_DIR = os.path.join(OUTPUT_DIR, ".previews")
+PREVIEW_SIZE = (320, 180)
+PREVIEW_FRAMES = 12
+PREVIEW_FPS = 4
+PREVIEW_QUALITY = 70
+MAX_WORKERS = 2
+FFMPEG_TIMEOUT = 120
+# a full rescan of output/ at most this often
+SCAN_INTERVAL = 60
+
+
+def ffmpeg_binary():
+    return os.environ.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+
+def preview_dir(filepath, preview_root=PREVIEW_DIR):
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}|{stat.st_mtime_ns}|{stat.st_size}"
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(preview_root, name[:2], name)
+
+
+def _boxes(file, start, end):
+    """(type, payload start, payload end) for the ISO-BMFF boxes between start and end."""
+    offset = start
+    while offset + 8 <= end:
+        file.seek(offset)
+        size, box_type = struct.unpack(">I4s", file.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", file.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type.decode("latin-1"), offset + header, min(offset + size, end)
+        offset += size
+
+
+def mp4_info(filepath):
+    """{"duration": seconds, "width": px, "height": px} from the moov box, None values if not found.
+
+    Only box headers and two small boxes are read, works for .mp4 and .mov.
+    """
+    info = {"duration": None, "width": None, "height": None}
+    with open(filepath, "rb") as file:
+        end = os.fstat(file.fileno()).st_size
+        moov = next(((s, e) for t, s, e in _boxes(file, 0, end) if t == "moov"), None)
+        if moov is None:
+            return info
+        for box_type, start, stop in _boxes(file, *moov):
+            if box_type == "mvhd":
+                file.seek(start)
+                version = file.read(1)[0]
+                file.seek(start + (20 if version == 1 else 12))
+                if version == 1:
+                    timescale, duration = struct.unpack(">IQ", file.read(12))
+                else:
+                    timescale, duration = struct.unpack(">II", file.read(8))
+                if timescale:
+                    info["duration"] = duration / timescale
+            elif box_type == "trak" and info["width"] is None:
+                for inner_type, inner_start, inner_stop in _boxes(file, start, stop):
+                    if inner_type == "tkhd":
+                        # width / height are the last 8 bytes, 16.16 fixed point
+                        file.seek(inner_stop - 8)
+                        width, height = struct.unpack(">II", file.read(8))
+                        if width and height:
+                            info["width"], info["height"] = width >> 16, height >> 16
+    return info
+
+
+def _preview_frames(filepath, duration, size=PREVIEW_SIZE, count=PREVIEW_FRAMES):
+    """count frames spread over the clip, letterboxed to size, as PIL images."""
+    import numpy as np
+
+    width, height = size
+    rate = count / duration if duration else PREVIEW_FPS
+    filters = (
+        f"fps={rate:.6f},scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+    )
+    result = subprocess.run(
+        [ffmpeg_binary(), "-v", "error", "-i", filepath, "-vf", filters, "-frames:v", str(count),
+         "-f", "rawvideo", "-pix_fmt", "rgb24", "-"],
+        capture_output=True, timeout=FFMPEG_TIMEOUT, check=True,
+    )
+    frame_bytes = width * height * 3
+    frames = np.frombuffer(result.stdout, dtype=np.uint8)[: len(result.stdout) // frame_bytes * frame_bytes]
+    return [Image.fromarray(frame) for frame in frames.reshape(-1, height, width, 3)]
+
+
+def make_preview(filepath, target_dir):
+    """Write meta.json (and poster.webp / preview.webp when ffmpeg is there) into target_dir."""
+    meta = {"path": filepath, "duration": None, "width": None, "height": None,
+            "poster": None, "preview": None, "error": None}
+    try:
+        if filepath.lower().endswith((".mp4", ".mov")):
+            meta.update(mp4_info(filepath))
+    except (OSError, struct.error, IndexError) as e:
+        meta["error"] = f"unreadable header: {e}"
+
+    os.makedirs(target_dir, exist_ok=True)
+    if ffmpeg_binary() and meta["error"] is None:
+        try:
+            frames = _preview_frames(filepath, meta["duration"])
+            if frames:
+                poster_path = os.path.join(target_dir, "poster.webp")
+                preview_path = os.path.join(target_dir, "preview.webp")
+                frames[len(frames) // 3].save(poster_path + ".tmp", format="WEBP", quality=80)
+                frames[0].save(preview_path + ".tmp", format="WEBP", save_all=True, append_images=frames[1:],
+                               duration=int(1000 / PREVIEW_FPS), loop=0, quality=PREVIEW_QUALITY)
+                os.replace(poster_path + ".tmp", poster_path)
+                os.replace(preview_path + ".tmp", preview_path)
+                meta["poster"], meta["preview"] = poster_path, preview_path
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            meta["error"] = f"ffmpeg: {e}"
+    meta["ffmpeg"] = bool(ffmpeg_binary())
+
+    meta_path = os.path.join(target_dir, "meta.json")
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta
+
+
+def read_preview(filepath, preview_root=PREVIEW_DIR):
+    """The cached meta dict for filepath, None if it hasn't been made (or is stale)."""
+    try:
+        meta_path = os.path.join(preview_dir(filepath, preview_root), "meta.json")
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # made before ffmpeg was installed, worth another go
+    if not meta.get("ffmpeg") and ffmpeg_binary():
+        return None
+    return meta
+
+
+class PreviewExtractor:
+    """Makes previews on a couple of background threads, one at a time per file."""
+
+    def __init__(self, preview_root=PREVIEW_DIR, max_workers=MAX_WORKERS):
+        self.preview_root = preview_root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="video-preview")
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._last_scan = {}
+        self._scanning = 0
+
+    def get(self, filepath):
+        """Cached meta for filepath, or None after queueing it."""
+        meta = read_preview(filepath, self.preview_root)
+        if meta is None:
+            self.submit(filepath)
+        return meta
+
+    def submit(self, filepath):
+        try:
+            target_dir = preview_dir(filepath, self.preview_root)
+        except OSError:
+            return
+        with self._lock:
+            if target_dir in self._pending:
+                return
+            self._pending.add(target_dir)
+        self._executor.submit(self._make, filepath, target_dir)
+
+    def _make(self, filepath, target_dir):
+        try:
+            if read_preview(filepath, self.preview_root) is None:
+                make_preview(filepath, target_dir)
+        except OSError:
+            # gone or unwritable, the next scan will try again
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(target_dir)
+
+    def pending(self):
+        """Files queued or being worked on (a scan in progress counts as one)."""
+        with self._lock:
+            return len(self._pending) + self._scanning
+
+    def scan(self, output_dir=OUTPUT_DIR):
+        """Queue every video in output_dir that has no preview yet (at most once per SCAN_INTERVAL)."""
+        with self._lock:
+            if time.time() - self._last_scan.get(output_dir, 0) < SCAN_INTERVAL:
+                return
+            self._last_scan[output_dir] = time.time()
+            self._scanning += 1
+        self._executor.submit(self._scan, output_dir)
+
+    def _scan(self, output_dir):
+        try:
+            for name in os.listdir(output_dir):
+                path = os.path.join(output_dir, name)
+                if name.lower().endswith(VIDEO_EXTENSIONS) and read_preview(path, self.preview_root) is None:
+                    self.submit(path)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._scanning -= 1
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_preview_extractor():
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = PreviewExtractor()
+    return _extractor
@@ -1,6 +1,6 @@
 import streamlit as st
 import replicate
-import requests
+import transport
 import os
 from PIL import Image
 import tempfile
@@ -164,7 +164,7 @@ if generate_button:
             with col2:
                 # Download button
                 try:
-                    video_data = output.read() if hasattr(output, 'read') else requests.get(video_url).content
+                    video_data = output.read() if hasattr(output, 'read') else transport.get(video_url).content
                     st.download_button(
                         label="⬇️ Download Video",
                         data=video_data,
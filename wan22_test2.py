@@ -1,13 +1,22 @@
 import streamlit as st
-import replicate
-import requests
 import os
 from PIL import Image
-import tempfile
 import time, datetime
+import uuid
 
-from dotenv import load_dotenv
-load_dotenv()
+from clients import get_client, resolve_model_ref
+from engine import VIDEO_MODEL, run_video_job
+from input_prep import describe_upload, submit_path, submit_upload
+from media_server import get_media_server, media_download_url, media_source
+from model_registry import get_model
+from navigation import clear_source_image, source_image
+from output_index import get_output_index
+from retention import current_user, pin_checkbox
+from startup import init_process
+from thumbnails import page_count
+from video_previews import get_preview_extractor
+
+init_process()
 
 
 # Configure the page
@@ -31,7 +40,11 @@ replicate_key = st.text_input("Replicate Key - If not provided, will try to use
 if replicate_key != None and replicate_key != "":
     os.environ["REPLICATE_API_TOKEN"] = replicate_key
 
-temp_path = None
+prep_future = None
+
+# identifies this browser session to the scheduler
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Create output directory if it doesn't exist
 OUTPUT_DIR = "output"
@@ -57,13 +70,19 @@ if 1 ==1:
         image = Image.open(uploaded_file)
         st.image(image, caption="Uploaded Image", use_column_width=True)
         
-        # Save uploaded file temporarily to get a URL (for local testing)
-        # In production, you'd want to upload to a cloud service
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_path = tmp_file.name
+        # Shrunk to the model's input size and staged under its content hash in the background
+        prep_future = submit_upload(uploaded_file, get_model("WAN 2.2 I2V Fast")["max_input_side"])
         
         st.success("✅ Image uploaded successfully!")
+        st.caption(describe_upload(prep_future))
+    elif source_image() and os.path.exists(source_image()):
+        # handed over from another page (navigation.py), no upload needed
+        st.image(source_image(), caption=f"From {os.path.basename(source_image())}", use_container_width=True)
+        prep_future = submit_path(source_image(), get_model("WAN 2.2 I2V Fast")["max_input_side"])
+        st.caption(describe_upload(prep_future))
+        if st.button("Use a different image"):
+            clear_source_image()
+            st.rerun()
 
 if 1 ==1:
     st.header("✍️ Video Prompt")
@@ -88,9 +107,21 @@ if 1 ==1:
         use_container_width=True
     )
 
+def show_generation_error(message):
+    st.error(f"❌ Error generating video: {message}")
+
+    # Show helpful error messages
+    if "authentication" in message.lower():
+        st.info("💡 Make sure your Replicate API token is valid and has sufficient credits.")
+    elif "rate limit" in message.lower():
+        st.info("💡 You may have hit rate limits. Please wait a moment and try again.")
+    elif "invalid input" in message.lower():
+        st.info("💡 Please check that your image URL is accessible and your prompt is appropriate.")
+
+
 # Generation section
 if generate_button:
-    if not temp_path:
+    if prep_future is None:
         st.error("❌ Please provide an image (upload or URL).")
     elif not prompt.strip():
         st.error("❌ Please provide a video prompt.")
@@ -103,111 +134,78 @@ if generate_button:
             with status_placeholder.container():
                 st.info("🚀 Starting video generation...")
             
-            # Keep file open during the entire operation
-            with open(temp_path, "rb") as image_file:
-                # Prepare input for Replicate
-                replicate_input = {
-                    "image": image_file,
-                    "prompt": prompt,
-                    "disable_safety_checker": True
-                }
-                
-                # Show input details (create display version)
-                display_input = {
-                    "image": f"File: {temp_path}",
-                    "prompt": prompt,
-                    "disable_safety_checker": True
-                }
-                with st.expander("📋 Generation Details", expanded=True):
-                    st.json(display_input)
-                
-                # Show generation status
-                with status_placeholder.container():
-                    st.info("⏳ Generating video... This may take a few minutes.")
-                
-                progress_bar = progress_placeholder.progress(0)
-                
-                client = None
-                if replicate_key is None:
-                    client = replicate.Client()
-                else:
-                    client = replicate.Client(api_token=replicate_key)
-                
-                # Start prediction - file stays open during this call
-                output = client.run(
-                    "wan-video/wan-2.2-i2v-fast",
-                    input=replicate_input,
-                )
+            client = get_client(replicate_key or None)
+            temp_path = prep_future.result()[0]
+            st.caption(describe_upload(prep_future))
+
+            # Show input details (create display version)
+            display_input = {
+                "image": f"File: {temp_path}",
+                "prompt": prompt,
+                "disable_safety_checker": True
+            }
+            with st.expander("📋 Generation Details", expanded=True):
+                st.json(display_input)
+            
+            # Show generation status
+            with status_placeholder.container():
+                st.info("⏳ Generating video... This may take a few minutes.")
+            
+            progress_bar = progress_placeholder.progress(0)
+            
+            # Upload (once per image), predict waiting our turn behind other sessions / rate
+            # limits (scheduler.py), stream the video to output/ - engine.py, shared with benchmark.py
+            model_ref = resolve_model_ref(VIDEO_MODEL, replicate_key or None)
+            result = run_video_job(client, model_ref, temp_path, prompt, OUTPUT_DIR,
+                                   session=st.session_state.session_id, user=current_user())
             
-            # File is automatically closed here
             progress_bar.progress(100)
             
             # Clear status messages
             progress_placeholder.empty()
             status_placeholder.empty()
-            
-            # Display results
-            st.success("✅ Video generated successfully!")
-            
-            # Get video URL - Fixed handling
-            if isinstance(output, str):
-                # Output is already a URL string
-                video_url = output
-            elif hasattr(output, 'url') and callable(getattr(output, 'url')):
-                # Output has a callable url method
-                video_url = output.url()
-            elif hasattr(output, 'url'):
-                # Output has url as a property, not a method
-                video_url = output.url
+
+            if result["error"]:
+                show_generation_error(result["error"])
             else:
-                # Fallback - convert to string
-                video_url = str(output)
+                filepath = result["filepath"]
+                get_preview_extractor().submit(filepath)
 
-            # Optional debug (remove these lines once working):
-            # st.write(f"Debug - Output type: {type(output)}")
-            # st.write(f"Debug - Video URL: {video_url}")
-            
-            # Display video
-            st.header("🎥 Generated Video")
-            st.video(video_url)
-            
-            # Download section
-            col1, col2 = st.columns([1, 1])
-            
-            with col1:
-                st.markdown(f"**Video URL:** [Open in new tab]({video_url})")
-            
-            with col2:
-                # Download button - Fixed handling
-                try:
-                    if hasattr(output, 'read') and callable(getattr(output, 'read')):
-                        video_data = output.read()
+                # Display results
+                st.success("✅ Video generated successfully!")
+
+                # Display video, played and downloaded straight from the saved file
+                # (media_server.py when MEDIA_SERVER_URL is set, streamlit's own media route otherwise)
+                st.header("🎥 Generated Video")
+                st.video(media_source(filepath))
+                st.success(f"💾 Saved as: {filepath}")
+                
+                # Download section
+                col1, col2 = st.columns([1, 1])
+                
+                with col1:
+                    st.markdown(f"**Video URL:** [Open in new tab]({result['video_url']})")
+                
+                with col2:
+                    download_url = media_download_url(filepath)
+                    if download_url:
+                        st.link_button(
+                            "⬇️ Download Video",
+                            download_url,
+                            use_container_width=True
+                        )
                     else:
-                        # Download from URL
-                        response = requests.get(video_url)
-                        response.raise_for_status()
-                        video_data = response.content
-                    
-                    st.download_button(
-                        label="⬇️ Download Video",
-                        data=video_data,
-                        file_name="generated_video.mp4",
-                        mime="video/mp4"
-                    )
-                except Exception as e:
-                    st.warning(f"Download unavailable: {str(e)}")
-                    st.markdown(f"You can download directly from: {video_url}")
+                        # MEDIA_IN_MEMORY=1, the file goes through memory
+                        with open(filepath, "rb") as video_file:
+                            st.download_button(
+                                label="⬇️ Download Video",
+                                data=video_file,
+                                file_name=os.path.basename(filepath),
+                                mime="video/mp4"
+                            )
                     
         except Exception as e:
-            st.error(f"❌ Error generating video: {str(e)}")
-            
-            # Show helpful error messages
-            if "authentication" in str(e).lower():
-                st.info("💡 Make sure your Replicate API token is valid and has sufficient credits.")
-            elif "rate limit" in str(e).lower():
-                st.info("💡 You may have hit rate limits. Please wait a moment and try again.")
-            elif "invalid input" in str(e).lower():
-                st.info("💡 Please check that your image URL is accessible and your prompt is appropriate.")
+            show_generation_error(str(e))
 
 # Footer with information
 st.markdown("---")
@@ -222,13 +220,6 @@ with col2:
 with col3:
     st.markdown("**API Docs:** [replicate.com](https://replicate.com)")
 
-# Cleanup temporary files
-if uploaded_file and 'tmp_file' in locals():
-    try:
-        os.unlink(tmp_file.name)
-    except:
-        pass
-
 # Usage instructions
 with st.expander("📖 How to Use"):
     st.markdown("""
@@ -253,26 +244,81 @@ with st.expander("📖 How to Use"):
 
 
 OUTPUT_DIR = 'output'
+VIDEO_PAGE_SIZE = 9
+PREVIEW_POLL_SECONDS = 2
+
+
+def video_grid():
+    output_index = get_output_index(OUTPUT_DIR)
+    total_videos = output_index.count("video")
+    if not total_videos:
+        st.info("No videos generated yet.")
+        return
+
+    extractor = get_preview_extractor()
+    media_server = get_media_server()
+    playing = st.session_state.get("playing_video")
+
+    st.markdown(f"**Generated Videos in `{OUTPUT_DIR}/`:** ({total_videos})")
+    pages = page_count(total_videos, VIDEO_PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key="video_page")
+
+    cols = st.columns(3)
+    rows = output_index.recent("video", limit=VIDEO_PAGE_SIZE, offset=(page - 1) * VIDEO_PAGE_SIZE)
+    # seen counts as used, retention.py deletes the least recently seen first
+    output_index.touch([row["path"] for row in rows])
+    for i, row in enumerate(rows):
+        with cols[i % 3]:
+            if not os.path.exists(row["path"]):
+                st.caption(f"📹 {row['filename']} (missing)")
+                continue
+            meta = extractor.get(row["path"])
+            if meta and (meta["preview"] or meta["poster"]):
+                # the animated preview, served from disk like the videos themselves
+                st.image(media_source(meta["preview"] or meta["poster"]), use_container_width=True)
+            elif meta is None:
+                st.caption("⏳ Making preview...")
+
+            details = [f"{(row['bytes'] or 0) / (1024*1024):.1f} MB"]
+            if meta and meta["duration"]:
+                details.insert(0, f"{meta['duration']:.1f}s")
+            if meta and meta["width"]:
+                details.insert(1, f"{meta['width']}x{meta['height']}")
+            file_time = datetime.datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M:%S")
+            if media_server:
+                st.markdown(f"📹 [{row['filename']}]({media_server.url_for(row['path'])})")
+            elif playing == row["path"]:
+                # one player at a time, each one is another stream off the disk
+                # (the whole file in memory with MEDIA_IN_MEMORY=1)
+                st.video(row["path"])
+            else:
+                st.markdown(f"📹 {row['filename']}")
+                if st.button("▶️ Play", key=f"play_{row['id']}"):
+                    st.session_state.playing_video = row["path"]
+                    st.rerun()
+            st.caption(f"{' · '.join(details)} · {file_time}")
+            if row["prompt"]:
+                st.caption(row["prompt"][:120])
+            pin_checkbox(row, OUTPUT_DIR)
+
+    if extractor.pending():
+        st.caption(f"⏳ {extractor.pending()} previews still being made")
+        st.session_state.previews_were_pending = True
+    elif st.session_state.get("previews_were_pending"):
+        # all done, one full rerun so the fragment stops polling
+        st.session_state.previews_were_pending = False
+        st.rerun()
+
+
 # File management section
 with st.expander("📁 File Management"):
     if os.path.exists(OUTPUT_DIR):
-        output_files = [f for f in os.listdir(OUTPUT_DIR) if f.endswith('.mp4')]
-        if output_files:
-            st.markdown(f"**Generated Videos in `{OUTPUT_DIR}/`:**")
-            for file in sorted(output_files, reverse=True):  # Most recent first
-                filepath = os.path.join(OUTPUT_DIR, file)
-                file_size = os.path.getsize(filepath) / (1024*1024)
-                file_time = datetime.datetime.fromtimestamp(os.path.getctime(filepath)).strftime("%Y-%m-%d %H:%M:%S")
-                
-                col1, col2, col3 = st.columns([2, 1, 1])
-                with col1:
-                    st.text(f"📹 {file}")
-                with col2:
-                    st.text(f"{file_size:.1f} MB")
-                with col3:
-                    st.text(file_time)
-        else:
-            st.info("No videos generated yet.")
+        # posters / previews for anything new get made in the background (video_previews.py)
+        get_preview_extractor().scan(OUTPUT_DIR)
+        # reruns on its own while previews are being made, so they show up as they finish
+        st.fragment(run_every=PREVIEW_POLL_SECONDS if get_preview_extractor().pending() else None)(video_grid)()
     else:
         st.info("Output directory will be created when first video is generated.")
 
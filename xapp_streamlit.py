@@ -1,6 +1,6 @@
 import streamlit as st
 import replicate
-import requests
+import transport
 import time
 import os
 import re
@@ -51,14 +51,14 @@ try:
 
     def wait_for_image(url, max_attempts=10, delay=2):
         for attempt in range(max_attempts):
-            response = requests.head(url)
+            response = transport.head(url)
             if response.status_code == 200:
                 return True
             time.sleep(delay)
         return False
 
     def display_image(url):
-        response = requests.get(url)
+        response = transport.get(url)
         if response.status_code == 200:
             image = Image.open(BytesIO(response.content))
             st.image(image, caption="Generated Image")